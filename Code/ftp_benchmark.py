@@ -0,0 +1,127 @@
+import os
+import shutil
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import ftp_server
+from tcpip_socket import TCPIPSocket
+from rudp_socket import RUDPSocket
+
+
+# one of every this number of directory entries the benchmark creates is a directory, the others are empty files
+DIRECTORY_EVERY_ENTRIES = 10
+
+# the seconds the benchmark waits for a reply, a LIST of a big directory sent line by line can take minutes
+REPLY_TIMEOUT = 600
+
+
+# ------------------------------------------------------------------------------ #
+# returns a port nobody listens on right now, for the server and data sockets    #
+# ------------------------------------------------------------------------------ #
+def getFreePort(socketType):
+    freeSocket = socket.socket(socket.AF_INET, socketType)
+    freeSocket.bind(('127.0.0.1', 0))
+    freePort = freeSocket.getsockname()[1]
+    freeSocket.close()
+    return freePort
+
+
+# ------------------------------------------------------------------------------ #
+# a command connection to the benchmark server, sends a command and reads the    #
+# replies until the one that starts with expectedReply                           #
+# ------------------------------------------------------------------------------ #
+def sendCommand(commandSocket, command, expectedReply):
+    if command:
+        commandSocket.send(command.encode('utf-8'))
+    receivedReplies = b''
+    while expectedReply.encode('utf-8') not in receivedReplies:
+        receivedData = commandSocket.receive(4096)
+        if not receivedData:
+            raise ConnectionError(f"the server closed the connection, replies: {receivedReplies}")
+        receivedReplies = receivedReplies + receivedData
+    return receivedReplies
+
+
+# ------------------------------------------------------------------------------ #
+# measures LIST of a big directory: creates a directory of numberOfEntries       #
+# entries, starts the server in this process and lists the directory with        #
+# PORT + LIST, prints the median time and the size of the listing:               #
+# python ftp_benchmark.py [entries] [tcpip|rudp] [runs]                          #
+# ------------------------------------------------------------------------------ #
+def runListBenchmark(numberOfEntries, isTCPIP, numberOfRuns):
+    listedDirectory = tempfile.mkdtemp()
+    for entryNumber in range(numberOfEntries):
+        entryPath = os.path.join(listedDirectory, f"entry{entryNumber:07d}")
+        if entryNumber % DIRECTORY_EVERY_ENTRIES == 0:
+            os.mkdir(entryPath)
+        else:
+            open(entryPath, 'wb').close()
+
+    socketType = socket.SOCK_STREAM if isTCPIP else socket.SOCK_DGRAM
+    ftp_server.isTCPIP = isTCPIP
+    ftp_server.SERVER_HOST = '127.0.0.1'
+    ftp_server.SERVER_PORT = getFreePort(socketType)
+    threading.Thread(target=ftp_server.serverListener, daemon=True).start()
+    while not ftp_server.isListening:
+        time.sleep(0.05)
+
+    commandSocket = TCPIPSocket() if isTCPIP else RUDPSocket()
+    commandSocket.connect((ftp_server.SERVER_HOST, ftp_server.SERVER_PORT))
+    commandSocket.setTimeout(REPLY_TIMEOUT)
+    sendCommand(commandSocket, None, '220')
+    sendCommand(commandSocket, f"USER {ftp_server.DEFAULT_USER}", '331')
+    sendCommand(commandSocket, f"PASS {ftp_server.DEFAULT_PASSWORD}", '230')
+
+    listTimes = []
+    # the listing of every run, they are compared with each other at the end
+    listings = []
+    for runNumber in range(numberOfRuns):
+        dataPort = getFreePort(socketType)
+        listeningSocket = TCPIPSocket() if isTCPIP else RUDPSocket()
+        listeningSocket.listen(('127.0.0.1', dataPort))
+        sendCommand(commandSocket, f"PORT 127,0,0,1,{dataPort >> 8},{dataPort & 255}", '200')
+
+        # the listing is received in a thread while this thread waits for the 226 reply
+        def receiveListing():
+            dataSocket = listeningSocket.accept()
+            listingChunks = []
+            while True:
+                receivedData = dataSocket.receive(1024 * 1024)
+                if not receivedData:
+                    break
+                listingChunks.append(receivedData)
+            dataSocket.close()
+            listings.append(b''.join(listingChunks))
+        receiverThread = threading.Thread(target=receiveListing)
+        receiverThread.start()
+
+        startTime = time.perf_counter()
+        sendCommand(commandSocket, f"LIST {listedDirectory}", '226')
+        receiverThread.join()
+        listTimes.append(time.perf_counter() - startTime)
+        listeningSocket.close()
+
+    sendCommand(commandSocket, 'QUIT', '221')
+    commandSocket.close()
+    shutil.rmtree(listedDirectory)
+    listing = listings[0]
+    numberOfLines = listing.count(b'\r\n')
+    # a listing cut short (a receive timeout ends receiveListing like the end of the data) has fewer lines than the others
+    linesPerRun = [runListing.count(b'\r\n') for runListing in listings]
+    if len(listings) != numberOfRuns or any(runListing != listing for runListing in listings):
+        print(f"LIST of {numberOfEntries} entries: the runs returned DIFFERENT listings, lines per run: {linesPerRun}")
+    print(f"LIST of {numberOfEntries} entries over {'TCPIP' if isTCPIP else 'RUDP'}: {numberOfLines} lines, "
+          f"{len(listing)} bytes, median {statistics.median(listTimes) * 1000:.0f} ms over {numberOfRuns} runs")
+
+
+if __name__ == "__main__":
+    runListBenchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100000,
+                     (sys.argv[2] if len(sys.argv) > 2 else 'tcpip').lower() != 'rudp',
+                     int(sys.argv[3]) if len(sys.argv) > 3 else 3)
+    # the RUDP reader threads notice the closed udp sockets only after SOCKET_MAX_TIMEOUT, the benchmark is done so
+    # end the process now instead of waiting for them
+    sys.stdout.flush()
+    os._exit(0)
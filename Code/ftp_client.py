@@ -6,6 +6,7 @@ import os
 import time
 from tcpip_socket import TCPIPSocket
 from rudp_socket import RUDPSocket
+from rudp_striped import StripedRUDPSocket
 
 try:
     SERVER_HOST = socket.gethostbyname(socket.gethostname())
@@ -30,6 +31,13 @@ clientSocket = None
 
 isTCPIP = True
 
+# if this flag is True then the RUDP sockets offer the server to compress the commands, listings and files (zlib,
+# only if the server offers it too), turn it on for slow (WAN) links only
+isRUDPCompression = False
+
+# the number of RUDP sub-flows (stripes) the data connections are split over (must match the server setting)
+rudpDataStripes = 1
+
 
 def sendCommandToServer(commandWithArguments):
     global clientSocket
@@ -51,8 +59,10 @@ def receiveFromServer():
 
     if isTCPIP:
         listenerSocket = TCPIPSocket()
+    elif rudpDataStripes > 1:
+        listenerSocket = StripedRUDPSocket(rudpDataStripes, useCompression=isRUDPCompression)
     else:
-        listenerSocket = RUDPSocket()
+        listenerSocket = RUDPSocket(useCompression=isRUDPCompression)
     listenerSocket.listen((ftpServerIP, RETURN_PORT))
     newSocket = listenerSocket.accept()
 
@@ -90,7 +100,7 @@ if __name__ == "__main__":
                 if isTCPIP:
                     clientSocket = TCPIPSocket()
                 else:
-                    clientSocket = RUDPSocket()
+                    clientSocket = RUDPSocket(useCompression=isRUDPCompression)
                 clientSocket.connect((ftpServerIP, ftpServerPort))
                 welcomeMessage = clientSocket.receive(MTU)
                 if welcomeMessage:
@@ -1,15 +1,21 @@
 #!/usr/bin/env python
 
+import asyncio
 import socket
 import threading
 import os
 import sys
 import time
 import shutil
-from tcpip_socket import TCPIPSocket
+import queue
+import rudp_asyncio
+from concurrent.futures import ThreadPoolExecutor
+from tcpip_socket import TCPIPSocket, AsyncTCPIPSocket
 from rudp_socket import RUDPSocket
+from rudp_striped import StripedRUDPSocket
 from ftp_exceptions import UserNotAuthenticatedException
-from utils import fileProperty, generateUniqueThreadName, log, logCommand, getPortFromPool, returnPortToPool, getFTPPath
+from utils import fileProperty, generateUniqueThreadName, log, logCommand, getPortFromPool, returnPortToPool, getFTPPath, \
+    NewlineTranslator, directoryProperties
 
 
 # server host ip that is used to bind when listening to incoming connection
@@ -36,6 +42,51 @@ allow_delete = True
 # if this flag is True then FTP server uses TCPIP protocol, if this flag is False, then it uses RUDP
 isTCPIP = True
 
+# if this flag is True then the RUDP sockets offer the client to compress the commands, listings and files (zlib,
+# only if the client offers it too), it saves bandwidth on slow (WAN) links for some CPU, so it is off by default
+isRUDPCompression = False
+
+# if this flag is True then the statistics of every RUDP data connection (retransmissions, RTT, windows) are logged
+# once it is closed, to help tune slow links, it is off by default because every transfer logs a full dictionary
+isRUDPStatsLog = False
+
+# the number of RUDP sub-flows (stripes) a data connection is split over, with more than one stripe a big file is
+# sent on several udp ports and processes at once (the client must use the same number)
+rudpDataStripes = 1
+
+# if this flag is True then the server serves all the clients from one asyncio event loop (an idle client costs a
+# coroutine and not a thread), the commands still run as blocking functions in two thread pools: one for the
+# ASYNC_TRANSFER_COMMANDS and one for all the other commands
+isAsyncServer = False
+
+# the number of threads that run the short commands (replies, directory and file changes) of the asyncio server
+# clients, they never wait for a transfer so the clients get their replies while all the transfer threads are busy
+ASYNC_SERVER_COMMAND_WORKERS = 16
+
+# the number of threads that run the commands with a data transfer of the asyncio server clients, it is the number
+# of transfers at once (the next transfer commands wait for a free thread)
+ASYNC_SERVER_TRANSFER_WORKERS = 64
+
+# the commands that open a data connection, the asyncio server runs them in the transfer threads
+ASYNC_TRANSFER_COMMANDS = {'RETR', 'STOR', 'APPE', 'LIST', 'NLST'}
+
+# the number of connections the asyncio server keeps waiting in the kernel before it accepts them
+ASYNC_SERVER_BACKLOG = 1024
+
+# the asyncio server checks every this number of seconds if the server admin asked to shut down
+SHUTDOWN_CHECK_INTERVAL = 1.0
+
+# the message a client gets once it connects to the server
+WELCOME_MESSAGE = '220 Welcome.\r\n'
+
+# the size of the buffer a session reads a binary file into before it sends it on an RUDP data socket (one RUDP
+# message per buffer, so big buffers mean few messages and few python iterations)
+FILE_BUFFER_SIZE = 1024 * 1024 # 1 MB
+
+# an upload is forced to the disk (fsync) every time this number of bytes was written, and once at its end, so a
+# multi-GB upload doesn't pile up in the page cache and the 226 reply means the file is on the disk
+STORE_SYNC_LENGTH = 64 * 1024 * 1024 # 64 MB
+
 # flag that indicates if the server is working, or shutting down
 isListening = False
 
@@ -49,7 +100,12 @@ mainServerSocket = None
 allConnectedClients = {}
 
 
-class FtpServerProtocol(threading.Thread):
+# ------------------------------------------------------------------------------- #
+# the state and the command handlers of a single client session, the handlers are #
+# blocking, FtpServerProtocol runs them in a thread of its own and AsyncFtpSession #
+# runs them in the executors of the asyncio server                                 #
+# ------------------------------------------------------------------------------- #
+class FtpSession:
     cwd = "/"
     threadName = "Th"
     dataSocketIP = "127.0.0.1"
@@ -67,10 +123,17 @@ class FtpServerProtocol(threading.Thread):
     passwd = None
     dataSocket = None
     passiveSocket = None
+    # the buffer binary files are read into before they are sent (created by the first download of the session)
+    fileBuffer = None
+    # the two buffers uploads are received into, one is written to the disk while the other one is received into
+    # (created by the first upload of the session)
+    storeBuffers = None
+    # the file size the client announced with ALLO for the next upload (0 if it didn't announce one)
+    allocationSize = 0
 
-    # ----------------------------------- #
-    # init the thread and set all members #
-    # ----------------------------------- #
+    # ------------------------------------ #
+    # init the session and set all members #
+    # ------------------------------------ #
     def __init__(self, newCommandSocket, newThreadName):
         global allThreads
 
@@ -86,61 +149,35 @@ class FtpServerProtocol(threading.Thread):
         # add this thread name to the allThreads dictionary, so the server will know this thread is working
         allThreads[self.threadName] = "Working"
 
-        # init the thread super
-        threading.Thread.__init__(self)
-
-
-    def run(self):
-        global isListening
 
-        # when a client connects - send it a welcome message
-        self.sendWelcome()
-
-        while True:
-            # if the server admin pressed q+Enter then close connection to the client and quit this thread
-            # so the server can shut down properly
-            if not isListening:
-                self.QUIT('')
-                break
+    # ---------------------------------------------------------------------------- #
+    # parses a command the client sent (bytes) and runs the function that has the #
+    # same name as the command with its arguments, returns the command name       #
+    # ---------------------------------------------------------------------------- #
+    def handleCommand(self, data):
+        # decode the received data as byte array and convert it (decode) into string using UTF8
+        try:
+            cmd = data.decode('utf-8')
+            log("Data from client: " + cmd)
+        except AttributeError:
+            cmd = data
 
-            try:
-                self.commandSocket.setTimeout(5.0)
-                data = self.commandSocket.receive(1024).rstrip()
-                if (data is not None) and (len(data) > 0):
-                    # decode the received data as byte array and convert it (decode) into string using UTF8
-                    try:
-                        cmd = data.decode('utf-8')
-                        log("Data from client: " + cmd)
-                    except AttributeError:
-                        cmd = data
+        try:
+            # parse command and arguments from the data that we received from the client
+            cmd, arg = cmd[0:4].strip().upper(), cmd[4:].strip() or ''
 
-                    try:
-                        # parse command and arguments from the data that we received from the client
-                        cmd, arg = cmd[0:4].strip().upper(), cmd[4:].strip() or ''
-
-                        # try to find a function that has the same name as the received command
-                        func = getattr(self, cmd)
-
-                        # execute the function with the received arguments
-                        func(arg)
-                    except AttributeError as err:
-                        self.sendCommand('500 Syntax error, command unrecognized.\r\n')
-                        logCommand('Receive', err)
-                    except Exception as err:
-                        logCommand("Error, unknown command from client: ", err)
-                        self.sendCommand('500 could not interpret your command, please try again.\r\n')
-                    if not cmd:
-                        break
-            except socket.error as err:
-                if err.__class__.__name__ != 'TimeoutError':
-                    if 'forcibly closed' not in str(err):
-                        logCommand('General Error while receiving data from client', err)
-                    else:
-                        break
+            # try to find a function that has the same name as the received command
+            func = getattr(self, cmd)
 
-        # once this thread run function has finished (got out of the while loop)
-        # then log that the client has disconnected
-        log("Client: " + str(self.clientAddress) + " disconnected")
+            # execute the function with the received arguments
+            func(arg)
+        except AttributeError as err:
+            self.sendCommand('500 Syntax error, command unrecognized.\r\n')
+            logCommand('Receive', err)
+        except Exception as err:
+            logCommand("Error, unknown command from client: ", err)
+            self.sendCommand('500 could not interpret your command, please try again.\r\n')
+        return cmd
 
 
     # ---------------------------------------------- #
@@ -166,8 +203,10 @@ class FtpServerProtocol(threading.Thread):
 
     # ------------------------------------------------------------------------------ #
     # this function opens a socket to the cient on the IP and port he has configured #
+    # and sends the optional firstData on it, in active mode RUDP carries it in the  #
+    # connection request (SYN) so a small transfer doesn't wait for the handshake    #
     # ------------------------------------------------------------------------------ #
-    def openSocket(self):
+    def openSocket(self, firstData=None):
         log('openSocket()')
         # check if user is authenticated
         self.isUserAuthenticated()
@@ -181,15 +220,19 @@ class FtpServerProtocol(threading.Thread):
             self.dataSocketIP = self.dataSocket.receiverAddress[0]
             self.dataSocketPort = self.dataSocket.receiverAddress[1]
             log(f"openSocket(): dataSocketIP: {self.dataSocketIP} dataSocketPort: {self.dataSocketPort}")
+            if firstData:
+                self.sendData(firstData)
         else:
             # create an outgoing connection socket
             if isTCPIP:
                 self.dataSocket = TCPIPSocket()
+            elif rudpDataStripes > 1:
+                self.dataSocket = StripedRUDPSocket(rudpDataStripes, useCompression=isRUDPCompression)
             else:
-                self.dataSocket = RUDPSocket()
+                self.dataSocket = RUDPSocket(useCompression=isRUDPCompression)
             # connect to the client IP and port using the created socket
             dataSocketAddress = (self.dataSocketIP, self.dataSocketPort)
-            self.dataSocket.connect(dataSocketAddress)
+            self.dataSocket.connect(dataSocketAddress, firstData or None)
             log("openSocket(): connected to client in active mode")
             log(f"dataSocket IP: {self.dataSocketIP} Port: {self.dataSocketPort}")
             log(f"openSocket(): dataSocketIP: {self.dataSocketIP} dataSocketPort: {self.dataSocketPort}")
@@ -204,6 +247,12 @@ class FtpServerProtocol(threading.Thread):
             # if there is an open data socket then close it
             if self.dataSocket is not None:
                 self.dataSocket.close()
+                if isRUDPStatsLog and not isTCPIP:
+                    # log the RUDP statistics of the transfer (retransmissions, RTT, windows) to help tune slow links,
+                    # after close() so they include the flush of the last window
+                    log(f"closeSocket(): data connection statistics: {self.dataSocket.getStats()}")
+                # the data connection is done, a later closeSocket() (QUIT) must not close or log it again
+                self.dataSocket = None
 
             # if there is an open server socket then close it
             if self.passiveSocket is not None:
@@ -232,6 +281,112 @@ class FtpServerProtocol(threading.Thread):
         self.dataSocket.send(data)
 
 
+    # ------------------------------------------------------------------------------ #
+    # this function sends the rest of a file (from its current position) to the     #
+    # client, in binary mode on TCPIP the kernel copies the file to the socket      #
+    # (sendfile), on RUDP the file is read in FILE_BUFFER_SIZE chunks into one       #
+    # reused buffer, in ascii mode the newlines of every chunk are converted to CRLF #
+    # ------------------------------------------------------------------------------ #
+    def sendFileData(self, file):
+        if self.mode != 'I':
+            newlineTranslator = NewlineTranslator(True)
+            while True:
+                data = file.read(FILE_BUFFER_SIZE)
+                if not data:
+                    break
+                self.sendData(newlineTranslator.translate(data))
+            return
+
+        if isTCPIP:
+            self.dataSocket.sendFile(file, file.tell())
+            return
+
+        if self.fileBuffer is None:
+            self.fileBuffer = bytearray(FILE_BUFFER_SIZE)
+        fileBufferView = memoryview(self.fileBuffer)
+        while True:
+            bytesRead = file.readinto(self.fileBuffer)
+            if not bytesRead:
+                break
+            # the data socket copies the data into its packets, so the buffer can be reused right away
+            self.sendData(fileBufferView[:bytesRead])
+
+
+    # ------------------------------------------------------------------------------ #
+    # this function receives an upload from the data socket into the file until the  #
+    # client closes the data socket, the data is received in FILE_BUFFER_SIZE chunks  #
+    # into two buffers that are reused: while a writer thread writes one buffer to   #
+    # the disk the other one is received into, so the network and the disk overlap,  #
+    # in ascii mode the writer converts the newlines of every buffer it writes       #
+    # ------------------------------------------------------------------------------ #
+    def receiveFileData(self, file):
+        if self.storeBuffers is None:
+            self.storeBuffers = [bytearray(FILE_BUFFER_SIZE), bytearray(FILE_BUFFER_SIZE)]
+        freeBuffers = queue.Queue()
+        for storeBuffer in self.storeBuffers:
+            freeBuffers.put(storeBuffer)
+        fullBuffers = queue.Queue()
+        writerErrors = []
+        newlineTranslator = NewlineTranslator(False) if self.mode != 'I' else None
+
+        # the writer thread, writes the full buffers to the file and returns them to the free buffers
+        def writeBuffers():
+            unsyncedLength = 0
+            while True:
+                fullBuffer = fullBuffers.get()
+                if fullBuffer is None:
+                    break
+                storeBuffer, bufferLength = fullBuffer
+                try:
+                    if not writerErrors:
+                        data = memoryview(storeBuffer)[:bufferLength]
+                        if newlineTranslator is not None:
+                            data = newlineTranslator.translate(data)
+                        file.write(data)
+                        unsyncedLength = unsyncedLength + bufferLength
+                        if unsyncedLength >= STORE_SYNC_LENGTH:
+                            file.flush()
+                            os.fsync(file.fileno())
+                            unsyncedLength = 0
+                except OSError as err:
+                    # keep returning the buffers so the receiving side doesn't wait forever, it raises the error
+                    writerErrors.append(err)
+                freeBuffers.put(storeBuffer)
+
+        writerThread = threading.Thread(target=writeBuffers)
+        writerThread.start()
+        try:
+            isEndOfData = False
+            while not isEndOfData:
+                # fill a whole buffer from the socket (less than that only at the end of the data)
+                storeBuffer = freeBuffers.get()
+                storeBufferView = memoryview(storeBuffer)
+                bufferLength = 0
+                while bufferLength < len(storeBuffer):
+                    receivedLength = self.dataSocket.receiveInto(storeBufferView[bufferLength:])
+                    if not receivedLength:
+                        isEndOfData = True
+                        break
+                    bufferLength = bufferLength + receivedLength
+                if bufferLength > 0:
+                    fullBuffers.put((storeBuffer, bufferLength))
+                if writerErrors:
+                    break
+        finally:
+            fullBuffers.put(None)
+            writerThread.join()
+        if writerErrors:
+            raise writerErrors[0]
+        if newlineTranslator is not None:
+            file.write(newlineTranslator.finish())
+
+        # an ALLO allocation may be bigger than the data that arrived, and the file must end where the data ended
+        # (before the fsync, so the final size is on the disk too)
+        file.truncate()
+        file.flush()
+        os.fsync(file.fileno())
+
+
     # ------------------------------------------- #
     #  this function handles the OPTS ftp command #
     # ------------------------------------------- #
@@ -381,15 +536,10 @@ class FtpServerProtocol(threading.Thread):
                     self.sendData(fileMessageByteArray)
 
                 else:
-                    # if this is a directory (not a file) then loop through the directory
-                    # files and folders and write their properties to the previously opened socket
-                    for file in os.listdir(pathname):
-                        # get file/folder properties (change date / size / owner...)
-                        fileMessage = fileProperty(os.path.join(pathname, file))
-                        # send data to client on data socket as byte array
-                        # (inside the function it will decide if to send text or binary byte array)
-                        fileMessageByteArray = bytes(fileMessage + '\r\n', encoding="utf-8")
-                        self.sendData(fileMessageByteArray)
+                    # if this is a directory (not a file) then send the properties of all its files and folders
+                    # to the previously opened socket, many lines in every send
+                    for fileMessagesBlock in directoryProperties(pathname, FILE_BUFFER_SIZE):
+                        self.sendData(fileMessagesBlock)
 
                 # at the end close the previously opened socket
                 self.closeSocket()
@@ -510,8 +660,10 @@ class FtpServerProtocol(threading.Thread):
             # create a new server socket based on the selected protocol
             if isTCPIP:
                 self.passiveSocket = TCPIPSocket()
+            elif rudpDataStripes > 1:
+                self.passiveSocket = StripedRUDPSocket(rudpDataStripes, useCompression=isRUDPCompression)
             else:
-                self.passiveSocket = RUDPSocket()
+                self.passiveSocket = RUDPSocket(useCompression=isRUDPCompression)
 
             # bind server socket to the server IP and unique port number (so each client can have a unique port number)
             self.passivePort = getPortFromPool()
@@ -773,52 +925,24 @@ class FtpServerProtocol(threading.Thread):
                     self.sendCommand('500 Operation Failed, The filename does not exist.\r\n')
 
                 else:
-                    # if we are working in binary mode then open the file to Read in binary mode
-                    if self.mode == 'I':
-                        file = open(fileToDownload, 'rb')
-                    else:
-                        # if we are working in ascii mode then open the file to Read in ascii mode
-                        file = open(fileToDownload, 'r')
+                    # open the file to Read in binary mode, in ascii mode the newlines are converted block by block
+                    file = open(fileToDownload, 'rb')
 
                     # send message to client to tell it that we are working on his request
                     self.sendCommand('150 Opening data connection.\r\n')
 
-                    # open the dataSocket to the client
-                    self.openSocket()
                     # set read starting position to the startingPosition var
                     file.seek(self.startingPosition)
 
                     # reset the starting position back to 0 so next download will start from the beginning of the file
                     self.startingPosition = 0
 
-                    # loop and read all the data from the file and write it into the socket
-                    # until there is nothing more to read
-                    while True:
-                        if self.mode == 'I':
-                            # read 1024 bytes from the file
-                            data = file.read(1024)
-
-                            # check if data was read from the file, if not - get out of the loop (finish reading)
-                            if not data:
-                                break
-                        else:
-                            # because the client asked us to work in ascii mode, we need to send it a CRLF character
-                            # at the end of each line, so make sure each line ends with CRLF (\r\n)
-                            currentLine = file.readline()
-
-                            # check if data was read from the file, if not - get out of the loop (finish reading)
-                            if not currentLine:
-                                break
-
-                            if not currentLine.endswith("\r\n"):
-                                # remove the last character [should be \n (Unix systems) or \r (Mac systems)]
-                                currentLine = currentLine[:-1]
-                                # add to the end of the line the CRLF end line characters (Windows systems)
-                                data = bytes(currentLine + '\r\n', 'utf-8')
-
-                        # send to the dataSocket the 1024 bytes you read from file, the sendData function will decide
-                        # if to send it binary or ascii (text) base on the client preferences
-                        self.sendData(data)
+                    # open the dataSocket to the client, in binary mode over RUDP the first 1024 bytes are read
+                    # before it and sent with the connection request (a small file is sent with the handshake itself)
+                    self.openSocket(file.read(1024) if self.mode == 'I' and not isTCPIP else None)
+
+                    # send the rest of the file, from the position REST asked for
+                    self.sendFileData(file)
 
                     # close the file and allow others to use it
                     file.close()
@@ -858,7 +982,8 @@ class FtpServerProtocol(threading.Thread):
                 # get the absolute path to the file / folder
                 fileToUpload = self.getAbsolutePath(filename)
 
-                if self.isAppend:
+                isAppend = self.isAppend
+                if isAppend:
                     # open the file to Write from the end of the file (append) in binary mode
                     file = open(fileToUpload, 'ab')
                     # reset the append flag back to it's default value (false)
@@ -867,32 +992,37 @@ class FtpServerProtocol(threading.Thread):
                     # open the file to Write (new file or overwrite) in binary mode (always write byte array to a file)
                     file = open(fileToUpload, 'wb')
 
-                # send message to client to tell it that we are working on his request
-                self.sendCommand('150 Opening data connection.\r\n')
-
-                # open the dataSocket to the client
-                self.openSocket()
-
-                # loop and read all the data from the socket and write it into the file
-                # until there is nothing more to read
-                while True:
-                    # read from the socket 1024 bytes/chars (based on client preferences)
-                    data = self.dataSocket.receive(1024)
-
-                    # check if data was received, if not - get out of the loop (finish reading)
-                    if not data:
-                        break
+                # if the client announced the file size (ALLO) then allocate all of the file space at once, so
+                # the file system doesn't grow the file (and fragment it) buffer after buffer. an appended file is
+                # not allocated: the allocation would move its end, and every write of 'ab' goes to the end
+                isAllocated = False
+                if self.allocationSize > 0 and not isAppend and hasattr(os, 'posix_fallocate'):
+                    try:
+                        os.posix_fallocate(file.fileno(), 0, self.allocationSize)
+                        isAllocated = True
+                    except OSError as err:
+                        log(f"STOR(): can't allocate {self.allocationSize} bytes for the file: {err}")
+                # the allocation size is for this upload only
+                self.allocationSize = 0
+
+                try:
+                    # send message to client to tell it that we are working on his request
+                    self.sendCommand('150 Opening data connection.\r\n')
 
-                    # # if client asked us to receive in ascii mode, then we need to convert (decode) the strings into
-                    # # byte array using UTF8 mapping
-                    # if self.mode == 'A':
-                    #     data = data.decode("utf-8")
+                    # open the dataSocket to the client
+                    self.openSocket()
 
-                    # write the 1024 bytes you read from the socket into the file
-                    file.write(data)
+                    # read all the data from the socket and write it into the file until there is nothing more to read
+                    # (in ascii mode the CRLF newlines are converted to the local newlines)
+                    self.receiveFileData(file)
+                finally:
+                    # the allocation may be bigger than the data that arrived (also when the upload failed), the
+                    # file must end where the data ended
+                    if isAllocated:
+                        file.truncate()
 
-                # close the file and allow others to use it
-                file.close()
+                    # close the file and allow others to use it
+                    file.close()
 
                 # close the dataSocket
                 self.closeSocket()
@@ -912,6 +1042,26 @@ class FtpServerProtocol(threading.Thread):
         self.STOR(filename)
 
 
+    # ---------------------------------------------------------------- #
+    # this function saves the size (in bytes) of the next upload,      #
+    # the STOR that follows allocates the whole file space at once     #
+    # (an APPE ignores it, the appended file keeps its own end)        #
+    # ---------------------------------------------------------------- #
+    def ALLO(self, size):
+        log("ALLO(" + size + ")")
+        try:
+            # check if user is authenticated
+            self.isUserAuthenticated()
+
+            # the size may be followed by a record size (ALLO <size> R <record size>) that is not needed here
+            self.allocationSize = max(int(size.split()[0]), 0)
+            self.sendCommand('200 ALLO command successful.\r\n')
+        except Exception as err:
+            if err.__class__.__name__ != 'UserNotAuthenticatedException':
+                logCommand("ALLO function failed", err)
+                self.sendCommand('501 Syntax error in the ALLO size.\r\n')
+
+
     # ------------------------------------------- #
     #  this function handles the HELP ftp command #
     # ------------------------------------------- #
@@ -944,6 +1094,8 @@ class FtpServerProtocol(threading.Thread):
                  stored as A file server site.
             APPE This command allows server-DTP to receive data transmitted via a data connection, and data is stored
                  as A file server site.
+            ALLO [size] Announces the size of the next uploaded file, so the server can allocate all of its space at
+                 once.
             SYS  This command is used to find the server's operating system type.
             HELP Displays help information.
             QUIT This command terminates a user, if not being executed file transfer, the server will shut down
@@ -975,7 +1127,150 @@ class FtpServerProtocol(threading.Thread):
     #  the server responds with a WELCOME message #
     # ------------------------------------------- #
     def sendWelcome(self):
-        self.sendCommand('220 Welcome.\r\n')
+        self.sendCommand(WELCOME_MESSAGE)
+
+
+# ------------------------------------------------------------------ #
+# a thread that serves a single client session, it waits for the    #
+# commands on the command socket and runs them one after the other  #
+# ------------------------------------------------------------------ #
+class FtpServerProtocol(FtpSession, threading.Thread):
+    # ----------------------------------- #
+    # init the thread and set all members #
+    # ----------------------------------- #
+    def __init__(self, newCommandSocket, newThreadName):
+        FtpSession.__init__(self, newCommandSocket, newThreadName)
+
+        # init the thread super
+        threading.Thread.__init__(self)
+
+
+    def run(self):
+        global isListening
+
+        # when a client connects - send it a welcome message
+        self.sendWelcome()
+
+        while True:
+            # if the server admin pressed q+Enter then close connection to the client and quit this thread
+            # so the server can shut down properly
+            if not isListening:
+                self.QUIT('')
+                break
+
+            try:
+                self.commandSocket.setTimeout(5.0)
+                data = self.commandSocket.receive(1024).rstrip()
+                if (data is not None) and (len(data) > 0):
+                    cmd = self.handleCommand(data)
+                    if not cmd:
+                        break
+            except socket.error as err:
+                if err.__class__.__name__ != 'TimeoutError':
+                    if 'forcibly closed' not in str(err):
+                        logCommand('General Error while receiving data from client', err)
+                    else:
+                        break
+
+        # once this thread run function has finished (got out of the while loop)
+        # then log that the client has disconnected
+        log("Client: " + str(self.clientAddress) + " disconnected")
+
+
+# ---------------------------------------------------------------------------------- #
+# a client session of the asyncio server, the command connection belongs to the      #
+# event loop and the session waits for the commands as a coroutine (no thread while #
+# the client is idle), every command runs in an executor so the blocking handlers   #
+# (disk work and data transfers) never block the loop and the other clients, the    #
+# transfers run in their own executor so they can't hold up the short commands      #
+# ---------------------------------------------------------------------------------- #
+class AsyncFtpSession(FtpSession):
+    # the event loop the command connection lives in
+    loop = None
+
+    # the thread pool the short commands run in
+    commandExecutor = None
+
+    # the thread pool the ASYNC_TRANSFER_COMMANDS run in
+    transferExecutor = None
+
+    # a flag that indicates if the session waits for the next command (it is not running one)
+    isWaitingForCommand = False
+
+
+    def __init__(self, newCommandSocket, newThreadName, loop, commandExecutor, transferExecutor):
+        FtpSession.__init__(self, newCommandSocket, newThreadName)
+        self.loop = loop
+        self.commandExecutor = commandExecutor
+        self.transferExecutor = transferExecutor
+
+
+    # ------------------------------------------------------------------------- #
+    # sends the command reply to the client, it is called by the handlers from #
+    # the executor threads so the sending itself is passed to the event loop   #
+    # ------------------------------------------------------------------------- #
+    def sendCommand(self, cmd):
+        data = cmd.encode('utf-8')
+        asyncio.run_coroutine_threadsafe(self.commandSocket.send(data), self.loop).result()
+        return len(data)
+
+
+    # ------------------------------------------------------------------------------ #
+    # the session coroutine, sends the welcome message and runs the client commands #
+    # one after the other until the client disconnects, sends QUIT or the server     #
+    # shuts down (then the server cancels the sessions that wait for a command)     #
+    # ------------------------------------------------------------------------------ #
+    async def serve(self):
+        isClientConnected = True
+        try:
+            # the welcome message is sent by the loop itself, so a new client gets it even if all the threads are busy
+            await self.commandSocket.send(WELCOME_MESSAGE.encode('utf-8'))
+            while isListening:
+                self.isWaitingForCommand = True
+                data = await self.commandSocket.receive(1024)
+                self.isWaitingForCommand = False
+                if data is None:
+                    isClientConnected = False
+                    break
+                data = data.rstrip()
+                if len(data) > 0:
+                    if data[:4].strip().upper().decode('utf-8', 'replace') in ASYNC_TRANSFER_COMMANDS:
+                        commandExecutor = self.transferExecutor
+                    else:
+                        commandExecutor = self.commandExecutor
+                    cmd = await self.loop.run_in_executor(commandExecutor, self.handleCommand, data)
+                    if not cmd or cmd == 'QUIT':
+                        break
+        except asyncio.CancelledError:
+            log("Client: " + str(self.clientAddress) + " session was stopped, the server is shutting down")
+        except Exception as err:
+            isClientConnected = False
+            logCommand('General Error while receiving data from client', err)
+
+        # a session that didn't QUIT is closed here, the client gets the goodbye message if it is still connected
+        if self.threadName in allThreads:
+            try:
+                if isClientConnected:
+                    await self.loop.run_in_executor(self.commandExecutor, self.QUIT, '')
+                else:
+                    await self.loop.run_in_executor(self.commandExecutor, self.closeSocket)
+            except Exception as err:
+                log(f"Warning: failed to close the session of client: {self.clientAddress} due to error: {err}")
+            allThreads.pop(self.threadName, None)
+        await closeAsyncCommandSocket(self.commandSocket)
+        log("Client: " + str(self.clientAddress) + " disconnected")
+
+
+# ------------------------------------------------------------------------------- #
+# closes a command connection of the asyncio server once the replies still in   #
+# flight were delivered (an RUDP connection sends its RST as soon as it closes)  #
+# ------------------------------------------------------------------------------- #
+async def closeAsyncCommandSocket(commandSocket):
+    try:
+        await commandSocket.flush()
+    except Exception as err:
+        log(f"Warning: replies to client: {commandSocket.receiverAddress} were not delivered due to error: {err}")
+    commandSocket.close()
 
 
 # ----------------------------------------------------- #
@@ -993,7 +1288,7 @@ def serverListener():
         if isTCPIP:
             mainServerSocket = TCPIPSocket()
         else:
-            mainServerSocket = RUDPSocket()
+            mainServerSocket = RUDPSocket(useCompression=isRUDPCompression)
 
             # start the server main socket that listens to client incoming connections
         mainServerAddress = (SERVER_HOST, SERVER_PORT)
@@ -1030,11 +1325,88 @@ def serverListener():
                 break
 
 
+# ---------------------------------------------------------------------------------- #
+#  the asyncio version of serverListener, it serves all the clients from one event   #
+#  loop: every accepted client gets an AsyncFtpSession coroutine, and when the       #
+#  server admin asks to shut down it stops accepting and closes the idle sessions    #
+# ---------------------------------------------------------------------------------- #
+async def runAsyncServer():
+    global mainServerSocket
+    global isListening
+
+    loop = asyncio.get_running_loop()
+    commandExecutor = ThreadPoolExecutor(ASYNC_SERVER_COMMAND_WORKERS)
+    transferExecutor = ThreadPoolExecutor(ASYNC_SERVER_TRANSFER_WORKERS)
+    sessionTasks = {}
+
+    # starts the session coroutine of a new client command connection
+    def startSession(commandSocket):
+        newClientID = f"{commandSocket.receiverAddress[0]}:{commandSocket.receiverAddress[1]}"
+        if newClientID in allConnectedClients:
+            loop.create_task(closeAsyncCommandSocket(commandSocket))
+            return
+        allConnectedClients[newClientID] = "Connected"
+        session = AsyncFtpSession(commandSocket, generateUniqueThreadName(), loop, commandExecutor, transferExecutor)
+        sessionTask = loop.create_task(session.serve())
+        sessionTasks[sessionTask] = session
+        sessionTask.add_done_callback(sessionTasks.pop)
+        logCommand('Accept', 'New client connected %s, %s' % commandSocket.receiverAddress[:2])
+
+    # accepts the RUDP command connections (TCPIP connections are started by the asyncio server itself)
+    async def acceptRUDPConnections():
+        while True:
+            startSession(await mainServerSocket.accept())
+
+    try:
+        # create the server socket based on the selected protocol
+        if isTCPIP:
+            mainServerSocket = await asyncio.start_server(
+                lambda streamReader, streamWriter: startSession(AsyncTCPIPSocket(streamReader, streamWriter)),
+                SERVER_HOST, SERVER_PORT, backlog=ASYNC_SERVER_BACKLOG)
+        else:
+            mainServerSocket = await rudp_asyncio.listen((SERVER_HOST, SERVER_PORT))
+            acceptTask = loop.create_task(acceptRUDPConnections())
+
+        # mark the server as listening
+        isListening = True
+        logCommand('Server started', f'Listen on: {SERVER_HOST}, {SERVER_PORT} (asyncio)')
+    except Exception as err:
+        logCommand("Error: cannot launch server, error", err)
+        commandExecutor.shutdown()
+        transferExecutor.shutdown()
+        return
+
+    # one timer for the whole server checks if the server admin asked to shut down
+    while isListening:
+        await asyncio.sleep(SHUTDOWN_CHECK_INTERVAL)
+
+    log("Warning: cannot accept any more connections, server is shutting down")
+    if not isTCPIP:
+        acceptTask.cancel()
+    mainServerSocket.close()
+
+    # the sessions that run a command stop by themselves when it is done
+    for sessionTask, session in list(sessionTasks.items()):
+        if session.isWaitingForCommand:
+            sessionTask.cancel()
+    if sessionTasks:
+        await asyncio.wait(list(sessionTasks))
+    commandExecutor.shutdown()
+    transferExecutor.shutdown()
+
+
+# ------------------------------------------------------------------- #
+#  runs the asyncio server in the calling thread until it shuts down  #
+# ------------------------------------------------------------------- #
+def asyncServerListener():
+    asyncio.run(runAsyncServer())
+
+
 if __name__ == "__main__":
     try:
         # start the ftp server in a separated thread so the main thread can listen to Q and Ctrl+C keys
         logCommand('Start ftp server', 'press q and Enter or Ctrl+C to stop the ftp server')
-        listener = threading.Thread(target=serverListener)
+        listener = threading.Thread(target=asyncServerListener if isAsyncServer else serverListener)
         listener.start()
 
         # if server admin asked to stop the FTP server - quit
@@ -0,0 +1,586 @@
+import asyncio
+import random
+import socket
+import time
+from collections import deque
+from rudp_congestion import RttEstimator, createCongestionControl, DEFAULT_CONGESTION_CONTROL
+from rudp_socket import log, parsePacket, buildPacket, buildSackPayload, parseSackPayload, getSackAcknowledged, \
+    getFollowingSequenceNumber, MAX_PAYLOAD_LENGTH, SOCKET_MAX_TIMEOUT, ACK_DELAY, ACK_EVERY_PACKETS, \
+    SEQUENCE_NUMBER_SPACE, RECEIVE_WINDOW_SIZE, MAX_CONNECTION_ID, PACKET_TYPE_SYN, PACKET_TYPE_DATA, \
+    PACKET_TYPE_ACK, PACKET_TYPE_END, PACKET_TYPE_RST, PACKET_TYPE_SACK, SYN_PAYLOAD, QUICK_ACK_PACKETS, \
+    SYN_COOKIE_ECHO, ACCEPT_BACKLOG, MAX_SYN_REPLY_RATE, makeSynCookie, getSynCookieTimeSlot, isValidSynCookie, \
+    buildSynCookieEcho
+
+
+# ---------------------------------------------------------------------------------- #
+# an RUDP connection that lives in an asyncio event loop, it speaks the same wire    #
+# protocol as RUDPSocket (SYN/DATA/ACK/END/RST/SACK) so it can talk to RUDPSocket    #
+# peers, but it has no threads: packets are handed to it by RUDPDatagramProtocol,    #
+# retransmission and delayed ACK timers are loop timers, and send()/receive() await  #
+# ---------------------------------------------------------------------------------- #
+class AsyncRUDPConnection:
+    # a flag that indicates if the connection has finished the handshake (the other side answered our SYN)
+    isConnected = False
+
+    # flag indicating connection is closed
+    isClosed = False
+
+    # the datagram transport used to send packets (shared by all the connections of a server)
+    transport = None
+
+    # the protocol that routes the received packets to this connection
+    protocol = None
+
+    # the ipv4 address and port of the other side
+    receiverAddress = None
+
+    # the id of this connection, it is sent in every packet
+    connectionId = 0
+
+    # the sequence number of the last packet we sent
+    sequenceNumber = 0
+
+    # the sequence number of the SYN we sent when we connected (None for accepted connections)
+    synSequenceNumber = None
+
+    # dictionary that holds all the sequence numbers and packets that were not acknowledge yet
+    waitingForAcknowledge = None
+
+    # dictionary that holds the last time each packet waiting for acknowledge was sent
+    packetTransmitTimes = None
+
+    # the sequence numbers of the packets that were retransmitted, their ACK can't be used as an RTT sample
+    retransmittedSequenceNumbers = None
+
+    # the last time a retransmission timeout collapsed the congestion window
+    lastTimeoutTime = 0
+
+    # the receive window (in packets) the other side advertised in its last SACK
+    receiverWindowSize = RECEIVE_WINDOW_SIZE
+
+    # the sequence number of the next DATA/END packet we expect to get in order (None until SYN received)
+    nextExpectedSequenceNumber = None
+
+    # ring buffer of the packets (packetType, data) received ahead of nextExpectedSequenceNumber
+    receiveWindow = None
+
+    # number of packets currently kept in the receiveWindow ring buffer
+    receiveWindowCount = 0
+
+    # queue of the in-order data chunks that are ready to be consumed by the caller, None marks the END of a message
+    receivedChunks = None
+
+    # the receive window (in packets) we advertised to the other side in our last SACK
+    lastAdvertisedWindow = RECEIVE_WINDOW_SIZE
+
+    # number of received packets that were not acknowledged yet (they will be coalesced into one SACK)
+    pendingAckCount = 0
+
+    # number of packets that will still be acknowledged right away (quick ACK at the start of the connection)
+    quickAckCount = QUICK_ACK_PACKETS
+
+    # the loop timer that sends the coalesced SACK (None if no SACK is pending)
+    delayedAckHandle = None
+
+    # events that wake the coroutines waiting in send()/receive()
+    connectedEvent = None
+    acknowledgedEvent = None
+    dataReadyEvent = None
+
+
+    def __init__(self, protocol, receiverAddress, connectionId, congestionControlAlgorithm=DEFAULT_CONGESTION_CONTROL):
+        self.protocol = protocol
+        self.transport = protocol.transport
+        self.receiverAddress = receiverAddress
+        self.connectionId = connectionId
+        self.congestionControl = createCongestionControl(congestionControlAlgorithm)
+        self.rttEstimator = RttEstimator()
+        self.waitingForAcknowledge = {}
+        self.packetTransmitTimes = {}
+        self.retransmittedSequenceNumbers = set()
+        self.receiveWindow = [None] * RECEIVE_WINDOW_SIZE
+        self.receivedChunks = deque()
+        self.connectedEvent = asyncio.Event()
+        self.acknowledgedEvent = asyncio.Event()
+        self.dataReadyEvent = asyncio.Event()
+
+
+    # ------------------------------------------------------------------------------ #
+    # sends bytes data to the other side as one message, returns once the last       #
+    # packet was sent so back-to-back messages are pipelined, await flush() to wait  #
+    # for their ACKs                                                                 #
+    # ------------------------------------------------------------------------------ #
+    async def send(self, dataToSend):
+        await asyncio.wait_for(self.connectedEvent.wait(), SOCKET_MAX_TIMEOUT)
+
+        dataToSend = memoryview(dataToSend).cast('B')
+        totalBytesSent = 0
+        while totalBytesSent < len(dataToSend):
+            # wait until the congestion and receiver windows allow another packet
+            await self.waitForAcknowledge(lambda: len(self.waitingForAcknowledge) < self.getSendWindowSize())
+            self.sendReliablePacket(PACKET_TYPE_DATA, dataToSend[totalBytesSent:totalBytesSent + MAX_PAYLOAD_LENGTH])
+            totalBytesSent = totalBytesSent + MAX_PAYLOAD_LENGTH
+
+        # after all packets are sent, send the END packet, the next message may be sent right away
+        await self.waitForAcknowledge(lambda: len(self.waitingForAcknowledge) < self.getSendWindowSize())
+        self.sendReliablePacket(PACKET_TYPE_END, b'')
+
+
+    # ---------------------------------------------------------------------- #
+    # waits until all the sent messages were acknowledged by the other side #
+    # ---------------------------------------------------------------------- #
+    async def flush(self):
+        await self.waitForAcknowledge(lambda: len(self.waitingForAcknowledge) == 0)
+
+
+    # ------------------------------------------------------------------------------ #
+    # waits until isDone() is true, it is checked again every time an ACK arrives,   #
+    # raises TimeoutError if no ACK arrives for SOCKET_MAX_TIMEOUT seconds           #
+    # ------------------------------------------------------------------------------ #
+    async def waitForAcknowledge(self, isDone):
+        while not isDone():
+            if self.isClosed:
+                raise ConnectionResetError('RUDP connection was closed')
+            self.acknowledgedEvent.clear()
+            await asyncio.wait_for(self.acknowledgedEvent.wait(), SOCKET_MAX_TIMEOUT)
+
+
+    # ---------------------------------------------------------------------------- #
+    # receives up to maxBufferSize bytes of in-order data as soon as they arrive,  #
+    # a single call never returns bytes of two different messages, returns None   #
+    # once the connection was closed and all the received data was consumed       #
+    # ---------------------------------------------------------------------------- #
+    async def receive(self, maxBufferSize):
+        while not self.receivedChunks:
+            if self.isClosed:
+                return None
+            self.dataReadyEvent.clear()
+            await self.dataReadyEvent.wait()
+
+        dataChunks = []
+        receivedLength = 0
+        while self.receivedChunks and receivedLength < maxBufferSize:
+            nextChunk = self.receivedChunks.popleft()
+            if nextChunk is None:
+                # END of message, stop here so bytes of the next message are returned by the next call
+                if receivedLength > 0:
+                    break
+                continue
+            if receivedLength + len(nextChunk) > maxBufferSize:
+                self.receivedChunks.appendleft(nextChunk[maxBufferSize - receivedLength:])
+                nextChunk = nextChunk[:maxBufferSize - receivedLength]
+            dataChunks.append(nextChunk)
+            receivedLength = receivedLength + len(nextChunk)
+
+        self.sendWindowUpdate()
+        if not dataChunks:
+            # only END markers were waiting, wait for real data
+            return await self.receive(maxBufferSize)
+        return b''.join(dataChunks)
+
+
+    # --------------------------------------------------------------------------- #
+    # iterates over the received in-order data chunks as they arrive, until the   #
+    # other side closes the connection: async for dataChunk in connection: ...    #
+    # --------------------------------------------------------------------------- #
+    async def __aiter__(self):
+        while True:
+            dataChunk = await self.receive(RECEIVE_WINDOW_SIZE * MAX_PAYLOAD_LENGTH)
+            if dataChunk is None:
+                return
+            yield dataChunk
+
+
+    # ------------------------------------------------------------------------ #
+    # closes the connection, the transport is closed only if this connection  #
+    # owns it (a client connection), server connections share the transport,  #
+    # await flush() first so the messages still in flight are delivered       #
+    # ------------------------------------------------------------------------ #
+    def close(self):
+        if self.isClosed:
+            return
+        if self.isConnected:
+            self.sendRUDPPacket(PACKET_TYPE_RST, self.getNextSequenceNumber(), b'')
+        self.isConnected = False
+        self.isClosed = True
+        if self.delayedAckHandle is not None:
+            self.delayedAckHandle.cancel()
+        # wake up everyone that is waiting on this connection
+        self.acknowledgedEvent.set()
+        self.dataReadyEvent.set()
+        self.protocol.removeConnection(self)
+
+
+    def getSendWindowSize(self):
+        return max(min(self.congestionControl.getWindowSize(), self.receiverWindowSize), 1)
+
+
+    def getNextSequenceNumber(self):
+        self.sequenceNumber = getFollowingSequenceNumber(self.sequenceNumber)
+        return self.sequenceNumber
+
+
+    # -------------------------------------------------------------------------- #
+    # sends a SYN/DATA/END packet, keeps it until it is acknowledged and sets its #
+    # retransmission timer                                                       #
+    # -------------------------------------------------------------------------- #
+    def sendReliablePacket(self, packetType, packetData):
+        sequenceNumber = self.getNextSequenceNumber()
+        self.waitingForAcknowledge[sequenceNumber] = self.sendRUDPPacket(packetType, sequenceNumber, packetData)
+        self.packetTransmitTimes[sequenceNumber] = time.time()
+        asyncio.get_running_loop().call_later(self.rttEstimator.getRetransmissionTimeout(),
+                                              self.handleRetransmissionTimeout, sequenceNumber)
+
+
+    # ---------------------------------------------------------------------------- #
+    # loop timer callback, retransmits the packet if it is still waiting for       #
+    # acknowledge and was not sent within the RTO, then sets its next timer        #
+    # ---------------------------------------------------------------------------- #
+    def handleRetransmissionTimeout(self, sequenceNumber):
+        currentPacket = self.waitingForAcknowledge.get(sequenceNumber)
+        if self.isClosed or currentPacket is None:
+            return
+        currentTime = time.time()
+        retransmissionTimeout = self.rttEstimator.getRetransmissionTimeout()
+        packetTimeoutTime = self.packetTransmitTimes[sequenceNumber] + retransmissionTimeout
+        if packetTimeoutTime <= currentTime:
+            log(f"handleRetransmissionTimeout(): {sequenceNumber} to: {self.receiverAddress}")
+            self.transport.sendto(currentPacket, self.receiverAddress)
+            self.packetTransmitTimes[sequenceNumber] = currentTime
+            self.retransmittedSequenceNumbers.add(sequenceNumber)
+            # all the packets sent in the same window time out together, react to the congestion only once
+            if currentTime - self.lastTimeoutTime >= retransmissionTimeout:
+                self.lastTimeoutTime = currentTime
+                self.rttEstimator.backoff()
+                self.congestionControl.onTimeout()
+            packetTimeoutTime = currentTime + self.rttEstimator.getRetransmissionTimeout()
+        asyncio.get_running_loop().call_later(packetTimeoutTime - currentTime,
+                                              self.handleRetransmissionTimeout, sequenceNumber)
+
+
+    # --------------------------------------------------------------------- #
+    # handles a packet received on this connection (called by the protocol) #
+    # --------------------------------------------------------------------- #
+    def handlePacket(self, receivedPacketType, receivedSequenceNumber, receivedData):
+        if receivedPacketType == PACKET_TYPE_SYN:
+            # a retransmitted SYN must not reset a connection that is already receiving data, but while our own SYN
+            # waits for its ACK the other side is a listening endpoint without state for us, its SYN replaces the last
+            synPacket = None if self.isConnected else self.waitingForAcknowledge.get(self.synSequenceNumber)
+            if self.nextExpectedSequenceNumber is None or synPacket is not None:
+                self.nextExpectedSequenceNumber = getFollowingSequenceNumber(receivedSequenceNumber)
+                if len(receivedData) > SYN_PAYLOAD.size:
+                    # the SYN carries the first message (data in SYN), it comes before all the DATA packets
+                    self.receivedChunks.append(bytes(receivedData[SYN_PAYLOAD.size:]))
+                    self.receivedChunks.append(None)
+                    self.dataReadyEvent.set()
+            if synPacket is not None:
+                # the listening endpoint's SYN finishes our side of the handshake (like a TCP SYN-ACK), the ACK that
+                # returns its cookie with our SYN creates our connection there, it takes the place of our SYN in
+                # waitingForAcknowledge so it is retransmitted until the listening endpoint acknowledges our SYN
+                ackData = buildSynCookieEcho(self.synSequenceNumber, self.takeHandshakeRttSample(), synPacket)
+                self.waitingForAcknowledge[self.synSequenceNumber] = self.sendRUDPPacket(
+                    PACKET_TYPE_ACK, receivedSequenceNumber, ackData)
+                self.packetTransmitTimes[self.synSequenceNumber] = time.time()
+                self.isConnected = True
+                self.connectedEvent.set()
+            else:
+                self.sendRUDPPacket(PACKET_TYPE_ACK, receivedSequenceNumber, b'')
+        elif receivedPacketType == PACKET_TYPE_DATA or receivedPacketType == PACKET_TYPE_END:
+            self.handleDataPacket(receivedPacketType, receivedSequenceNumber, receivedData)
+        elif receivedPacketType == PACKET_TYPE_ACK:
+            if self.synSequenceNumber is None and len(receivedData) >= SYN_COOKIE_ECHO.size:
+                # the client returned our cookie again, the ACK of its SYN was lost, so acknowledge its SYN again
+                self.sendRUDPPacket(PACKET_TYPE_ACK, SYN_COOKIE_ECHO.unpack_from(receivedData)[0], b'')
+            self.acknowledgePackets([receivedSequenceNumber])
+        elif receivedPacketType == PACKET_TYPE_SACK:
+            selectivelyAcknowledged, advertisedWindow = parseSackPayload(receivedSequenceNumber, receivedData)
+            if advertisedWindow is not None:
+                self.receiverWindowSize = advertisedWindow
+            # the cumulative ACK acknowledges every packet that doesn't come after it (serial number order)
+            self.acknowledgePackets(getSackAcknowledged(self.waitingForAcknowledge, receivedSequenceNumber,
+                                                        selectivelyAcknowledged))
+        elif receivedPacketType == PACKET_TYPE_RST:
+            self.isConnected = False
+            self.close()
+        else:
+            log(f"handlePacket(): unexpected packet type: {receivedPacketType}, ignoring it")
+
+
+    # ---------------------------------------------------------------------------- #
+    # takes the round trip from our SYN to the listener SYN as an RTT sample and    #
+    # returns it, 0 if our SYN was retransmitted (see RUDPSocket for the details)   #
+    # ---------------------------------------------------------------------------- #
+    def takeHandshakeRttSample(self):
+        transmitTime = self.packetTransmitTimes.get(self.synSequenceNumber)
+        if transmitTime is None or self.synSequenceNumber in self.retransmittedSequenceNumbers:
+            return 0
+        handshakeRtt = time.time() - transmitTime
+        self.rttEstimator.addSample(handshakeRtt)
+        # the ACK of our SYN comes a round trip later, it is not an RTT sample
+        self.retransmittedSequenceNumbers.add(self.synSequenceNumber)
+        return handshakeRtt
+
+
+    # -------------------------------------------------------------------------- #
+    # keeps a DATA/END packet in the receive window until all the packets before #
+    # it arrive, then moves the in-order packets to the caller queue            #
+    # -------------------------------------------------------------------------- #
+    def handleDataPacket(self, packetType, sequenceNumber, data):
+        if self.nextExpectedSequenceNumber is None:
+            return
+
+        sequenceOffset = (sequenceNumber - self.nextExpectedSequenceNumber) % SEQUENCE_NUMBER_SPACE
+        isDuplicate = sequenceOffset >= SEQUENCE_NUMBER_SPACE // 2
+        isOutsideWindow = not isDuplicate and sequenceOffset >= self.getFreeReceiveWindow()
+        if not isDuplicate and not isOutsideWindow:
+            receiveWindowSlot = sequenceNumber % RECEIVE_WINDOW_SIZE
+            if self.receiveWindow[receiveWindowSlot] is None:
+                self.receiveWindow[receiveWindowSlot] = (packetType, data)
+                self.receiveWindowCount = self.receiveWindowCount + 1
+            else:
+                isDuplicate = True
+
+        isEndReceived = False
+        nextSlot = self.nextExpectedSequenceNumber % RECEIVE_WINDOW_SIZE
+        while self.receiveWindow[nextSlot] is not None:
+            nextPacketType, nextData = self.receiveWindow[nextSlot]
+            self.receiveWindow[nextSlot] = None
+            self.receiveWindowCount = self.receiveWindowCount - 1
+            self.nextExpectedSequenceNumber = getFollowingSequenceNumber(self.nextExpectedSequenceNumber)
+            nextSlot = self.nextExpectedSequenceNumber % RECEIVE_WINDOW_SIZE
+            if nextPacketType == PACKET_TYPE_DATA:
+                self.receivedChunks.append(nextData)
+            else:
+                self.receivedChunks.append(None)
+                isEndReceived = True
+            self.dataReadyEvent.set()
+
+        # send the SACK now if the sender needs it to stop waiting, otherwise delay it to coalesce a few packets
+        self.pendingAckCount = self.pendingAckCount + 1
+        self.quickAckCount = max(self.quickAckCount - 1, 0)
+        if isDuplicate or isOutsideWindow or isEndReceived or self.receiveWindowCount > 0 \
+                or self.pendingAckCount >= ACK_EVERY_PACKETS or self.quickAckCount > 0:
+            self.sendSackPacket()
+        elif self.delayedAckHandle is None:
+            self.delayedAckHandle = asyncio.get_running_loop().call_later(ACK_DELAY, self.sendSackPacket)
+
+
+    def getFreeReceiveWindow(self):
+        return max(RECEIVE_WINDOW_SIZE - len(self.receivedChunks) - self.receiveWindowCount, 0)
+
+
+    def sendWindowUpdate(self):
+        if self.nextExpectedSequenceNumber is None or self.isClosed:
+            return
+        if self.lastAdvertisedWindow < RECEIVE_WINDOW_SIZE // 2 <= self.getFreeReceiveWindow():
+            self.sendSackPacket()
+
+
+    # -------------------------------------------------------------------------- #
+    # removes the acknowledged packets from waitingForAcknowledge, takes an RTT   #
+    # sample and lets the congestion control grow the window                     #
+    # -------------------------------------------------------------------------- #
+    def acknowledgePackets(self, sequenceNumbers):
+        currentTime = time.time()
+        newestTransmitTime = None
+        numberOfAcknowledgedPackets = 0
+        for sequenceNumber in sequenceNumbers:
+            poppedPacket = self.waitingForAcknowledge.pop(sequenceNumber, None)
+            transmitTime = self.packetTransmitTimes.pop(sequenceNumber, None)
+            if not poppedPacket:
+                continue
+            numberOfAcknowledgedPackets = numberOfAcknowledgedPackets + 1
+            if sequenceNumber in self.retransmittedSequenceNumbers:
+                self.retransmittedSequenceNumbers.discard(sequenceNumber)
+            elif transmitTime is not None and (newestTransmitTime is None or transmitTime > newestTransmitTime):
+                newestTransmitTime = transmitTime
+            if parsePacket(poppedPacket)[0] == PACKET_TYPE_SYN:
+                self.isConnected = True
+                self.connectedEvent.set()
+
+        if numberOfAcknowledgedPackets > 0:
+            if newestTransmitTime is not None:
+                self.rttEstimator.addSample(currentTime - newestTransmitTime)
+            self.congestionControl.onAcknowledge(numberOfAcknowledgedPackets)
+            self.acknowledgedEvent.set()
+
+
+    def sendSackPacket(self):
+        if self.delayedAckHandle is not None:
+            self.delayedAckHandle.cancel()
+            self.delayedAckHandle = None
+        if self.isClosed:
+            return
+        cumulativeAck = (self.nextExpectedSequenceNumber - 1) % SEQUENCE_NUMBER_SPACE
+        self.lastAdvertisedWindow = self.getFreeReceiveWindow()
+        self.pendingAckCount = 0
+        self.sendRUDPPacket(PACKET_TYPE_SACK, cumulativeAck,
+                            buildSackPayload(cumulativeAck, self.receiveWindow, self.lastAdvertisedWindow))
+
+
+    def sendRUDPPacket(self, packetType, packetSequenceNumber, packetData):
+        rudpPacket = buildPacket(packetType, self.connectionId, packetSequenceNumber, packetData)
+        self.transport.sendto(rudpPacket, self.receiverAddress)
+        return rudpPacket
+
+
+# ---------------------------------------------------------------------------------- #
+# the asyncio datagram protocol of an RUDP endpoint, it routes every datagram to its #
+# connection: a client endpoint has a single connection (found by connection id),   #
+# a server endpoint routes by (client address, connection id) and answers a new     #
+# client statelessly with a SYN cookie, the ACK that returns a valid cookie creates  #
+# a connection that is returned by accept()                                          #
+# ---------------------------------------------------------------------------------- #
+class RUDPDatagramProtocol(asyncio.DatagramProtocol):
+    # the datagram transport of this endpoint
+    transport = None
+
+    # flag indicating this endpoint accepts new connections
+    isListening = False
+
+    # the congestion control algorithm of the connections accepted by this endpoint
+    congestionControlAlgorithm = DEFAULT_CONGESTION_CONTROL
+
+    # dictionary of the connections of this endpoint (by connection id for a client, by
+    # (client address, connection id) for a server)
+    connections = None
+
+    # queue of the new connections waiting to be returned by accept()
+    acceptQueue = None
+
+    # token bucket of the SYN replies (number of SYNs we may answer now) and the last time it was refilled
+    synReplyTokens = MAX_SYN_REPLY_RATE
+    lastSynReplyTime = 0
+
+
+    def __init__(self, isListening=False, congestionControlAlgorithm=DEFAULT_CONGESTION_CONTROL):
+        self.isListening = isListening
+        self.congestionControlAlgorithm = congestionControlAlgorithm
+        self.connections = {}
+        self.acceptQueue = asyncio.Queue(ACCEPT_BACKLOG)
+
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+
+    def datagram_received(self, receivedPacket, clientAddress):
+        try:
+            receivedPacketType, receivedConnectionId, receivedSequenceNumber, receivedDataLength, receivedData = parsePacket(receivedPacket)
+        except Exception as err:
+            log(f"datagram_received(): bad packet from: {clientAddress}, error: {err}")
+            return
+        connection = self.connections.get(self.getConnectionKey(clientAddress, receivedConnectionId))
+        if connection is not None:
+            connection.handlePacket(receivedPacketType, receivedSequenceNumber, receivedData)
+        elif self.isListening:
+            self.handleHandshakePacket(clientAddress, receivedPacketType, receivedConnectionId, receivedSequenceNumber,
+                                       receivedData)
+
+
+    # ----------------------------------------------------------------------------- #
+    # handles a packet of an unknown connection without keeping any state: a SYN   #
+    # is answered with a SYN cookie, an ACK that returns a valid cookie creates the #
+    # connection (see RUDPSocket.handleHandshakePacket)                             #
+    # ----------------------------------------------------------------------------- #
+    def handleHandshakePacket(self, clientAddress, packetType, connectionId, sequenceNumber, data):
+        if packetType == PACKET_TYPE_SYN:
+            # token bucket, answer up to MAX_SYN_REPLY_RATE SYNs per second
+            currentTime = time.time()
+            self.synReplyTokens = min(self.synReplyTokens + (currentTime - self.lastSynReplyTime) * MAX_SYN_REPLY_RATE,
+                                      MAX_SYN_REPLY_RATE)
+            self.lastSynReplyTime = currentTime
+            if self.synReplyTokens < 1:
+                return
+            self.synReplyTokens = self.synReplyTokens - 1
+            synCookie = makeSynCookie(clientAddress, connectionId, sequenceNumber, getSynCookieTimeSlot())
+            self.transport.sendto(buildPacket(PACKET_TYPE_SYN, connectionId, synCookie, b''), clientAddress)
+        elif packetType == PACKET_TYPE_ACK and len(data) >= SYN_COOKIE_ECHO.size:
+            synSequenceNumber, handshakeRttMicroseconds = SYN_COOKIE_ECHO.unpack_from(data)
+            if not isValidSynCookie(sequenceNumber, clientAddress, connectionId, synSequenceNumber) \
+                    or self.acceptQueue.full():
+                log(f"handleHandshakePacket(): invalid SYN cookie or full backlog, ignoring: {clientAddress}")
+                return
+            # our SYN (the cookie) was acknowledged by this ACK, the client SYN it repeats is handled as usual
+            connection = AsyncRUDPConnection(self, clientAddress, connectionId, self.congestionControlAlgorithm)
+            connection.sequenceNumber = sequenceNumber
+            connection.isConnected = True
+            connection.connectedEvent.set()
+            if handshakeRttMicroseconds > 0:
+                connection.rttEstimator.addSample(handshakeRttMicroseconds / 1000000)
+            self.connections[self.getConnectionKey(clientAddress, connectionId)] = connection
+            connection.handlePacket(PACKET_TYPE_SYN, synSequenceNumber, data[SYN_COOKIE_ECHO.size:])
+            self.acceptQueue.put_nowait(connection)
+
+
+    def error_received(self, err):
+        log(f"error_received(): {err}")
+
+
+    def connection_lost(self, err):
+        for connection in list(self.connections.values()):
+            connection.isConnected = False
+            connection.close()
+
+
+    def getConnectionKey(self, clientAddress, connectionId):
+        # a client talks to a single server, and the server may answer from an address that looks different from
+        # the one we sent to (host name vs. ip), so a client finds its connection by connection id only
+        if self.isListening:
+            return clientAddress, connectionId
+        return connectionId
+
+
+    def addConnection(self, connection):
+        self.connections[self.getConnectionKey(connection.receiverAddress, connection.connectionId)] = connection
+
+
+    def removeConnection(self, connection):
+        self.connections.pop(self.getConnectionKey(connection.receiverAddress, connection.connectionId), None)
+        # a client endpoint exists only for its single connection
+        if not self.isListening and self.transport is not None:
+            self.transport.close()
+
+
+    # ------------------------------------------------------------------------ #
+    # waits for the next new connection (server endpoints only)               #
+    # ------------------------------------------------------------------------ #
+    async def accept(self):
+        return await self.acceptQueue.get()
+
+
+    # ----------------------------------------------------------------- #
+    # closes all the connections of this endpoint and its transport     #
+    # ----------------------------------------------------------------- #
+    def close(self):
+        for connection in list(self.connections.values()):
+            connection.close()
+        self.transport.close()
+
+
+# ---------------------------------------------------------------------------- #
+# opens an RUDP connection to the received (host, port) address and returns   #
+# once the handshake is done                                                  #
+# ---------------------------------------------------------------------------- #
+async def openConnection(address, congestionControlAlgorithm=DEFAULT_CONGESTION_CONTROL):
+    loop = asyncio.get_running_loop()
+    transport, protocol = await loop.create_datagram_endpoint(
+        lambda: RUDPDatagramProtocol(False, congestionControlAlgorithm),
+        local_addr=('0.0.0.0', 0), family=socket.AF_INET)
+    connection = AsyncRUDPConnection(protocol, address, random.randint(1, MAX_CONNECTION_ID), congestionControlAlgorithm)
+    protocol.addConnection(connection)
+    connection.sendReliablePacket(PACKET_TYPE_SYN, b'')
+    connection.synSequenceNumber = connection.sequenceNumber
+    await asyncio.wait_for(connection.connectedEvent.wait(), SOCKET_MAX_TIMEOUT)
+    return connection
+
+
+# ------------------------------------------------------------------------------ #
+# binds an RUDP server endpoint to the received (host, port) address, call       #
+# await server.accept() to get the connections of new clients                    #
+# ------------------------------------------------------------------------------ #
+async def listen(address, congestionControlAlgorithm=DEFAULT_CONGESTION_CONTROL):
+    loop = asyncio.get_running_loop()
+    transport, protocol = await loop.create_datagram_endpoint(
+        lambda: RUDPDatagramProtocol(True, congestionControlAlgorithm), local_addr=address, family=socket.AF_INET)
+    return protocol
@@ -0,0 +1,572 @@
+import gc
+import hashlib
+import multiprocessing
+import os
+import random
+import socket
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from rudp_socket import RUDPSocket, buildPacket, parsePacket, buildSynCookieEcho, PACKET_TYPE_DATA, \
+    MAX_PAYLOAD_LENGTH, SEQUENCE_NUMBER_SPACE, PACKET_TYPE_SYN, PACKET_TYPE_ACK, MAX_CONNECTION_ID, \
+    DEFAULT_MAX_PACKET_SIZE, SYN_PAYLOAD, MAX_SYN_REPLY_RATE, MTU
+
+# the memory of the process is reported only where the resource module exists (not on windows)
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+# the wrap check starts this number of packets before the end of the sequence space
+WRAP_START_PACKETS = 3000
+
+# the seconds the connect check delays every packet the listening socket sends, so a round trip takes about that
+# long and the connect time counts the round trips of the handshake
+CONNECT_CHECK_DELAY = 0.05
+
+# the flood benchmark sends its packets from this number of udp sockets (so from as many source ports)
+FLOOD_SOCKETS = 64
+
+# the packet types of the flood, half of its packets are SYNs of connections that never finish the handshake
+FLOOD_PACKET_TYPES = (PACKET_TYPE_SYN, PACKET_TYPE_SYN, PACKET_TYPE_DATA, PACKET_TYPE_ACK)
+
+# the flood pauses for a millisecond after every this number of packets, so it doesn't only overflow the kernel buffer
+FLOOD_BURST_PACKETS = 200
+
+# the memory and echo benchmarks open their connections in batches of this number of handshakes, and wait between
+# the batches so the listening socket can answer all of them (it answers up to MAX_SYN_REPLY_RATE SYNs per second)
+HANDSHAKE_BATCH = 100
+
+# the number of threads the echo benchmark runs its echoes in (all the connections stay open the whole time)
+ECHO_WORKERS = 100
+
+
+# ------------------------------------------------------------------------------ #
+# opens a connected pair of RUDP sockets on the loopback interface, returns the  #
+# listening socket, the connecting socket and the connection it was accepted as, #
+# the connecting socket starts at firstSequenceNumber if it is given             #
+# ------------------------------------------------------------------------------ #
+def openConnectionPair(firstSequenceNumber=None, **socketOptions):
+    listeningSocket = RUDPSocket(**socketOptions)
+    listeningSocket.listen(('127.0.0.1', 0))
+    acceptedConnections = []
+    acceptThread = threading.Thread(target=lambda: acceptedConnections.append(listeningSocket.accept()))
+    acceptThread.start()
+    connectingSocket = RUDPSocket(**socketOptions)
+    if firstSequenceNumber is not None:
+        connectingSocket.sequenceNumber = firstSequenceNumber
+    connectingSocket.connect(listeningSocket.rudpSocket.getsockname())
+    acceptThread.join()
+    return listeningSocket, connectingSocket, acceptedConnections[0]
+
+
+# ------------------------------------------------------------------------------ #
+# reads exactly numberOfBytes from the RUDP connection (a single receive() may   #
+# return only a part of a message), returns None if the connection was closed    #
+# ------------------------------------------------------------------------------ #
+def receiveExactly(rudpConnection, numberOfBytes):
+    receivedData = bytearray()
+    while len(receivedData) < numberOfBytes:
+        dataChunk = rudpConnection.receive(numberOfBytes - len(receivedData))
+        if not dataChunk:
+            return None
+        receivedData += dataChunk
+    return receivedData
+
+
+# ------------------------------------------------------------------------------ #
+# measures the round trip of an echo over loopback (send a message and receive   #
+# it back) for small and big messages, a sender that waits for ACKs by polling   #
+# shows up here: python rudp_benchmark.py latency [rounds]                       #
+# ------------------------------------------------------------------------------ #
+def runLatencyBenchmark(numberOfRounds):
+    for messageLength in (64, 200000):
+        listeningSocket, connectingSocket, acceptedConnection = openConnectionPair()
+
+        # the other side sends every message it receives back
+        def echoMessages():
+            for roundNumber in range(numberOfRounds):
+                acceptedConnection.send(receiveExactly(acceptedConnection, messageLength))
+        echoThread = threading.Thread(target=echoMessages)
+        echoThread.start()
+
+        message = bytes(range(256)) * (messageLength // 256) + bytes(messageLength % 256)
+        roundTripTimes = []
+        for roundNumber in range(numberOfRounds):
+            startTime = time.perf_counter()
+            connectingSocket.send(message)
+            isEchoed = receiveExactly(connectingSocket, messageLength) == message
+            roundTripTimes.append(time.perf_counter() - startTime)
+            if not isEchoed:
+                print(f"{messageLength} byte messages: the echo is CORRUPTED")
+                break
+        echoThread.join()
+        connectingSocket.close()
+        acceptedConnection.close()
+        listeningSocket.close()
+        print(f"{messageLength} byte messages: echo round trip median "
+              f"{statistics.median(roundTripTimes) * 1000:.2f} ms over {len(roundTripTimes)} rounds")
+    runConnectCheck(max(numberOfRounds // 10, 3))
+
+
+# ------------------------------------------------------------------------------ #
+# wraps the udp socket of a listening RUDP socket and sends every packet after   #
+# delay seconds, so each round trip with the listener takes at least that long   #
+# ------------------------------------------------------------------------------ #
+class DelayedSocket:
+    def __init__(self, udpSocket, delay):
+        self.udpSocket = udpSocket
+        self.delay = delay
+
+
+    def sendto(self, packet, address):
+        threading.Timer(self.delay, self.udpSocket.sendto, (bytes(packet), address)).start()
+        return len(packet)
+
+
+    # everything else (receiving, options, close) goes to the real udp socket
+    def __getattr__(self, attributeName):
+        return getattr(self.udpSocket, attributeName)
+
+
+# ------------------------------------------------------------------------------ #
+# checks the handshake takes a single round trip: the listener sends every       #
+# packet CONNECT_CHECK_DELAY seconds late and the time from connect() until      #
+# send() may move data is counted in those round trips                           #
+# ------------------------------------------------------------------------------ #
+def runConnectCheck(numberOfRounds):
+    listeningSocket = RUDPSocket()
+    listeningSocket.listen(('127.0.0.1', 0))
+    listeningAddress = listeningSocket.rudpSocket.getsockname()
+    listeningSocket.rudpSocket = DelayedSocket(listeningSocket.rudpSocket, CONNECT_CHECK_DELAY)
+
+    connectTimes = []
+    for roundNumber in range(numberOfRounds):
+        connectingSocket = RUDPSocket()
+        startTime = time.perf_counter()
+        connectingSocket.connect(listeningAddress)
+        connectingSocket.waitForConnection()
+        connectTimes.append(time.perf_counter() - startTime)
+        acceptedConnection = listeningSocket.accept()
+        connectingSocket.close()
+        acceptedConnection.close()
+    listeningSocket.close()
+
+    roundTrips = statistics.median(connectTimes) / CONNECT_CHECK_DELAY
+    print(f"connect: median {statistics.median(connectTimes) * 1000:.1f} ms over {numberOfRounds} rounds with "
+          f"{CONNECT_CHECK_DELAY * 1000:.0f} ms round trips, {roundTrips:.1f} round trips"
+          f"{'' if roundTrips < 1.5 else ' (MORE than one round trip before send() can move data)'}")
+
+
+# -------------------------------------------------------------------------------- #
+# measures the per-packet cost of the packet header code: building a DATA packet,  #
+# parsing it, and sending it on the udp socket with sendRUDPPacket (to a loopback  #
+# socket nobody reads): python rudp_benchmark.py packets [packets]                 #
+# -------------------------------------------------------------------------------- #
+def runPacketBenchmark(numberOfPackets):
+    payload = bytes(range(256)) * (MAX_PAYLOAD_LENGTH // 256) + bytes(MAX_PAYLOAD_LENGTH % 256)
+    rudpPacket = buildPacket(PACKET_TYPE_DATA, 1, 1, payload)
+
+    # the packets are sent to a udp socket that never reads them, the kernel drops them once its buffer is full
+    sinkSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sinkSocket.bind(('127.0.0.1', 0))
+    sendingSocket = RUDPSocket()
+    sendingSocket.rudpSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sendingSocket.receiverAddress = sinkSocket.getsockname()
+    sendingSocket.connectionId = 1
+
+    packetActions = (
+        ('encode', lambda sequenceNumber: buildPacket(PACKET_TYPE_DATA, 1, sequenceNumber, payload)),
+        ('decode', lambda sequenceNumber: parsePacket(rudpPacket)),
+        ('send', lambda sequenceNumber: sendingSocket.sendRUDPPacket(PACKET_TYPE_DATA, sequenceNumber, payload)),
+    )
+    for actionName, packetAction in packetActions:
+        # the best of 5 runs, so a run the scheduler interrupted doesn't count
+        bestTime = None
+        for runNumber in range(5):
+            startTime = time.perf_counter()
+            for sequenceNumber in range(numberOfPackets):
+                packetAction(sequenceNumber)
+            runTime = time.perf_counter() - startTime
+            bestTime = runTime if bestTime is None else min(bestTime, runTime)
+        print(f"{actionName}: {numberOfPackets / bestTime / 1000000:.2f} M packets/s, "
+              f"{bestTime / numberOfPackets * 1000000:.2f} us per packet ({len(payload)} byte payload)")
+    sendingSocket.rudpSocket.close()
+    sinkSocket.close()
+
+
+# ------------------------------------------------------------------------------ #
+# wraps the udp socket of an RUDP connection and drops the packets it sends with #
+# the Gilbert-Elliott burst loss model: in the bad state every packet is lost,   #
+# a burst lasts 1 / BURST_END_PROBABILITY packets on average and the bursts are  #
+# started so that lossRate of all the packets are lost                           #
+# ------------------------------------------------------------------------------ #
+class BurstLossSocket:
+    # the probability a burst ends after each lost packet (a mean burst of 5 packets)
+    BURST_END_PROBABILITY = 0.2
+
+    def __init__(self, udpSocket, lossRate):
+        self.udpSocket = udpSocket
+        self.burstStartProbability = lossRate * self.BURST_END_PROBABILITY / (1 - lossRate)
+        self.isInBurst = False
+
+
+    def sendto(self, packet, address):
+        if self.isInBurst:
+            self.isInBurst = random.random() >= self.BURST_END_PROBABILITY
+        else:
+            self.isInBurst = random.random() < self.burstStartProbability
+        if self.isInBurst:
+            return len(packet)
+        return self.udpSocket.sendto(packet, address)
+
+
+    # everything else (receiving, options, close) goes to the real udp socket
+    def __getattr__(self, attributeName):
+        return getattr(self.udpSocket, attributeName)
+
+
+# ------------------------------------------------------------------------------ #
+# measures the goodput of a transfer over loopback with burst loss on the data   #
+# and on the ACKs, where the pacing and the congestion control show up:          #
+# python rudp_benchmark.py goodput [sizeInMegabytes] [runs]                      #
+# ------------------------------------------------------------------------------ #
+def runGoodputBenchmark(sizeInMegabytes, numberOfRuns):
+    benchmarkData = bytes(range(256)) * (sizeInMegabytes * 1024 * 4)
+    for lossRate in (0, 0.01, 0.03):
+        goodputs = []
+        for runNumber in range(numberOfRuns):
+            listeningSocket, connectingSocket, acceptedConnection = openConnectionPair()
+            # the loss starts after the handshake, both directions lose packets
+            connectingSocket.rudpSocket = BurstLossSocket(connectingSocket.rudpSocket, lossRate)
+            acceptedConnection.rudpSocket = BurstLossSocket(acceptedConnection.rudpSocket, lossRate)
+
+            receivedResult = []
+            receiverThread = threading.Thread(
+                target=lambda: receivedResult.append(receiveExactly(acceptedConnection, len(benchmarkData))))
+            receiverThread.start()
+            startTime = time.perf_counter()
+            try:
+                connectingSocket.send(benchmarkData)
+            except Exception as err:
+                # a failed run is reported and left out of the median (closing the connection ends the receiver)
+                print(f"{lossRate:.0%} burst loss: run {runNumber + 1} failed: {err}")
+                connectingSocket.close()
+            receiverThread.join()
+            elapsedTime = time.perf_counter() - startTime
+            connectingSocket.close()
+            acceptedConnection.close()
+            listeningSocket.close()
+            if receivedResult[0] is None:
+                continue
+            if receivedResult[0] != benchmarkData:
+                print(f"{lossRate:.0%} burst loss: the data is CORRUPTED")
+                return
+            goodputs.append(len(benchmarkData) / 1024 / 1024 / elapsedTime)
+        if goodputs:
+            print(f"{lossRate:.0%} burst loss: {sizeInMegabytes} MB median goodput "
+                  f"{statistics.median(goodputs):.2f} MB/s over {len(goodputs)} runs")
+
+
+# ------------------------------------------------------------------------------ #
+# checks a stream through the sequence number wrap: the sending side starts      #
+# WRAP_START_PACKETS packets before the end of the sequence space and the MD5 of #
+# everything received is compared with the MD5 of everything sent, the loss      #
+# makes retransmissions and SACKs cross the wrap too:                            #
+# python rudp_benchmark.py wrap [sizeInMegabytes] [lossRate]                     #
+# ------------------------------------------------------------------------------ #
+def runWrapCheck(sizeInMegabytes, lossRate):
+    listeningSocket, connectingSocket, acceptedConnection = openConnectionPair(
+        SEQUENCE_NUMBER_SPACE - WRAP_START_PACKETS)
+    if lossRate > 0:
+        connectingSocket.rudpSocket = BurstLossSocket(connectingSocket.rudpSocket, lossRate)
+        acceptedConnection.rudpSocket = BurstLossSocket(acceptedConnection.rudpSocket, lossRate)
+
+    # every megabyte is different, so data delivered in the wrong place changes the MD5
+    megabyteBlocks = [bytes([blockNumber % 256]) + bytes(range(256)) * 4096 for blockNumber in range(16)]
+    receivedResult = []
+    def receiveAll():
+        receivedHash = hashlib.md5()
+        receivedLength = 0
+        for dataChunk in acceptedConnection:
+            receivedHash.update(dataChunk)
+            receivedLength = receivedLength + len(dataChunk)
+            if receivedLength >= sizeInMegabytes * len(megabyteBlocks[0]):
+                break
+        receivedResult.append((receivedLength, receivedHash.hexdigest()))
+    receiverThread = threading.Thread(target=receiveAll)
+    receiverThread.start()
+
+    sentHash = hashlib.md5()
+    startTime = time.perf_counter()
+    try:
+        for megabyteNumber in range(sizeInMegabytes):
+            megabyteBlock = megabyteBlocks[megabyteNumber % len(megabyteBlocks)]
+            connectingSocket.send(megabyteBlock)
+            sentHash.update(megabyteBlock)
+    except Exception as err:
+        print(f"the stream failed at the sequence number {connectingSocket.sequenceNumber}: {err}")
+        connectingSocket.close()
+    receiverThread.join()
+    elapsedTime = time.perf_counter() - startTime
+    lastSequenceNumber = connectingSocket.sequenceNumber
+    connectingSocket.close()
+    acceptedConnection.close()
+    listeningSocket.close()
+
+    receivedLength, receivedHash = receivedResult[0]
+    isWrapped = lastSequenceNumber < SEQUENCE_NUMBER_SPACE - WRAP_START_PACKETS
+    print(f"{receivedLength / 1024 / 1024:.1f} MB in {elapsedTime:.2f}s with {lossRate:.0%} burst loss, "
+          f"{'through' if isWrapped else 'NOT through'} the sequence number wrap, "
+          f"data {'OK' if receivedHash == sentHash.hexdigest() else 'CORRUPTED'}")
+
+
+# ------------------------------------------------------------------------------ #
+# the flood of the flood benchmark, runs in its own process: sends packets of    #
+# random connection ids and sequence numbers (stray or spoofed handshakes) to    #
+# the listening address                                                          #
+# ------------------------------------------------------------------------------ #
+def sendFloodPackets(listeningAddress, numberOfPackets):
+    floodSockets = [socket.socket(socket.AF_INET, socket.SOCK_DGRAM) for socketNumber in range(FLOOD_SOCKETS)]
+    for packetNumber in range(numberOfPackets):
+        packetType = random.choice(FLOOD_PACKET_TYPES)
+        if packetType == PACKET_TYPE_ACK:
+            packetData = os.urandom(8)
+        else:
+            packetData = DEFAULT_MAX_PACKET_SIZE.to_bytes(4, 'big')
+        floodPacket = buildPacket(packetType, random.randint(1, MAX_CONNECTION_ID), random.getrandbits(32), packetData)
+        floodSockets[packetNumber % FLOOD_SOCKETS].sendto(floodPacket, listeningAddress)
+        if packetNumber % FLOOD_BURST_PACKETS == 0:
+            time.sleep(0.001)
+    for floodSocket in floodSockets:
+        floodSocket.close()
+
+
+# ------------------------------------------------------------------------------ #
+# measures what a flood of stray handshake packets costs a listening socket: it  #
+# counts the connections the listener accepted and its memory while real         #
+# clients connect and send 10 KB each during the flood:                          #
+# python rudp_benchmark.py flood [packets] [clients]                             #
+# ------------------------------------------------------------------------------ #
+def runFloodBenchmark(numberOfPackets, numberOfClients):
+    listeningSocket = RUDPSocket()
+    listeningSocket.listen(('127.0.0.1', 0))
+    listeningAddress = listeningSocket.rudpSocket.getsockname()
+
+    acceptedConnections = []
+    def acceptAll():
+        while True:
+            try:
+                acceptedConnections.append(listeningSocket.accept())
+            except Exception:
+                # the listening socket was closed
+                return
+    threading.Thread(target=acceptAll, daemon=True).start()
+
+    # the flood runs in its own process, so it is as fast as a flood from another host
+    floodProcess = multiprocessing.get_context('spawn').Process(target=sendFloodPackets,
+                                                                args=(listeningAddress, numberOfPackets))
+    startTime = time.perf_counter()
+    floodProcess.start()
+
+    clientResults = []
+    def connectClient():
+        try:
+            clientSocket = RUDPSocket()
+            clientSocket.connect(listeningAddress)
+            clientSocket.send(bytes(10000))
+            clientSocket.close()
+            clientResults.append(True)
+        except Exception as err:
+            clientResults.append(err)
+    clientThreads = [threading.Thread(target=connectClient) for clientNumber in range(numberOfClients)]
+    for clientThread in clientThreads:
+        clientThread.start()
+        time.sleep(0.02)
+    for clientThread in clientThreads:
+        clientThread.join()
+    floodProcess.join()
+    elapsedTime = time.perf_counter() - startTime
+
+    completedClients = sum(1 for clientResult in clientResults if clientResult is True)
+    memoryReport = ''
+    if resource is not None:
+        # ru_maxrss is in kilobytes on linux
+        memoryReport = f", {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024} MB max RSS"
+    print(f"{numberOfPackets} flood packets: {completedClients}/{numberOfClients} clients completed in "
+          f"{elapsedTime:.1f}s, {len(acceptedConnections)} accepted sockets{memoryReport}")
+    listeningSocket.close()
+
+
+# ------------------------------------------------------------------------------ #
+# accepts the connections of the listening socket in a thread until it is        #
+# closed, returns the dictionary it keeps them in by (client port, connection id) #
+# ------------------------------------------------------------------------------ #
+def acceptInBackground(listeningSocket):
+    acceptedConnections = {}
+    def acceptAll():
+        while True:
+            try:
+                acceptedConnection = listeningSocket.accept()
+            except Exception:
+                # the listening socket was closed
+                return
+            acceptedConnections[(acceptedConnection.receiverAddress[1], acceptedConnection.connectionId)] = \
+                acceptedConnection
+    threading.Thread(target=acceptAll, daemon=True).start()
+    return acceptedConnections
+
+
+# ------------------------------------------------------------------------------ #
+# opens numberOfConnections connections on the listening socket with the raw     #
+# packets of the handshake (a SYN, then the ACK that returns the cookie of the   #
+# listener SYN) from one udp socket, a connection id per connection, so nothing  #
+# but the accepted connections costs memory                                      #
+# ------------------------------------------------------------------------------ #
+def openRawConnections(listeningAddress, numberOfConnections):
+    rawSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    rawSocket.settimeout(1)
+    # the SYNs offer no packets bigger than MTU, so the accepted connections don't probe the path MTU (nobody would
+    # answer the probes)
+    synPayload = SYN_PAYLOAD.pack(MTU, 0)
+    nextConnectionId = 1
+    openedConnections = 0
+    while openedConnections < numberOfConnections:
+        synPackets = {}
+        for connectionId in range(nextConnectionId, nextConnectionId + min(HANDSHAKE_BATCH,
+                                                                         numberOfConnections - openedConnections)):
+            synPackets[connectionId] = buildPacket(PACKET_TYPE_SYN, connectionId, 1, synPayload)
+            rawSocket.sendto(synPackets[connectionId], listeningAddress)
+        nextConnectionId = nextConnectionId + len(synPackets)
+        try:
+            while synPackets:
+                packetType, connectionId, sequenceNumber, dataLength, data = parsePacket(rawSocket.recv(65536))
+                if packetType == PACKET_TYPE_SYN and connectionId in synPackets:
+                    synCookieEcho = buildSynCookieEcho(1, 0, synPackets.pop(connectionId))
+                    rawSocket.sendto(buildPacket(PACKET_TYPE_ACK, connectionId, sequenceNumber, synCookieEcho),
+                                     listeningAddress)
+                    openedConnections = openedConnections + 1
+        except socket.timeout:
+            # the SYNs the listener had no time to answer are sent again with new connection ids
+            pass
+        time.sleep(HANDSHAKE_BATCH / MAX_SYN_REPLY_RATE)
+    return rawSocket
+
+
+# ------------------------------------------------------------------------------ #
+# measures the memory of an idle accepted connection: opens numberOfConnections  #
+# connections on one listening socket and reports the memory tracemalloc saw     #
+# them take: python rudp_benchmark.py memory [connections]                      #
+# ------------------------------------------------------------------------------ #
+def runMemoryBenchmark(numberOfConnections):
+    listeningSocket = RUDPSocket()
+    listeningSocket.listen(('127.0.0.1', 0))
+    acceptedConnections = acceptInBackground(listeningSocket)
+
+    tracemalloc.start()
+    gc.collect()
+    memoryBefore = tracemalloc.get_traced_memory()[0]
+    rawSocket = openRawConnections(listeningSocket.rudpSocket.getsockname(), numberOfConnections)
+    waitEndTime = time.time() + 10
+    while len(acceptedConnections) < numberOfConnections and time.time() < waitEndTime:
+        time.sleep(0.1)
+    gc.collect()
+    memoryAfter = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    print(f"{len(acceptedConnections)}/{numberOfConnections} idle connections accepted: "
+          f"{(memoryAfter - memoryBefore) // max(len(acceptedConnections), 1):,} bytes per connection (tracemalloc), "
+          f"{(memoryAfter - memoryBefore) / 1024 / 1024:.1f} MB in all")
+    rawSocket.close()
+    listeningSocket.close()
+
+
+# ------------------------------------------------------------------------------ #
+# checks numberOfConnections connections at once on one listening socket: they   #
+# are all opened first and stay open, then every connection sends payloadLength  #
+# random bytes, the accepted side echoes them and the SHA-1 of the echo is        #
+# compared with the SHA-1 of what was sent, a packet of one connection that      #
+# reaches another one shows up as a wrong echo:                                  #
+# python rudp_benchmark.py echo [connections] [payloadLength]                    #
+# ------------------------------------------------------------------------------ #
+def runEchoCheck(numberOfConnections, payloadLength):
+    listeningSocket = RUDPSocket()
+    listeningSocket.listen(('127.0.0.1', 0))
+    listeningAddress = listeningSocket.rudpSocket.getsockname()
+    acceptedConnections = acceptInBackground(listeningSocket)
+
+    startTime = time.perf_counter()
+    connectingSockets = []
+    for connectionNumber in range(numberOfConnections):
+        connectingSocket = RUDPSocket()
+        connectingSocket.connect(listeningAddress)
+        connectingSockets.append(connectingSocket)
+        if connectionNumber % HANDSHAKE_BATCH == HANDSHAKE_BATCH - 1:
+            time.sleep(HANDSHAKE_BATCH / MAX_SYN_REPLY_RATE)
+    for connectingSocket in connectingSockets:
+        connectingSocket.waitForConnection()
+    waitEndTime = time.time() + 30
+    while len(acceptedConnections) < numberOfConnections and time.time() < waitEndTime:
+        time.sleep(0.1)
+    connectTime = time.perf_counter() - startTime
+    print(f"{len(acceptedConnections)}/{numberOfConnections} connections open at once in {connectTime:.1f}s")
+
+    # every echo plays both sides: the connecting socket sends, the accepted connection echoes it back
+    def echoOnConnection(connectingSocket):
+        try:
+            payload = os.urandom(payloadLength)
+            connectingSocket.send(payload)
+            acceptedConnection = acceptedConnections[(connectingSocket.rudpSocket.getsockname()[1],
+                                                      connectingSocket.connectionId)]
+            acceptedConnection.send(receiveExactly(acceptedConnection, payloadLength))
+            echoedPayload = receiveExactly(connectingSocket, payloadLength)
+            return echoedPayload is not None and hashlib.sha1(echoedPayload).digest() == hashlib.sha1(payload).digest()
+        except Exception as err:
+            print(f"connection {connectingSocket.connectionId}: the echo failed: {err}")
+            return False
+
+    startTime = time.perf_counter()
+    with ThreadPoolExecutor(ECHO_WORKERS) as echoExecutor:
+        echoResults = list(echoExecutor.map(echoOnConnection, connectingSockets))
+    echoTime = time.perf_counter() - startTime
+
+    memoryReport = ''
+    if resource is not None:
+        # ru_maxrss is in kilobytes on linux
+        memoryReport = f", {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024} MB max RSS"
+    print(f"{numberOfConnections} connections x {payloadLength} bytes: {echoResults.count(True)} echoes OK, "
+          f"{echoResults.count(False)} FAILED in {echoTime:.1f}s{memoryReport}")
+    for connectingSocket in connectingSockets:
+        connectingSocket.close()
+    listeningSocket.close()
+
+
+# the benchmarks this script runs, by the name given on the command line
+BENCHMARKS = {
+    'latency': lambda arguments: runLatencyBenchmark(int(arguments[0]) if arguments else 100),
+    'packets': lambda arguments: runPacketBenchmark(int(arguments[0]) if arguments else 200000),
+    'goodput': lambda arguments: runGoodputBenchmark(int(arguments[0]) if len(arguments) > 0 else 3,
+                                                     int(arguments[1]) if len(arguments) > 1 else 5),
+    'wrap': lambda arguments: runWrapCheck(int(arguments[0]) if len(arguments) > 0 else 20,
+                                           float(arguments[1]) if len(arguments) > 1 else 0.0),
+    'flood': lambda arguments: runFloodBenchmark(int(arguments[0]) if len(arguments) > 0 else 50000,
+                                                 int(arguments[1]) if len(arguments) > 1 else 20),
+    'memory': lambda arguments: runMemoryBenchmark(int(arguments[0]) if arguments else 10000),
+    'echo': lambda arguments: runEchoCheck(int(arguments[0]) if len(arguments) > 0 else 10000,
+                                           int(arguments[1]) if len(arguments) > 1 else 10000),
+}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        print(f"usage: python rudp_benchmark.py {'|'.join(BENCHMARKS)} [arguments]")
+        sys.exit(1)
+    BENCHMARKS[sys.argv[1]](sys.argv[2:])
+    # the RUDP reader threads notice the closed udp sockets only after SOCKET_MAX_TIMEOUT, the benchmark is done so
+    # end the process now instead of waiting for them
+    sys.stdout.flush()
+    os._exit(0)
@@ -0,0 +1,251 @@
+import time
+
+
+# the retransmission timeout used before the first RTT sample was measured (RFC 6298)
+INITIAL_RTO = 1.0 # 1 second
+
+# the retransmission timeout will never be lower than this number of seconds
+MIN_RTO = 0.2 # 200 ms
+
+# the retransmission timeout will never be higher than this number of seconds (even after backoff)
+MAX_RTO = 10.0 # 10 seconds
+
+# the weight of a new RTT sample in the smoothed RTT (alpha in RFC 6298)
+RTT_ALPHA = 0.125
+
+# the weight of a new RTT deviation in the RTT variance (beta in RFC 6298)
+RTT_BETA = 0.25
+
+# the clock granularity added to the RTO calculation, in seconds
+CLOCK_GRANULARITY = 0.001 # 1 ms
+
+# the congestion window (in packets) a new connection starts with
+INITIAL_WINDOW_SIZE = 2
+
+# the congestion window (in packets) will never be lower than this number
+MIN_WINDOW_SIZE = 1
+
+# maximum window size (max simultaneously send packets)
+MAX_WINDOW_SIZE = 1024
+
+# the slow start threshold a new connection starts with, slow start ends once the window reaches it
+INITIAL_SLOW_START_THRESHOLD = MAX_WINDOW_SIZE
+
+# CUBIC scaling constant (C in RFC 8312)
+CUBIC_C = 0.4
+
+# CUBIC multiplicative window decrease factor (beta_cubic in RFC 8312)
+CUBIC_BETA = 0.7
+
+# the pacing rate is the congestion window sent over one smoothed RTT times this gain, in slow start the window
+# doubles every round trip so the sender must be allowed to send faster than the current window (like linux TCP)
+PACING_GAIN_SLOW_START = 2.0
+
+# the pacing gain in congestion avoidance, a little above one window per RTT so the window can still grow
+PACING_GAIN = 1.2
+
+# the congestion control algorithm used by a socket that did not ask for a specific one
+DEFAULT_CONGESTION_CONTROL = 'cubic'
+
+
+# ------------------------------------------------------------------------------ #
+# keeps the smoothed round trip time (SRTT) and its variance (RTTVAR) of a socket #
+# and calculates the retransmission timeout (RTO) from them, based on RFC 6298   #
+# ------------------------------------------------------------------------------ #
+class RttEstimator:
+    # every connection has its own estimator, slots keep it small
+    __slots__ = ('smoothedRtt', 'rttVariance', 'retransmissionTimeout')
+
+
+    def __init__(self):
+        # the smoothed round trip time in seconds (None until the first sample)
+        self.smoothedRtt = None
+
+        # the round trip time variance in seconds
+        self.rttVariance = None
+
+        # the current retransmission timeout in seconds
+        self.retransmissionTimeout = INITIAL_RTO
+
+
+    # ------------------------------------------------------------- #
+    # adds a new round trip time sample (in seconds) and updates RTO #
+    # ------------------------------------------------------------- #
+    def addSample(self, rtt):
+        if self.smoothedRtt is None:
+            # the first sample sets the SRTT and RTTVAR directly
+            self.smoothedRtt = rtt
+            self.rttVariance = rtt / 2
+        else:
+            self.rttVariance = (1 - RTT_BETA) * self.rttVariance + RTT_BETA * abs(self.smoothedRtt - rtt)
+            self.smoothedRtt = (1 - RTT_ALPHA) * self.smoothedRtt + RTT_ALPHA * rtt
+        retransmissionTimeout = self.smoothedRtt + max(CLOCK_GRANULARITY, 4 * self.rttVariance)
+        self.retransmissionTimeout = min(max(retransmissionTimeout, MIN_RTO), MAX_RTO)
+
+
+    # ------------------------------------------------------------------ #
+    # doubles the RTO after a retransmission timeout (exponential backoff) #
+    # ------------------------------------------------------------------ #
+    def backoff(self):
+        self.retransmissionTimeout = min(self.retransmissionTimeout * 2, MAX_RTO)
+
+
+    def getRetransmissionTimeout(self):
+        return self.retransmissionTimeout
+
+
+# ---------------------------------------------------------------------------- #
+# AIMD congestion control (TCP Reno style): slow start doubles the window every #
+# round trip until ssthresh, then the window grows by one packet per round trip #
+# and a loss halves it                                                          #
+# ---------------------------------------------------------------------------- #
+class RenoCongestionControl:
+    # every connection has its own congestion control, slots keep it small
+    __slots__ = ('windowSize', 'slowStartThreshold')
+
+
+    def __init__(self):
+        # the congestion window in packets (a float so it can grow by fractions of a packet)
+        self.windowSize = INITIAL_WINDOW_SIZE
+
+        # the slow start threshold in packets
+        self.slowStartThreshold = INITIAL_SLOW_START_THRESHOLD
+
+
+    # -------------------------------------------------------- #
+    # returns the number of packets that may be sent unacked   #
+    # -------------------------------------------------------- #
+    def getWindowSize(self):
+        return int(self.windowSize)
+
+
+    # ------------------------------------------------------------------------- #
+    # returns the rate (bytes per second) the sender should spread its packets  #
+    # at, so a whole window is not sent in one burst                            #
+    # ------------------------------------------------------------------------- #
+    def getPacingRate(self, smoothedRtt, packetSize):
+        pacingGain = PACING_GAIN_SLOW_START if self.windowSize < self.slowStartThreshold else PACING_GAIN
+        return pacingGain * self.windowSize * packetSize / max(smoothedRtt, CLOCK_GRANULARITY)
+
+
+    # ---------------------------------------------------------------- #
+    # called when acknowledgedPackets new packets were acknowledged    #
+    # ---------------------------------------------------------------- #
+    def onAcknowledge(self, acknowledgedPackets):
+        if self.windowSize < self.slowStartThreshold:
+            # slow start, grow the window by one packet for each acknowledged packet
+            self.windowSize = self.windowSize + acknowledgedPackets
+        else:
+            # congestion avoidance, grow the window by about one packet every round trip
+            self.windowSize = self.windowSize + acknowledgedPackets / self.windowSize
+        self.windowSize = min(self.windowSize, MAX_WINDOW_SIZE)
+
+
+    # ------------------------------------------------------------------- #
+    # called when a packet loss was detected without a timeout (gap in the #
+    # acknowledged sequence numbers), halve the window                     #
+    # ------------------------------------------------------------------- #
+    def onPacketLoss(self):
+        self.slowStartThreshold = max(self.windowSize / 2, 2)
+        self.windowSize = self.slowStartThreshold
+
+
+    # ----------------------------------------------------------------- #
+    # called when the retransmission timer expired, restart slow start  #
+    # ----------------------------------------------------------------- #
+    def onTimeout(self):
+        self.slowStartThreshold = max(self.windowSize / 2, 2)
+        self.windowSize = MIN_WINDOW_SIZE
+
+
+# ----------------------------------------------------------------------------- #
+# CUBIC congestion control (RFC 8312): after a loss the window grows along a     #
+# cubic curve of the time since the loss, so it quickly returns to the window    #
+# it had before the loss and then probes for more bandwidth, independent of RTT #
+# ----------------------------------------------------------------------------- #
+class CubicCongestionControl(RenoCongestionControl):
+    # the slots added to the ones of RenoCongestionControl
+    __slots__ = ('lastMaxWindowSize', 'epochStartTime', 'timeToMaxWindowSize', 'renoWindowSize')
+
+
+    def __init__(self):
+        super().__init__()
+        # the window size just before the last loss (W_max in RFC 8312)
+        self.lastMaxWindowSize = 0
+
+        # the time the current congestion avoidance epoch started (None until the first ACK after a loss)
+        self.epochStartTime = None
+
+        # the time it takes the cubic function to grow back to lastMaxWindowSize (K in RFC 8312)
+        self.timeToMaxWindowSize = 0
+
+        # the window a Reno connection would have at this point (used for the TCP friendly region)
+        self.renoWindowSize = 0
+
+
+    def onAcknowledge(self, acknowledgedPackets):
+        if self.windowSize < self.slowStartThreshold:
+            # slow start is the same as Reno
+            self.windowSize = min(self.windowSize + acknowledgedPackets, MAX_WINDOW_SIZE)
+            return
+
+        currentTime = time.time()
+        if self.epochStartTime is None:
+            # first ACK since the last loss, start a new epoch from the current window
+            self.epochStartTime = currentTime
+            if self.windowSize < self.lastMaxWindowSize:
+                self.timeToMaxWindowSize = ((self.lastMaxWindowSize - self.windowSize) / CUBIC_C) ** (1 / 3)
+            else:
+                self.timeToMaxWindowSize = 0
+                self.lastMaxWindowSize = self.windowSize
+            self.renoWindowSize = self.windowSize
+
+        # the window the cubic function wants us to have at this point in time
+        timeInEpoch = currentTime - self.epochStartTime
+        cubicWindowSize = CUBIC_C * (timeInEpoch - self.timeToMaxWindowSize) ** 3 + self.lastMaxWindowSize
+
+        # never grow slower than Reno would (TCP friendly region)
+        self.renoWindowSize = self.renoWindowSize + \
+            3 * (1 - CUBIC_BETA) / (1 + CUBIC_BETA) * acknowledgedPackets / self.windowSize
+        targetWindowSize = max(cubicWindowSize, self.renoWindowSize)
+
+        if targetWindowSize > self.windowSize:
+            self.windowSize = self.windowSize + (targetWindowSize - self.windowSize) * acknowledgedPackets / self.windowSize
+        else:
+            # the window is above the curve, grow very slowly
+            self.windowSize = self.windowSize + 0.01 * acknowledgedPackets / self.windowSize
+        self.windowSize = min(self.windowSize, MAX_WINDOW_SIZE)
+
+
+    def onPacketLoss(self):
+        # fast convergence, if the window didn't reach its previous max then release bandwidth faster
+        if self.windowSize < self.lastMaxWindowSize:
+            self.lastMaxWindowSize = self.windowSize * (1 + CUBIC_BETA) / 2
+        else:
+            self.lastMaxWindowSize = self.windowSize
+        self.windowSize = max(self.windowSize * CUBIC_BETA, 2)
+        self.slowStartThreshold = self.windowSize
+        self.epochStartTime = None
+
+
+    def onTimeout(self):
+        self.onPacketLoss()
+        self.windowSize = MIN_WINDOW_SIZE
+
+
+# the congestion control algorithms a socket can choose from by name
+CONGESTION_CONTROL_ALGORITHMS = {
+    'reno': RenoCongestionControl,
+    'cubic': CubicCongestionControl,
+}
+
+
+# ------------------------------------------------------------------------- #
+# creates a new congestion control object of the algorithm with the received #
+# name, raises ValueError if there is no such algorithm                     #
+# ------------------------------------------------------------------------- #
+def createCongestionControl(algorithmName):
+    if algorithmName not in CONGESTION_CONTROL_ALGORITHMS:
+        raise ValueError(f"Unknown congestion control algorithm: {algorithmName}, "
+                         f"supported algorithms: {', '.join(CONGESTION_CONTROL_ALGORITHMS)}")
+    return CONGESTION_CONTROL_ALGORITHMS[algorithmName]()
@@ -1,6 +1,17 @@
 import socket
+import select
+import hashlib
+import os
+import struct
+import sys
 import threading
 import time
+import queue
+import random
+import zlib
+from collections import deque
+from rudp_congestion import RttEstimator, createCongestionControl, DEFAULT_CONGESTION_CONTROL, MAX_WINDOW_SIZE
+from rudp_timer import retransmissionScheduler
 # from utils import log
 
 
@@ -8,24 +19,119 @@ def log(msg):
     return
 
 
-# maximum transmission unit, the max size of a packet
+# log every packet that is sent or received, the message of such a log line is formatted even when log() does
+# nothing, so the per-packet lines are formatted only when this is True
+isPacketLog = False
+
+
+# maximum transmission unit, the size of a packet every path and every peer supports, a socket sends packets of
+# this size until the SYN exchange and the path MTU probing allow bigger ones
 MTU = 1024
 
+# packet header: packet type field, sequence number and data length, each one a 4 bytes big-endian unsigned int
+PACKET_HEADER = struct.Struct('!III')
+
 # packet header length (12 Bytes)
-HEADER_LENGTH = 12
+HEADER_LENGTH = PACKET_HEADER.size
 
-# maximum seconds the socket can be idle before an exception is raised
-SOCKET_MAX_TIMEOUT = 60
+# maximum payload length of a single DATA packet (so header + payload fits in one MTU)
+MAX_PAYLOAD_LENGTH = MTU - HEADER_LENGTH
+
+# the max size of a UDP datagram over IPv4 (65,535 - 20 bytes IP header - 8 bytes UDP header), a socket opts into
+# very large datagrams (useful on loopback) by setting its maxPacketSize up to this size
+MAX_DATAGRAM_SIZE = 65507
+
+# the max packet size a socket proposes in its SYN by default (an ethernet frame without the IP and UDP headers)
+DEFAULT_MAX_PACKET_SIZE = 1472
+
+# the SYN payload: the max packet size the sending side can receive (4 bytes big-endian unsigned int) and the
+# options it supports (1 byte of SYN_FLAG bits), a SYN without it means the other side receives up to MTU sized
+# packets and supports no option. it may be followed by the first message of the connection (data in SYN), the
+# receiver delivers it as soon as the SYN arrives
+SYN_PAYLOAD = struct.Struct('!IB')
+
+# SYN option flag, the sending side can compress its messages with zlib and decompress the messages it receives,
+# the messages are compressed only if both sides set it
+SYN_FLAG_COMPRESSION = 1
+
+# the payload of the ACK that completes the handshake with a listening socket: the sequence number of our SYN and
+# the round trip time from our SYN to the listener SYN in microseconds (0 if it wasn't measured), each one a 4 bytes
+# big-endian unsigned int, followed by the whole SYN payload. the listening socket keeps no state for a SYN, it
+# replies with a SYN whose sequence number is a cookie, so the ACK that returns the cookie must repeat our SYN (and
+# the round trip time, the listener can't measure it without state)
+SYN_COOKIE_ECHO = struct.Struct('!II')
+
+# the max length of a first message that is sent inside the SYN (the whole SYN, and the ACK that repeats it, must
+# fit in one MTU sized packet, the bigger packet size is not negotiated yet)
+MAX_SYN_DATA_LENGTH = MTU - HEADER_LENGTH - SYN_COOKIE_ECHO.size - SYN_PAYLOAD.size
+
+# the secret key of the SYN cookies, picked at random when the process starts so the cookies can't be guessed
+SYN_COOKIE_SECRET = os.urandom(16)
+
+# seconds in a SYN cookie time slot, a cookie is valid in the time slot it was made in and in the one after it
+SYN_COOKIE_TIME_SLOT = 32 # 32 seconds
+
+# max number of new connections waiting to be returned by accept(), once it is full new handshakes are ignored (the
+# connecting side retransmits its SYN until accept() makes room, like the listen backlog of TCP)
+ACCEPT_BACKLOG = 128
 
-# if max packet loss reached (the number of packets waiting for acknowledge)
-# then wait this number of seconds between packet-send retry
-SLEEP_BETWEEN_RETRIES = 0.05 # 50 ms
+# max number of SYN replies a listening socket sends per second (it may also send this many at once), a flood of
+# SYNs costs the listener one cookie per packet and can't make it flood the network back
+MAX_SYN_REPLY_RATE = 1000
 
-# number of maximum retries to send a packet, if this number is reached, then rais exception
-MAX_SEND_RETRIES = 600 # 30 seconds
+# the first byte of every message (the data of a send() call) on a connection that negotiated compression, it tells
+# the receiver if the rest of the message is raw or zlib compressed (the first message, when it is carried by the
+# SYN, is always raw and has no such byte, compression is not negotiated yet)
+MESSAGE_HEADER_RAW = b'\x00'
+MESSAGE_HEADER_COMPRESSED = b'\x01'
+
+# the zlib compression level of the messages (6 is the zlib default, a good ratio for little CPU)
+COMPRESSION_LEVEL = 6
+
+# messages shorter than this number of bytes are sent raw, compressing them saves nothing
+MIN_COMPRESSION_LENGTH = 64
+
+# a compressed message longer than this part of the raw message means the data doesn't compress (already compressed
+# files, media), so the next COMPRESSION_BYPASS_LENGTH bytes are sent raw before compression is tried again
+COMPRESSION_BYPASS_RATIO = 0.9
+COMPRESSION_BYPASS_LENGTH = 1024 * 1024 # 1 MB
+
+# the path MTU search stops once the largest probe that got through is this close to the smallest one that didn't
+PMTU_SEARCH_PRECISION = 32
+
+# number of times a path MTU probe is sent before its size is considered too big for the path
+PMTU_PROBE_RETRIES = 3
+
+# linux IP socket option and value that set the don't fragment bit on every packet, so a packet bigger than the path
+# MTU is dropped instead of fragmented (the probes find the biggest packet that gets through), python doesn't export
+# them in the socket module
+IP_MTU_DISCOVER = 10
+IP_PMTUDISC_PROBE = 3
+
+# linux UDP socket option (UDP generic segmentation offload), sendmsg() with it sends one buffer of many packets
+# and the kernel splits it into separate datagrams of the segment size (python doesn't export it either)
+UDP_SEGMENT = 103
+
+# the segment size control message value of UDP_SEGMENT (2 bytes unsigned int in the machine byte order)
+UDP_SEGMENT_SIZE = struct.Struct('=H')
+
+# max number of packets sent with a single UDP_SEGMENT sendmsg() call (the linux limit)
+MAX_GSO_SEGMENTS = 64
+
+# the kernel send and receive buffers of the udp socket are sized to hold a whole window of packets (so a window
+# is not dropped by the kernel before we read it), but never more than this number of bytes (the kernel also
+# limits them, to net.core.rmem_max / wmem_max on linux)
+MAX_SOCKET_BUFFER_SIZE = 32 * 1024 * 1024 # 32 MB
+
+# the number of packets the sender may send back to back before pacing spreads the next ones over the RTT
+PACING_BURST_PACKETS = 16
+
+# maximum seconds the socket can be idle before an exception is raised
+SOCKET_MAX_TIMEOUT = 60
 
-# maximum window size (max simultaneously send packets)
-MAX_WINDOW_SIZE = 10
+# maximum seconds send/receive wait for the other side (for the handshake, for window space to open or for the
+# last ACK) before they give up
+MAX_WAIT_TIME = 30 # 30 seconds
 
 # RUDP packet type SYN for synchronisation between sender and receiver
 PACKET_TYPE_SYN = 0
@@ -42,362 +148,1637 @@ PACKET_TYPE_END = 3
 # RUDP packet type RST for signaling end of communication between sender and receiver
 PACKET_TYPE_RST = 4
 
+# RUDP packet type SACK for acknowledging a range of DATA/END packets with a single packet, the sequence number field
+# holds the cumulative ACK (last sequence number received in order) and the payload holds a selective ACK bitmap
+PACKET_TYPE_SACK = 5
 
-def parsePacket(receivedPacket):
-    # get the first 4 bytes and convert them into int, this will be the received packetType
-    receivedPacketType = int.from_bytes(receivedPacket[0:4], 'big')
+# RUDP packet type PROBE for path MTU probing, the sequence number field holds the probe size and the payload pads
+# the packet to that size, it is not part of the sequence space and is never retransmitted
+PACKET_TYPE_PROBE = 6
+
+# RUDP packet type PROBE_ACK for acknowledging a PROBE packet, the sequence number field holds the received size
+PACKET_TYPE_PROBE_ACK = 7
+
+# RUDP packet type FEC for forward error correction, the sequence number field holds the first sequence number of
+# a group of consecutive DATA/END packets and the payload holds their XOR parity, so the receiver can rebuild a
+# single lost packet of the group without waiting for its retransmission, it is not part of the sequence space
+PACKET_TYPE_FEC = 8
+
+# the FEC payload header: number of packets in the group (2 bytes), XOR of their packet types (1 byte) and XOR of
+# their data lengths (2 bytes), it is followed by the XOR of their data (each one padded with zeros to the longest)
+FEC_HEADER = struct.Struct('!HBH')
+
+# RUDP packet type NACK sent by the receiver as soon as it sees a gap in the sequence numbers, the sequence number
+# field holds the first missing sequence number and the payload holds the number of missing packets from it
+PACKET_TYPE_NACK = 9
+
+# the NACK payload: the number of consecutive missing packets (4 bytes big-endian unsigned int)
+NACK_PAYLOAD = struct.Struct('!I')
+
+# number of SACKs with the same cumulative ACK (that acknowledge packets after it) the sender must receive before
+# it retransmits the packet after the cumulative ACK without waiting for its timer (fast retransmit)
+DUPLICATE_ACK_THRESHOLD = 3
+
+# number of bits in the SACK bitmap, bit i acknowledges sequence number (cumulativeAck + 2 + i)
+SACK_BITMAP_BITS = 32
+
+# number of in-order packets the receiver may receive before it must send a SACK (coalesced ACKs)
+ACK_EVERY_PACKETS = 8
+
+# number of packets at the start of a connection that are acknowledged right away (quick ACK, like linux TCP), the
+# sender starts with a small congestion window that can't fill ACK_EVERY_PACKETS, so delaying their ACKs would stall
+# it for ACK_DELAY every round trip
+QUICK_ACK_PACKETS = 16
+
+# maximum seconds the receiver may delay a SACK while waiting for more packets to coalesce into it
+ACK_DELAY = 0.01 # 10 ms
+
+# the number of different sequence numbers, the whole 4 bytes sequence number field (the sequence number wraps back
+# to 0 after 4,294,967,295 [FFFFFFFF]), sequence numbers are compared with serial number arithmetic (RFC 1982)
+SEQUENCE_NUMBER_SPACE = 1 << 32
+
+# the receive window in packets, the max number of received packets (in order and out of order) the receiver keeps
+# before the caller consumes them, it must divide SEQUENCE_NUMBER_SPACE so the ring buffer slots don't shift on wrap
+RECEIVE_WINDOW_SIZE = 1024
 
-    # get the next 4 bytes and convert them into int, this will be the received sequenceNumber
-    receivedSequenceNumber = int.from_bytes(receivedPacket[4:8], 'big')
+# length of the advertised receive window field that comes after the SACK bitmap in the SACK payload
+ADVERTISED_WINDOW_LENGTH = 4
 
-    # get the next 4 bytes and convert them into int, this will be the received dataLength
-    receivedDataLength = int.from_bytes(receivedPacket[8:HEADER_LENGTH], 'big')
+# the number of events the trace ring buffer keeps by default (the oldest events are dropped once it is full)
+TRACE_BUFFER_SIZE = 100000
+
+# the first header field holds the packet type in its lowest 8 bits and the connection id in the upper 24 bits,
+# the connection id is picked by the connecting side, so many connections can share one server UDP socket
+PACKET_TYPE_BITS = 8
+
+# the max connection id (24 bits)
+MAX_CONNECTION_ID = (1 << 24) - 1
+
+
+# ---------------------------------------------------------------------------- #
+# makes the SYN cookie of a connection: a keyed hash of the client address, the #
+# connection id and the sequence number of the client SYN in a time slot, it is #
+# the sequence number of the SYN the listening socket replies with              #
+# ---------------------------------------------------------------------------- #
+def makeSynCookie(clientAddress, connectionId, synSequenceNumber, timeSlot):
+    cookieInput = f"{clientAddress[0]}:{clientAddress[1]}:{connectionId}:{synSequenceNumber}:{timeSlot}".encode()
+    return int.from_bytes(hashlib.blake2b(cookieInput, digest_size=4, key=SYN_COOKIE_SECRET).digest(), 'big')
+
+
+def getSynCookieTimeSlot():
+    return int(time.time() // SYN_COOKIE_TIME_SLOT)
+
+
+# -------------------------------------------------------------------------- #
+# checks the cookie an ACK returned, it is valid if we made it in the current #
+# time slot or in the one before it                                          #
+# -------------------------------------------------------------------------- #
+def isValidSynCookie(synCookie, clientAddress, connectionId, synSequenceNumber):
+    currentTimeSlot = getSynCookieTimeSlot()
+    return any(synCookie == makeSynCookie(clientAddress, connectionId, synSequenceNumber, timeSlot)
+               for timeSlot in (currentTimeSlot, currentTimeSlot - 1))
+
+
+# ---------------------------------------------------------------------------- #
+# builds the payload of the ACK that returns a SYN cookie, it repeats our SYN   #
+# (its sequence number and its payload) and the handshake round trip time (in  #
+# seconds) so the listening socket can create the connection from this packet #
+# ---------------------------------------------------------------------------- #
+def buildSynCookieEcho(synSequenceNumber, handshakeRtt, synPacket):
+    return SYN_COOKIE_ECHO.pack(synSequenceNumber, int(handshakeRtt * 1000000)) + bytes(synPacket[HEADER_LENGTH:])
+
+
+# ------------------------------------------------------------------------------ #
+# parses a received packet (bytes, bytearray or memoryview), the returned data is #
+# a slice of the received packet, so it must be copied if the packet buffer is    #
+# going to be reused                                                              #
+# ------------------------------------------------------------------------------ #
+def parsePacket(receivedPacket):
+    # unpack the 3 header fields (without slicing the packet), the lowest byte of the first field is the
+    # received packetType and the upper 3 bytes are the received connectionId
+    receivedPacketTypeField, receivedSequenceNumber, receivedDataLength = PACKET_HEADER.unpack_from(receivedPacket)
+    receivedPacketType = receivedPacketTypeField & ((1 << PACKET_TYPE_BITS) - 1)
+    receivedConnectionId = receivedPacketTypeField >> PACKET_TYPE_BITS
 
     # get the last bytes from end of header, read up to receivedDataLength and set it as received data
     receivedData = receivedPacket[HEADER_LENGTH:HEADER_LENGTH + receivedDataLength]
 
-    return receivedPacketType, receivedSequenceNumber, receivedDataLength, receivedData
+    return receivedPacketType, receivedConnectionId, receivedSequenceNumber, receivedDataLength, receivedData
+
+
+# ---------------------------------------------------------------------------- #
+# builds a packet: the header is packed with the precompiled PACKET_HEADER and #
+# the packet data (bytes or a memoryview slice of the caller data) is copied   #
+# only once, right after it                                                    #
+# ---------------------------------------------------------------------------- #
+def buildPacket(packetType, connectionId, packetSequenceNumber, packetData):
+    # the connection id is kept in the upper 3 bytes of the packet type field
+    return PACKET_HEADER.pack((connectionId << PACKET_TYPE_BITS) | packetType, packetSequenceNumber,
+                              len(packetData)) + packetData
+
+
+# ----------------------------------------------------------------------------- #
+# returns the sequence number that comes right after the received sequenceNumber #
+# ----------------------------------------------------------------------------- #
+def getFollowingSequenceNumber(sequenceNumber):
+    # the sequence number wraps back to 0 after the max sequence number (FFFFFFFF)
+    return (sequenceNumber + 1) % SEQUENCE_NUMBER_SPACE
+
+
+# ------------------------------------------------------------------------------ #
+# serial number comparison (RFC 1982), returns True if sequenceNumber comes after #
+# otherSequenceNumber: the sequence numbers wrap, so a number comes after another #
+# one if it is less than half the sequence space ahead of it (mod the space)     #
+# ------------------------------------------------------------------------------ #
+def isSequenceNumberAfter(sequenceNumber, otherSequenceNumber):
+    return 0 < (sequenceNumber - otherSequenceNumber) % SEQUENCE_NUMBER_SPACE < SEQUENCE_NUMBER_SPACE // 2
+
+
+# ------------------------------------------------------------------------------ #
+# builds the SACK payload: a bitmap where bit i is set if the packet with         #
+# sequence number (cumulativeAck + 2 + i) is already kept in the receive window   #
+# ring buffer (None if there is none), followed by the advertised receive window #
+# ------------------------------------------------------------------------------ #
+def buildSackPayload(cumulativeAck, receiveWindow, advertisedWindow):
+    sackBitmap = 0
+    # no ring buffer means no packet arrived out of order yet
+    for bitIndex in range(SACK_BITMAP_BITS if receiveWindow is not None else 0):
+        if receiveWindow[(cumulativeAck + 2 + bitIndex) % RECEIVE_WINDOW_SIZE] is not None:
+            sackBitmap = sackBitmap | (1 << bitIndex)
+    return sackBitmap.to_bytes(SACK_BITMAP_BITS // 8, 'big') + advertisedWindow.to_bytes(ADVERTISED_WINDOW_LENGTH, 'big')
+
+
+# ------------------------------------------------------------------------------- #
+# returns a list of all the sequence numbers acknowledged by the SACK bitmap, and #
+# the advertised receive window (None if the SACK payload doesn't have one)       #
+# ------------------------------------------------------------------------------- #
+def parseSackPayload(cumulativeAck, sackPayload):
+    sackBitmap = int.from_bytes(sackPayload[:SACK_BITMAP_BITS // 8], 'big')
+    selectivelyAcknowledged = []
+    bitIndex = 0
+    while sackBitmap:
+        if sackBitmap & 1:
+            selectivelyAcknowledged.append((cumulativeAck + 2 + bitIndex) % SEQUENCE_NUMBER_SPACE)
+        sackBitmap = sackBitmap >> 1
+        bitIndex = bitIndex + 1
+
+    # the receive window the receiver advertised comes right after the bitmap
+    advertisedWindowBytes = sackPayload[SACK_BITMAP_BITS // 8:SACK_BITMAP_BITS // 8 + ADVERTISED_WINDOW_LENGTH]
+    advertisedWindow = int.from_bytes(advertisedWindowBytes, 'big') if advertisedWindowBytes else None
+    return selectivelyAcknowledged, advertisedWindow
+
+
+# ------------------------------------------------------------------------------ #
+# returns the sequence numbers of waitingForAcknowledge that a SACK acknowledges: #
+# the packets at its front up to the cumulative ACK (the dictionary keeps the     #
+# send order, so the scan stops at the first packet after it) and the packets of  #
+# the SACK bitmap, so a SACK costs its acknowledged packets and not the window   #
+# ------------------------------------------------------------------------------ #
+def getSackAcknowledged(waitingForAcknowledge, cumulativeAck, selectivelyAcknowledged):
+    acknowledgedSequenceNumbers = []
+    for sequenceNumber in waitingForAcknowledge:
+        if isSequenceNumberAfter(sequenceNumber, cumulativeAck):
+            break
+        acknowledgedSequenceNumbers.append(sequenceNumber)
+    acknowledgedSequenceNumbers.extend(sequenceNumber for sequenceNumber in selectivelyAcknowledged
+                                       if sequenceNumber in waitingForAcknowledge)
+    return acknowledgedSequenceNumbers
 
 
 class RUDPSocket:
-    # a flag that indicates if the socket is opened and connected and has finished the handshake (sent & received SYN)
-    isConnected = False
+    # every connection keeps all of its state in these slots (there is no per instance dictionary and no mutable
+    # class attribute is shared between connections), so a server can keep thousands of connections cheaply
+    __slots__ = ('isConnected', 'isClosed', 'rudpSocket', 'receiveBuffer', 'maxPacketSize',
+                 'negotiatedPacketSize', 'packetSize', 'isPathMtuProbeStarted', 'lastProbeAckSize',
+                 'useUdpGso', 'useCompression', 'compressor', 'decompressor', 'compressionBypassLength',
+                 'isCompressedMessage', 'fecGroupSize', 'fecGroupStart', 'fecGroupCount', 'fecXorType', 'fecXorLength',
+                 'fecXorData', 'fecMaxLength', 'recentPackets', 'receiverAddress', 'connectionId',
+                 'listeningSocket', 'acceptedConnections', 'acceptedConnectionsLock', 'acceptQueue',
+                 'pendingAckConnections', 'synReplyTokens', 'lastSynReplyTime', 'receiveTimeout', 'synSequenceNumber',
+                 'sequenceNumber', 'congestionControlAlgorithm',
+                 'congestionControl', 'rttEstimator', 'waitingForAcknowledge', 'packetTransmitTimes',
+                 'retransmittedSequenceNumbers', 'lastTimeoutTime', 'pacingTokens', 'lastPacingTime',
+                 'lastPacketLossTime', 'lastCumulativeAck', 'duplicateAckCount',
+                 'waitingForAcknowledgeCondition', 'receiverWindowSize', 'nextExpectedSequenceNumber',
+                 'highestReceivedSequenceNumber', 'receiveWindow', 'receiveWindowCount', 'receivedChunks',
+                 'receivedDataCondition', 'lastAdvertisedWindow', 'pendingAckCount', 'quickAckCount', 'packetsSent',
+                 'bytesSent', 'packetsReceived', 'bytesReceived', 'retransmittedPackets', 'retransmissionTimeouts',
+                 'packetLosses', 'duplicatePackets', 'fecRecoveredPackets', 'traceEvents')
 
-    # flag indicating connection is closed
-    isClosed = False
 
-    # an event that indicates the socket has connected and is open
-    isConnectedEvent = threading.Event()
+    # ------------------------------------------------------------------------------ #
+    # init the socket with the congestion control algorithm it should use (by name), #
+    # the max packet size it proposes to the other side (up to MAX_DATAGRAM_SIZE for #
+    # very large datagrams), if it should send DATA packets with UDP GSO, the number #
+    # of packets protected by each FEC parity packet (0 turns FEC off) and if it     #
+    # offers the other side to compress the messages                                #
+    # ------------------------------------------------------------------------------ #
+    def __init__(self, congestionControlAlgorithm=DEFAULT_CONGESTION_CONTROL, maxPacketSize=DEFAULT_MAX_PACKET_SIZE,
+                 useUdpGso=False, fecGroupSize=0, useCompression=False):
+        if not MTU <= maxPacketSize <= MAX_DATAGRAM_SIZE:
+            raise ValueError(f"Max packet size must be between {MTU} and {MAX_DATAGRAM_SIZE}, got: {maxPacketSize}")
+        # the receiver keeps the last RECEIVE_WINDOW_SIZE packets, a bigger group could never be rebuilt
+        if not 0 <= fecGroupSize <= RECEIVE_WINDOW_SIZE:
+            raise ValueError(f"FEC group size must be between 0 and {RECEIVE_WINDOW_SIZE}, got: {fecGroupSize}")
+
+        # a flag that indicates if the socket is opened and connected and has finished the handshake (sent & received SYN)
+        self.isConnected = False
+
+        # flag indicating connection is closed
+        self.isClosed = False
+
+        # the udp socket we open to the receiver side as senders, or as a receiver for listening
+        self.rudpSocket = None
+
+        # reusable buffer the udp socket reader thread receives the packets into (recvfrom_into), so no new buffer is
+        # allocated for every received packet (only the socket that owns the udp socket has one)
+        self.receiveBuffer = None
+
+        # the max packet size (header + data) this socket proposes in its SYN, it receives packets up to this size
+        self.maxPacketSize = maxPacketSize
+
+        # the max packet size both sides agreed on in the SYN exchange (None until the other side SYN was received)
+        self.negotiatedPacketSize = None
+
+        # the size of the DATA packets this socket sends, it starts at MTU and grows up to negotiatedPacketSize as
+        # the path MTU probes get through
+        self.packetSize = MTU
+
+        # flag indicating the path MTU search was already started
+        self.isPathMtuProbeStarted = False
+
+        # the size of the last probe the other side acknowledged
+        self.lastProbeAckSize = 0
+
+        # flag indicating DATA packets are sent in batches with UDP generic segmentation offload (UDP_SEGMENT exists
+        # only on linux)
+        self.useUdpGso = useUdpGso and sys.platform.startswith('linux')
+
+        # flag indicating this socket offers zlib compression of the messages in its SYN (it is used only if the
+        # other side offers it too), it saves bandwidth on slow links for some CPU
+        self.useCompression = useCompression
+
+        # the zlib stream that compresses the messages we send and the one that decompresses the messages we receive
+        # (None unless both sides agreed on compression in the SYN exchange), each one lasts for the whole connection
+        # so a message is compressed with the data of the messages before it (small messages compress well too)
+        self.compressor = None
+        self.decompressor = None
+
+        # number of bytes that will still be sent raw because the last compressed message didn't compress well
+        self.compressionBypassLength = 0
+
+        # flag indicating the message being received is compressed (None until its first byte is received)
+        self.isCompressedMessage = None
+
+        # number of DATA/END packets protected by one FEC parity packet (0 if forward error correction is off), the
+        # overhead is one parity packet every fecGroupSize packets (or less if a message ends before the group is full)
+        self.fecGroupSize = fecGroupSize
+
+        # the sequence number of the first packet in the current FEC group, and the number of packets in it
+        self.fecGroupStart = 0
+        self.fecGroupCount = 0
+
+        # XOR of the packet types, data lengths and data (as little-endian ints, so shorter data is padded with zeros)
+        # of the packets in the current FEC group, and the longest data length in it
+        self.fecXorType = 0
+        self.fecXorLength = 0
+        self.fecXorData = 0
+        self.fecMaxLength = 0
+
+        # ring buffer of the recently received DATA/END packets (sequenceNumber, packetType, data), the packets of a
+        # group are needed to rebuild a lost one from the FEC parity (None until the first FEC packet arrives)
+        self.recentPackets = None
+
+        # the ipv4 address and port of the receiver side on this socket
+        self.receiverAddress = None
+
+        # the id of this connection, it is sent in every packet so the server can tell its connections apart
+        self.connectionId = 0
+
+        # the listening socket that accepted this connection (None if this socket owns its udp socket)
+        self.listeningSocket = None
+
+        # dictionary of the connections accepted by this listening socket by (client address, connection id)
+        self.acceptedConnections = None
+
+        # thread lock to use when changing the acceptedConnections member
+        self.acceptedConnectionsLock = None
+
+        # queue of the new connections waiting to be returned by accept()
+        self.acceptQueue = None
+
+        # dictionary of the accepted connections that have coalesced ACKs pending, and the time the first one was pending
+        self.pendingAckConnections = None
 
-    # a buffer that accumulate the DATA packets in correct order into a full byte data buffer
-    receivedDataBuffer = b''
+        # token bucket of the SYN replies of this listening socket (number of SYNs it may answer now, refilled at
+        # MAX_SYN_REPLY_RATE per second) and the last time it was refilled
+        self.synReplyTokens = MAX_SYN_REPLY_RATE
+        self.lastSynReplyTime = 0
 
-    # a flag that indicates if a data was read from the socket and is ready to be consumed by the caller
-    isDataReady = False
+        # maximum seconds receive() waits for data before it returns empty bytes
+        self.receiveTimeout = MAX_WAIT_TIME
 
-    # an event that indicates the data is ready for read by the caller
-    isDataReadyEvent = threading.Event()
+        # a sequence number that is incremented each time a packet is sent (the max sequence is 4,294,967,295
+        # [FFFFFFFF], then it wraps back to 0)
+        self.sequenceNumber = 0
 
-    # the udp socket we open to the receiver side as senders, or as a receiver for listening
-    rudpSocket = None
+        # the sequence number of the SYN this socket sent when it connected (None for accepted connections)
+        self.synSequenceNumber = None
 
-    # the ipv4 address and port of the receiver side on this socket
-    receiverAddress = None
+        # the name of the congestion control algorithm this socket uses (see rudp_congestion.py)
+        self.congestionControlAlgorithm = congestionControlAlgorithm
 
-    # the ipv4 address and port of this side on the socket
-    selfAddress = None
+        # the congestion control that decides the RUDP window size (max simultaneous sent packets), it is created
+        # right away so an unknown algorithm name fails here
+        self.congestionControl = createCongestionControl(congestionControlAlgorithm)
 
-    # a sequence number that is incremented each time a packet is sent (the max sequence is 65,535 [FFFF])
-    sequenceNumber = 0
+        # the round trip time estimator that decides the retransmission timeout
+        self.rttEstimator = RttEstimator()
 
-    # thread lock to use when changing the sequenceNumber member
-    sequenceNumberLock = threading.Lock()
+        # dictionary that holds all the sequence numbers and packets of this connection that were not acknowledge yet
+        self.waitingForAcknowledge = {}
 
-    # a member that holds the RUDP window size (max simultaneous sent packets)
-    windowSize = 1
+        # dictionary that holds the last time each packet waiting for acknowledge was sent
+        self.packetTransmitTimes = {}
 
-    # thread lock to use when changing the windowSize member
-    windowSizeLock = threading.Lock()
+        # the sequence numbers of the packets that were retransmitted, their ACK can't be used as an RTT sample
+        self.retransmittedSequenceNumbers = set()
 
-    # dictionary that holds all the sequence numbers and packets that were not acknowledge yet
-    waitingForAcknowledge = {}
+        # the last time a retransmission timeout collapsed the congestion window (it happens at most once per RTO)
+        self.lastTimeoutTime = 0
 
-    # thread lock to use when changing the waitingForAcknowledge member
-    waitingForAcknowledgeLock = threading.Lock()
+        # the pacing token bucket: the bytes the sender may send now without waiting (negative if it sent ahead of
+        # the pacing rate) and the last time the bucket was filled
+        self.pacingTokens = 0
+        self.lastPacingTime = 0
+
+        # the last time a NACK or duplicate SACKs shrank the congestion window (it happens at most once per RTT)
+        self.lastPacketLossTime = 0
+
+        # the cumulative ACK of the last SACK, and the number of SACKs in a row that came with the same one
+        self.lastCumulativeAck = None
+        self.duplicateAckCount = 0
+
+        # condition used to protect the sender state (waitingForAcknowledge, sequenceNumber) and to wake the sender
+        # when packets are acknowledged (window space opened, the last ACK arrived or the SYN ACK connected the
+        # socket) and the path MTU probe thread when its probe is acknowledged
+        self.waitingForAcknowledgeCondition = threading.Condition()
+
+        # the receive window (in packets) the other side advertised in its last SACK, we never have more packets
+        # waiting for acknowledge than this number (flow control)
+        self.receiverWindowSize = RECEIVE_WINDOW_SIZE
+
+        # the sequence number of the next DATA/END packet the receiver expects to get in order (None until SYN received)
+        self.nextExpectedSequenceNumber = None
+
+        # the highest sequence number the receiver got so far, a packet that comes more than one after it means
+        # the packets between them are missing (None until SYN received)
+        self.highestReceivedSequenceNumber = None
+
+        # ring buffer of the packets (packetType, data) received ahead of nextExpectedSequenceNumber, each packet
+        # is kept in slot (sequenceNumber % RECEIVE_WINDOW_SIZE) until all the packets before it arrive (None until
+        # the first packet arrives out of order, the in-order packets go to the caller queue without it)
+        self.receiveWindow = None
+
+        # number of packets currently kept in the receiveWindow ring buffer
+        self.receiveWindowCount = 0
+
+        # queue of the in-order data chunks that are ready to be consumed by the caller, None marks the END of a message
+        self.receivedChunks = deque()
+
+        # condition used to protect the receiver state and to wake the caller when in-order data is ready
+        self.receivedDataCondition = threading.Condition()
+
+        # the receive window (in packets) we advertised to the other side in our last SACK
+        self.lastAdvertisedWindow = RECEIVE_WINDOW_SIZE
+
+        # number of received packets that were not acknowledged yet (they will be coalesced into one SACK)
+        self.pendingAckCount = 0
+
+        # number of packets that will still be acknowledged right away (quick ACK at the start of the connection)
+        self.quickAckCount = QUICK_ACK_PACKETS
+
+        # the statistics of the connection (see getStats()), the counters are updated without taking a lock so they
+        # cost nothing on the fast path, a counter may rarely miss an update when two threads change it together
+        # number of packets (of all types, with retransmissions) and bytes (with headers) sent and received
+        self.packetsSent = 0
+        self.bytesSent = 0
+        self.packetsReceived = 0
+        self.bytesReceived = 0
+
+        # number of packets sent again (after a timeout, a NACK or duplicate SACKs) and number of retransmission
+        # timeouts and losses that shrank the congestion window
+        self.retransmittedPackets = 0
+        self.retransmissionTimeouts = 0
+        self.packetLosses = 0
+
+        # number of received DATA/END packets we already had, and number of lost packets rebuilt from a FEC parity
+        self.duplicatePackets = 0
+        self.fecRecoveredPackets = 0
+
+        # ring buffer of the last traced events (see enableTrace()), None while tracing is off
+        self.traceEvents = None
 
 
     # -------------------------------------------------------------------------------------------- #
     # open RUDP socket for sending, send SYN packet, wait for SYN reply & mark socket as connected #
+    # the optional firstMessage is sent like send(firstMessage), but when it is short enough it is #
+    # carried by the SYN itself, so the other side gets it without waiting for the handshake       #
     # -------------------------------------------------------------------------------------------- #
-    def connect(self, address):
+    def connect(self, address, firstMessage=None):
         # save the address we are connecting to (the other side address)
         self.receiverAddress = address
 
-        # create a UDP socket, and send SYN to receiver
-        self.rudpSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.rudpSocket.settimeout(SOCKET_MAX_TIMEOUT)
-        self.sendSynPacket()
+        # pick a random connection id, the other side will use it in all its packets to this connection
+        self.connectionId = random.randint(1, MAX_CONNECTION_ID)
+
+        # create a UDP socket, and send SYN to receiver (with the first message if it fits in the SYN)
+        self.createUdpSocket()
+        isFirstMessageInSyn = firstMessage is not None and 0 < len(firstMessage) <= MAX_SYN_DATA_LENGTH
+        self.sendSynPacket(firstMessage if isFirstMessageInSyn else b'')
 
         # launch a thread that listen to received control packets (ACK/SYN/END messages)
+        # (the packets waiting for ACK are retransmitted by the process wide retransmissionScheduler)
         listenerThread = threading.Thread(target=self.handleControlPackets)
         listenerThread.start()
 
-        # launch thread that retransmission waiting for ACK packets
-        retransmissionThread = threading.Thread(target=self.retransmitWaitingPackets)
-        retransmissionThread.start()
+        # a first message too big for the SYN is sent as usual once the handshake is done
+        if firstMessage is not None and not isFirstMessageInSyn:
+            self.send(firstMessage)
+
+
+    # ------------------------------------------------------------------------------ #
+    # creates the UDP socket of this RUDP socket and the buffer it receives into, on #
+    # linux the don't fragment bit is set so the path MTU probes can find the size  #
+    # of the biggest packet that gets through without fragmentation                 #
+    # ------------------------------------------------------------------------------ #
+    def createUdpSocket(self):
+        self.rudpSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.rudpSocket.settimeout(SOCKET_MAX_TIMEOUT)
+        self.receiveBuffer = bytearray(self.maxPacketSize)
+        if sys.platform.startswith('linux'):
+            try:
+                self.rudpSocket.setsockopt(socket.IPPROTO_IP, IP_MTU_DISCOVER, IP_PMTUDISC_PROBE)
+            except OSError as err:
+                log(f"createUdpSocket(): can't set the don't fragment bit: {err}")
+
+        # size the kernel buffers for a whole window of the biggest packets (only grow them, never shrink)
+        socketBufferSize = min(max(RECEIVE_WINDOW_SIZE, MAX_WINDOW_SIZE) * self.maxPacketSize, MAX_SOCKET_BUFFER_SIZE)
+        for socketBufferOption in (socket.SO_RCVBUF, socket.SO_SNDBUF):
+            try:
+                if self.rudpSocket.getsockopt(socket.SOL_SOCKET, socketBufferOption) < socketBufferSize:
+                    self.rudpSocket.setsockopt(socket.SOL_SOCKET, socketBufferOption, socketBufferSize)
+            except OSError as err:
+                log(f"createUdpSocket(): can't set the socket buffer size: {err}")
 
 
     # ------------------------------------------------------------------------- #
     # alias function that closes the socket and marking the socket as closed so #
-    # the send/receive threads will quit                                        #
+    # the send/receive threads will quit, the messages that are still in flight #
+    # are delivered (flushed) before the RST packet is sent                     #
     # ------------------------------------------------------------------------- #
     def close(self):
+        # a socket that is still in its handshake (its SYN, that may carry the first message, waits for its ACK)
+        # finishes the handshake first, so the first message is delivered and the other side gets the RST
+        if not self.isConnected and not self.isClosed and self.waitingForAcknowledge:
+            self.waitForConnection()
         if self.isConnected:
-            self.sendRSTPacket()
+            try:
+                self.flush()
+            except Exception as err:
+                log(f"close(): not all the sent messages were acknowledged: {err}")
+            # the RST of the other side may have closed this socket while it was flushing, then it needs no RST
+            if self.isConnected and not self.isClosed:
+                try:
+                    self.sendRSTPacket()
+                except OSError as err:
+                    log(f"close(): the socket was already closed: {err}")
         # mark sender socket as closed
         self.isConnected = False
         self.isClosed = True
-        # close the udp socket
-        self.rudpSocket.close()
+        # wake up the caller if it is waiting for data or for ACKs, there will be no more
+        with self.receivedDataCondition:
+            self.receivedDataCondition.notify_all()
+        with self.waitingForAcknowledgeCondition:
+            self.waitingForAcknowledgeCondition.notify_all()
+        if self.listeningSocket is not None:
+            # the udp socket belongs to the listening socket, only stop routing packets to this connection
+            self.listeningSocket.removeAcceptedConnection(self)
+        else:
+            # close the udp socket (the thread that handled the RST of the other side may have closed it already)
+            try:
+                self.rudpSocket.close()
+            except OSError as err:
+                log(f"close(): the socket was already closed: {err}")
 
 
     # ------------------------------------------------------------------------------ #
     # alias function that sends bytes data to the receiver using the RUDP protocol   #
-    # send DATA packets with sequenceNumbers and expects ACK packets to return with #
-    # the same sequenceNumber for each packet and once all the data packets were     #
-    # sent it will send a final RST packet                                           #
+    # send DATA packets with sequenceNumbers followed by an END packet that marks    #
+    # the end of the message, it returns once the last packet was sent (the packets #
+    # are acknowledged in the background) so messages of back-to-back send() calls  #
+    # are pipelined in the same window, call flush() to wait for their ACKs          #
     # ------------------------------------------------------------------------------ #
     def send(self, dataToSend):
         # make sure the socket is connected (SYN has been sent and received)
         if not self.isConnected:
-            self.isConnectedEvent.wait(SLEEP_BETWEEN_RETRIES * MAX_SEND_RETRIES)
+            self.waitForConnection()
+
+        # with compression every message starts with a byte that tells if it is compressed
+        if self.compressor is not None:
+            dataToSend = self.compressMessage(dataToSend)
 
-        # slice the data into smaller chunks at MTU size
+        # slice the data into smaller chunks at the packet size
         # calculate what is the total bytes we are about to send in this packet
-        totalBytesToSend = len(dataToSend)
+        dataToSendView = memoryview(dataToSend).cast('B')
+        totalBytesToSend = len(dataToSendView)
         # reset the total sent bytes counter
         totalBytesSent = 0
         # loop until there is nothing left to send
         while totalBytesSent < totalBytesToSend:
-            # get the next chunk of bytes in the MTU size from the data to send
-            nextDataChunkToSend = dataToSend[totalBytesSent:MTU]
-
-            # if we reached the maximum number of lost packets waiting for acknowledge
-            # then wait until one of them succeed before you send the next packet
-            numberOfRetries = 0
-            while len(self.waitingForAcknowledge) >= self.windowSize:
-                if numberOfRetries >= MAX_SEND_RETRIES:
-                    # clear the waiting for ack dictionary so next send will start fresh
-                    with self.waitingForAcknowledgeLock:
-                        self.waitingForAcknowledge.clear()
-                        raise Exception('Failed to send data, not all packets got ACKs')
-                numberOfRetries = numberOfRetries + 1
-                time.sleep(SLEEP_BETWEEN_RETRIES)
-
-            # if we had to wait for ack to return then reduce the window size so fewer packets are lost
-            if numberOfRetries > 0:
-                self.reduceWindowSize()
-
-            # send the current data chunk
-            self.sendDataPacket(nextDataChunkToSend)
-            # add another chunk size to the totalBytesSent counter
-            totalBytesSent = totalBytesSent + MTU
-
-        # after all packets are sent, send the END packet
+            # if the window is full wait until enough packets are acknowledged before you send the next packet
+            self.waitForAcknowledge(lambda: len(self.waitingForAcknowledge) < self.getSendWindowSize(),
+                                    'Failed to send data, not all packets got ACKs')
+
+            # with UDP GSO send all the packets the window allows with a single system call
+            numberOfPackets = 1
+            if self.useUdpGso:
+                numberOfPackets = max(min(self.getSendWindowSize() - len(self.waitingForAcknowledge),
+                                          MAX_GSO_SEGMENTS, MAX_DATAGRAM_SIZE // self.packetSize), 1)
+
+            # get the next chunks of bytes in the max payload size from the data to send (memoryview slices, each
+            # chunk is copied only once, into its packet), the packet size grows while the path MTU probes succeed
+            # (with FEC the data is shorter, so the FEC packet that holds the parity and its header fits too)
+            payloadLength = self.packetSize - HEADER_LENGTH - (FEC_HEADER.size if self.fecGroupSize else 0)
+            chunksEnd = min(totalBytesSent + numberOfPackets * payloadLength, totalBytesToSend)
+            dataChunksToSend = [dataToSendView[chunkStart:chunkStart + payloadLength]
+                                for chunkStart in range(totalBytesSent, chunksEnd, payloadLength)]
+
+            # wait for the pacing rate to allow these packets, then send the current data chunks
+            self.pacePackets(chunksEnd - totalBytesSent + len(dataChunksToSend) * HEADER_LENGTH)
+            if len(dataChunksToSend) > 1:
+                self.sendDataPacketsWithGso(dataChunksToSend)
+            else:
+                self.sendDataPacket(dataChunksToSend[0])
+            totalBytesSent = chunksEnd
+
+        # after all packets are sent, send the END packet (it is acknowledged like any DATA packet, and the
+        # receiver delivers it in order, so the next message may be sent right away without waiting for it)
+        self.waitForAcknowledge(lambda: len(self.waitingForAcknowledge) < self.getSendWindowSize(),
+                                'Failed to send data, not all packets got ACKs')
         self.sendENDPacket()
 
-        # wait for all ACK packets to return or rais exception after timeout has reached
-        numberOfRetries = 0
-        while len(self.waitingForAcknowledge) > 0:
-            if numberOfRetries >= MAX_SEND_RETRIES:
-                # clear the waiting for ack dictionary so next send will start fresh
-                with self.waitingForAcknowledgeLock:
-                    self.waitingForAcknowledge.clear()
-                    raise Exception(f"Failed to receive ACK packets for all the sent packets: {self.waitingForAcknowledge}")
-            numberOfRetries = numberOfRetries + 1
-            time.sleep(SLEEP_BETWEEN_RETRIES)
+
+    # -------------------------------------------------------------------------------- #
+    # compresses a message with the zlib stream of the connection (a sync flush ends    #
+    # it, so the receiver can decompress all of it as soon as it arrives) and puts the  #
+    # message header byte before it, a short message, or one sent while compression is #
+    # bypassed, is sent raw. if the data doesn't compress well (already compressed     #
+    # files) the next COMPRESSION_BYPASS_LENGTH bytes are sent raw without wasting CPU #
+    # -------------------------------------------------------------------------------- #
+    def compressMessage(self, message):
+        if len(message) < MIN_COMPRESSION_LENGTH or self.compressionBypassLength > 0:
+            self.compressionBypassLength = max(self.compressionBypassLength - len(message), 0)
+            return MESSAGE_HEADER_RAW + bytes(message)
+        compressedMessage = self.compressor.compress(message) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        if len(compressedMessage) > len(message) * COMPRESSION_BYPASS_RATIO:
+            log(f"compressMessage(): poor compression ratio {len(compressedMessage) / len(message):.2f}, bypassing")
+            self.compressionBypassLength = COMPRESSION_BYPASS_LENGTH
+        return MESSAGE_HEADER_COMPRESSED + compressedMessage
+
+
+    # ------------------------------------------------------------------------------ #
+    # token bucket pacing, waits until the pacing rate (the congestion window over   #
+    # the smoothed RTT) allows sending numberOfBytes more bytes, so the packets of a #
+    # window are spread over the RTT instead of overflowing the queues in one burst  #
+    # ------------------------------------------------------------------------------ #
+    def pacePackets(self, numberOfBytes):
+        smoothedRtt = self.rttEstimator.smoothedRtt
+        if smoothedRtt is None:
+            # no RTT sample yet, nothing to pace by
+            return
+        pacingRate = self.congestionControl.getPacingRate(smoothedRtt, self.packetSize)
+        currentTime = time.time()
+        # fill the bucket for the time that passed, up to a small burst
+        self.pacingTokens = min(self.pacingTokens + (currentTime - self.lastPacingTime) * pacingRate,
+                                PACING_BURST_PACKETS * self.packetSize)
+        self.lastPacingTime = currentTime
+        self.pacingTokens = self.pacingTokens - numberOfBytes
+        if self.pacingTokens < 0:
+            time.sleep(-self.pacingTokens / pacingRate)
+
+
+    # ----------------------------------------------------------------------------- #
+    # waits until all the sent messages were acknowledged by the other side, rais   #
+    # exception if not all ACK packets returned after timeout has reached           #
+    # ----------------------------------------------------------------------------- #
+    def flush(self):
+        self.waitForAcknowledge(lambda: len(self.waitingForAcknowledge) == 0,
+                                'Failed to receive ACK packets for all the sent packets')
+
+
+    # ------------------------------------------------------------------------------ #
+    # blocks until isDone() is true, the ACK handler wakes us every time packets are  #
+    # acknowledged, raises exception if it is not true after MAX_WAIT_TIME seconds   #
+    # ------------------------------------------------------------------------------ #
+    def waitForAcknowledge(self, isDone, errorMessage):
+        with self.waitingForAcknowledgeCondition:
+            if self.waitingForAcknowledgeCondition.wait_for(lambda: isDone() or self.isClosed, MAX_WAIT_TIME) \
+                    and not self.isClosed:
+                return
+            # clear the waiting for ack dictionary so next send will start fresh
+            self.waitingForAcknowledge.clear()
+            raise Exception(errorMessage)
+
+
+    # ------------------------------------------------------------------------ #
+    # waits up to MAX_WAIT_TIME for the handshake to finish (the listening     #
+    # socket answered our SYN), the SYN handler wakes us through the sender    #
+    # condition                                                                #
+    # ------------------------------------------------------------------------ #
+    def waitForConnection(self):
+        with self.waitingForAcknowledgeCondition:
+            self.waitingForAcknowledgeCondition.wait_for(lambda: self.isConnected or self.isClosed, MAX_WAIT_TIME)
 
 
     # ------------------------------------------------------------ #
     # sets the socket max timeout for connect/send/receive actions #
     # ------------------------------------------------------------ #
     def setTimeout(self, socketMaxTimeout):
-        self.rudpSocket.settimeout(socketMaxTimeout)
+        self.receiveTimeout = socketMaxTimeout
+        # an accepted connection shares the udp socket of the listening socket, so it must not change its timeout
+        if self.listeningSocket is None:
+            self.rudpSocket.settimeout(socketMaxTimeout)
 
 
-    # --------------------------------------- #
-    # receives bytes data from sender clients #
-    # --------------------------------------- #
+    # ------------------------------------------------------------------------------ #
+    # returns a dictionary of the connection statistics: the packet counters, the    #
+    # RTT estimation, the congestion and receiver windows and the data in flight,    #
+    # call it every few seconds to see how a transfer behaves over time              #
+    # ------------------------------------------------------------------------------ #
+    def getStats(self):
+        with self.waitingForAcknowledgeCondition:
+            packetsInFlight = len(self.waitingForAcknowledge)
+            bytesInFlight = sum(len(rudpPacket) for rudpPacket in self.waitingForAcknowledge.values())
+        return {
+            'packetsSent': self.packetsSent,
+            'bytesSent': self.bytesSent,
+            'packetsReceived': self.packetsReceived,
+            'bytesReceived': self.bytesReceived,
+            'retransmittedPackets': self.retransmittedPackets,
+            'retransmissionTimeouts': self.retransmissionTimeouts,
+            'packetLosses': self.packetLosses,
+            'duplicatePackets': self.duplicatePackets,
+            'fecRecoveredPackets': self.fecRecoveredPackets,
+            'smoothedRtt': self.rttEstimator.smoothedRtt,
+            'rttVariance': self.rttEstimator.rttVariance,
+            'retransmissionTimeout': self.rttEstimator.getRetransmissionTimeout(),
+            'congestionWindow': self.congestionControl.windowSize,
+            'slowStartThreshold': self.congestionControl.slowStartThreshold,
+            'receiverWindow': self.receiverWindowSize,
+            'packetsInFlight': packetsInFlight,
+            'bytesInFlight': bytesInFlight,
+            'packetSize': self.packetSize,
+        }
+
+
+    # ------------------------------------------------------------------------------ #
+    # starts tracing the events of the connection (packets sent, retransmitted,      #
+    # acknowledged, received, losses...) into a ring buffer that keeps the last      #
+    # traceSize events, so tracing can stay on in production, see dumpTrace()        #
+    # ------------------------------------------------------------------------------ #
+    def enableTrace(self, traceSize=TRACE_BUFFER_SIZE):
+        self.traceEvents = deque(maxlen=traceSize)
+
+
+    # ------------------------------------------------------------------------------- #
+    # adds an event to the trace (if tracing is on) with the congestion window, the   #
+    # packets in flight and the smoothed RTT at that moment, the value is the         #
+    # sequence number of the packet (the number of packets for an 'ack' event)        #
+    # ------------------------------------------------------------------------------- #
+    def traceEvent(self, eventName, value):
+        if self.traceEvents is not None:
+            self.traceEvents.append((time.time(), eventName, value, self.congestionControl.windowSize,
+                                     len(self.waitingForAcknowledge), self.rttEstimator.smoothedRtt))
+
+
+    # ------------------------------------------------------------------------------- #
+    # writes the traced events to a csv file (one line per event, oldest first) that  #
+    # can be loaded into a spreadsheet or a plotting tool, returns the number of      #
+    # events written                                                                  #
+    # ------------------------------------------------------------------------------- #
+    def dumpTrace(self, filePath):
+        traceEvents = list(self.traceEvents or ())
+        with open(filePath, 'w') as traceFile:
+            traceFile.write('time,event,value,congestionWindow,packetsInFlight,smoothedRtt\n')
+            for eventTime, eventName, value, congestionWindow, packetsInFlight, smoothedRtt in traceEvents:
+                traceFile.write(f"{eventTime:.6f},{eventName},{value},{congestionWindow:.2f},{packetsInFlight},"
+                                f"{'' if smoothedRtt is None else f'{smoothedRtt:.6f}'}\n")
+        return len(traceEvents)
+
+
+    # -------------------------------------------------------------------------------- #
+    # returns the number of packets that may wait for acknowledge at the same time, it  #
+    # is the congestion window limited by the receiver window (but at least one packet #
+    # so a zero receiver window is probed, the probe is answered with the new window)  #
+    # -------------------------------------------------------------------------------- #
+    def getSendWindowSize(self):
+        return max(min(self.congestionControl.getWindowSize(), self.receiverWindowSize), 1)
+
+
+    # --------------------------------------------------------------------------- #
+    # receives bytes data from sender clients, returns up to maxBufferSize bytes   #
+    # of in-order data as soon as they arrive, a single call never returns bytes  #
+    # of two different send() calls (messages), returns None once the socket was  #
+    # closed and all the received data was consumed                               #
+    # --------------------------------------------------------------------------- #
     def receive(self, maxBufferSize):
-        if not self.isClosed:
-            # wait for socket to connect
-            if not self.isConnected:
-                self.isConnectedEvent.wait(SLEEP_BETWEEN_RETRIES * MAX_SEND_RETRIES)
+        # wait for socket to connect
+        if not self.isConnected and not self.isClosed:
+            self.waitForConnection()
 
+        with self.receivedDataCondition:
             # wait for data to be ready and return it
-            if not self.isDataReady:
-                self.isDataReadyEvent.wait(SLEEP_BETWEEN_RETRIES * MAX_SEND_RETRIES)
-                self.isDataReadyEvent.clear()
+            dataChunks = []
+            receivedLength = 0
+            waitEndTime = time.time() + self.receiveTimeout
+            while receivedLength < maxBufferSize:
+                if not self.receivedChunks:
+                    if receivedLength > 0:
+                        # return what we have so far, the rest of the message will be returned by the next call
+                        break
+                    if self.isClosed:
+                        return None
+                    remainingWaitTime = waitEndTime - time.time()
+                    if remainingWaitTime <= 0:
+                        break
+                    self.receivedDataCondition.wait(remainingWaitTime)
+                    continue
+
+                nextChunk = self.receivedChunks.popleft()
+                if nextChunk is None:
+                    # END of message, stop here so bytes of the next message are returned by the next call
+                    if receivedLength > 0:
+                        break
+                    continue
+                if receivedLength + len(nextChunk) > maxBufferSize:
+                    # the caller can't take the whole chunk, return the rest of it in the next call
+                    self.receivedChunks.appendleft(nextChunk[maxBufferSize - receivedLength:])
+                    nextChunk = nextChunk[:maxBufferSize - receivedLength]
+                dataChunks.append(nextChunk)
+                receivedLength = receivedLength + len(nextChunk)
 
-            result = self.receivedDataBuffer
-            self.receivedDataBuffer = b''
-            self.isDataReady = False
+            self.sendWindowUpdate()
 
-            return result
+        return b''.join(dataChunks)
+
+
+    # ------------------------------------------------------------------------------ #
+    # receives bytes data from sender clients directly into the received writable     #
+    # buffer (bytearray / memoryview), returns the number of bytes written into it,  #
+    # 0 once the socket was closed and all the received data was consumed            #
+    # ------------------------------------------------------------------------------ #
+    def receiveInto(self, buffer):
+        buffer = memoryview(buffer).cast('B')
+        receivedData = self.receive(len(buffer))
+        if not receivedData:
+            return 0
+        buffer[:len(receivedData)] = receivedData
+        return len(receivedData)
+
+
+    # ---------------------------------------------------------------------------- #
+    # iterates over the received in-order data chunks as they arrive, until the     #
+    # other side closes the connection, so a whole stream can be consumed without  #
+    # keeping it in memory: for dataChunk in rudpSocket: file.write(dataChunk)      #
+    # ---------------------------------------------------------------------------- #
+    def __iter__(self):
+        while True:
+            dataChunk = self.receive(RECEIVE_WINDOW_SIZE * MAX_PAYLOAD_LENGTH)
+            if dataChunk is None:
+                return
+            if dataChunk:
+                yield dataChunk
 
 
-    # --------------------------------------------------------- #
-    # open RUDP socket for receiving, binds socket to ip & port #
-    # --------------------------------------------------------- #
+    # --------------------------------------------------------------------------- #
+    # open RUDP socket for receiving, binds socket to ip & port and launch a thread #
+    # that routes all the packets this udp socket receives to the connections      #
+    # --------------------------------------------------------------------------- #
     def listen(self, address):
         # open a UDP socket and bind it to host & port
-        self.rudpSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.rudpSocket.settimeout(SOCKET_MAX_TIMEOUT)
+        self.createUdpSocket()
         self.rudpSocket.bind(address)
 
+        self.acceptedConnections = {}
+        self.acceptedConnectionsLock = threading.Lock()
+        self.acceptQueue = queue.Queue(ACCEPT_BACKLOG)
+        self.pendingAckConnections = {}
+
+        # launch a thread that receives the packets of all the connections accepted on this udp socket
+        dispatcherThread = threading.Thread(target=self.dispatchPackets)
+        dispatcherThread.start()
+
 
     # --------------------------------------------------------------------- #
     # wait for incoming connections, once a connection is accepted, it will #
     # return the connected client socket and client address (ip & port)     #
     # --------------------------------------------------------------------- #
     def accept(self):
-        # wait & accept incoming connections
-        # ask udp socket to receive data in the Max Transmission Unit size
-        receivedPacket, clientAddress = self.rudpSocket.recvfrom(MTU)
-
-        # create a new RUDPSocket
-        clientRUDPSocket = RUDPSocket()
-        # connect to the client with the newly created socket
-        clientRUDPSocket.connect(clientAddress)
-        # return the new RUDPSocket to the caller
-        return clientRUDPSocket
+        # wait & accept incoming connections, the dispatcher thread adds a new connection for each new SYN
+        try:
+            return self.acceptQueue.get(timeout=SOCKET_MAX_TIMEOUT)
+        except queue.Empty:
+            raise socket.timeout('timed out')
 
 
-    def retransmitWaitingPackets(self):
+    # ------------------------------------------------------------------------------ #
+    # the listening socket thread, reads all the packets that arrive on the udp      #
+    # socket and hands each one to its connection by (client address, connection    #
+    # id), the packets of unknown connections are handled without keeping any state #
+    # ------------------------------------------------------------------------------ #
+    def dispatchPackets(self):
         while True:
-            # if socket has been closed - stop retransmitWaitingPackets thread from working
+            # if socket has been closed - stop dispatchPackets thread from working
             if self.isClosed:
                 break
-            log(f"retransmitWaitingPackets() {self.waitingForAcknowledge}")
-            with self.waitingForAcknowledgeLock:
-                for currentSequenceNumer, currentPacket in self.waitingForAcknowledge.items():
-                    # log(f"retransmitWaitingPackets(): {currentPacket} to: {self.receiverAddress}")
-                    self.rudpSocket.sendto(currentPacket, self.receiverAddress)
-            time.sleep(7)
+            try:
+                # if connections have coalesced ACKs pending wake up in time to send them
+                waitTime = ACK_DELAY if self.pendingAckConnections else SOCKET_MAX_TIMEOUT
+                readableSockets, writableSockets, erroredSockets = select.select([self.rudpSocket], [], [], waitTime)
+                if readableSockets:
+                    receivedLength, clientAddress = self.rudpSocket.recvfrom_into(self.receiveBuffer)
+                    receivedPacket = memoryview(self.receiveBuffer)[:receivedLength]
+                    if isPacketLog:
+                        log(f"dispatchPackets(): {receivedLength} bytes from: {clientAddress}")
+                    receivedPacketType, receivedConnectionId, receivedSequenceNumber, receivedDataLength, receivedData = parsePacket(receivedPacket)
+                    connection = self.acceptedConnections.get((clientAddress, receivedConnectionId))
+                    if connection is not None:
+                        connection.handlePacket(receivedPacketType, receivedSequenceNumber, receivedData)
+                        if connection.pendingAckCount > 0 and connection not in self.pendingAckConnections:
+                            self.pendingAckConnections[connection] = time.time()
+                    else:
+                        self.handleHandshakePacket(clientAddress, receivedPacketType, receivedConnectionId,
+                                                   receivedSequenceNumber, receivedData)
+                self.sendDelayedAcks()
+            except Exception as err:
+                # error occurred, maybe socket was cosed by caller, break from loop
+                if self.isClosed:
+                    break
+                if "timed out" not in str(err):
+                    log("Warning some problem occurred while trying to dispatch packets from socket: " + str(err))
+
+
+    # ------------------------------------------------------------------------- #
+    # sends the coalesced ACKs of the accepted connections that waited at least #
+    # ACK_DELAY for more packets to arrive                                      #
+    # ------------------------------------------------------------------------- #
+    def sendDelayedAcks(self):
+        currentTime = time.time()
+        # the connections are kept in the order their first ACK became pending, so stop at the first one not due
+        for connection, pendingSinceTime in list(self.pendingAckConnections.items()):
+            if currentTime - pendingSinceTime < ACK_DELAY:
+                break
+            del self.pendingAckConnections[connection]
+            if connection.pendingAckCount > 0 and not connection.isClosed:
+                connection.sendSackPacket()
+
+
+    # ------------------------------------------------------------------------------- #
+    # handles a packet of a connection this listening socket doesn't have (stateless  #
+    # SYN cookies): a SYN is answered with our SYN whose sequence number is a cookie, #
+    # only an ACK that returns a valid cookie (and repeats the client SYN) creates    #
+    # the connection, so stray or spoofed packets allocate nothing                    #
+    # ------------------------------------------------------------------------------- #
+    def handleHandshakePacket(self, clientAddress, packetType, connectionId, sequenceNumber, data):
+        if packetType == PACKET_TYPE_SYN:
+            if not self.takeSynReplyToken():
+                log(f"handleHandshakePacket(): too many SYNs, ignoring the SYN from: {clientAddress}")
+                return
+            synCookie = makeSynCookie(clientAddress, connectionId, sequenceNumber, getSynCookieTimeSlot())
+            synPacket = buildPacket(PACKET_TYPE_SYN, connectionId, synCookie, SYN_PAYLOAD.pack(self.maxPacketSize, self.getSynFlags()))
+            self.rudpSocket.sendto(synPacket, clientAddress)
+        elif packetType == PACKET_TYPE_ACK and len(data) >= SYN_COOKIE_ECHO.size:
+            synSequenceNumber, handshakeRttMicroseconds = SYN_COOKIE_ECHO.unpack_from(data)
+            if not isValidSynCookie(sequenceNumber, clientAddress, connectionId, synSequenceNumber):
+                log(f"handleHandshakePacket(): invalid SYN cookie from: {clientAddress}, ignoring it")
+            elif self.acceptQueue.full():
+                log(f"handleHandshakePacket(): accept backlog is full, ignoring the connection from: {clientAddress}")
+            else:
+                self.createAcceptedConnection(clientAddress, connectionId, sequenceNumber, synSequenceNumber,
+                                              handshakeRttMicroseconds / 1000000, data[SYN_COOKIE_ECHO.size:])
+        else:
+            log(f"handleHandshakePacket(): packet of unknown connection from: {clientAddress}, ignoring it")
+
+
+    # --------------------------------------------------------------------------- #
+    # token bucket of the SYN replies, returns True if one more SYN may be        #
+    # answered now (MAX_SYN_REPLY_RATE per second)                               #
+    # --------------------------------------------------------------------------- #
+    def takeSynReplyToken(self):
+        currentTime = time.time()
+        self.synReplyTokens = min(self.synReplyTokens + (currentTime - self.lastSynReplyTime) * MAX_SYN_REPLY_RATE,
+                                  MAX_SYN_REPLY_RATE)
+        self.lastSynReplyTime = currentTime
+        if self.synReplyTokens < 1:
+            return False
+        self.synReplyTokens = self.synReplyTokens - 1
+        return True
+
+
+    # ---------------------------------------------------------------------------- #
+    # creates a connection for a new client that shares this udp socket once the  #
+    # client returned our SYN cookie, our SYN (its sequence number is the cookie)  #
+    # is acknowledged by that ACK, so the connection starts connected with the     #
+    # handshake round trip the client measured as its first RTT sample. the client #
+    # SYN it repeats is handled as usual and the connection is queued for accept() #
+    # ---------------------------------------------------------------------------- #
+    def createAcceptedConnection(self, clientAddress, connectionId, synCookie, synSequenceNumber, handshakeRtt,
+                                 synData):
+        # create a new RUDPSocket (with the same congestion control algorithm, packet size and options as the listening
+        # socket)
+        connection = RUDPSocket(self.congestionControlAlgorithm, self.maxPacketSize, self.useUdpGso, self.fecGroupSize,
+                                self.useCompression)
+        connection.rudpSocket = self.rudpSocket
+        connection.receiverAddress = clientAddress
+        connection.connectionId = connectionId
+        connection.listeningSocket = self
+        connection.sequenceNumber = synCookie
+        connection.isConnected = True
+        if handshakeRtt > 0:
+            connection.rttEstimator.addSample(handshakeRtt)
+        with self.acceptedConnectionsLock:
+            self.acceptedConnections[(clientAddress, connectionId)] = connection
+        connection.handleSynPacket(synSequenceNumber, synData)
+        self.acceptQueue.put(connection)
+        log(f"createAcceptedConnection(): new connection {connectionId} from: {clientAddress}")
+        return connection
+
+
+    # ------------------------------------------------------------------ #
+    # stops routing packets to an accepted connection that was closed #
+    # ------------------------------------------------------------------ #
+    def removeAcceptedConnection(self, connection):
+        with self.acceptedConnectionsLock:
+            self.acceptedConnections.pop((connection.receiverAddress, connection.connectionId), None)
+
+
+    # ------------------------------------------------------------------------------ #
+    # called by the retransmissionScheduler when the timer of a packet expired,       #
+    # retransmits the packet if it is still waiting for acknowledge and was not sent  #
+    # within the retransmission timeout (RTO), on timeout the RTO is doubled and the  #
+    # congestion window collapses. returns the time the packet times out next, or    #
+    # None if the packet doesn't need a timer anymore                                 #
+    # ------------------------------------------------------------------------------ #
+    def handleRetransmissionTimeout(self, sequenceNumber):
+        # if socket has been closed - stop retransmitting its packets
+        if self.isClosed:
+            return None
+        with self.waitingForAcknowledgeCondition:
+            currentPacket = self.waitingForAcknowledge.get(sequenceNumber)
+            if currentPacket is None:
+                # the packet was acknowledged before its timer expired
+                return None
+            currentTime = time.time()
+            retransmissionTimeout = self.rttEstimator.getRetransmissionTimeout()
+            packetTimeoutTime = self.packetTransmitTimes.get(sequenceNumber, currentTime) + retransmissionTimeout
+            if packetTimeoutTime > currentTime:
+                # the packet was sent again after this timer was set, wait for its new timeout
+                return packetTimeoutTime
+
+            if isPacketLog:
+                log(f"handleRetransmissionTimeout(): {sequenceNumber} to: {self.receiverAddress}")
+            self.rudpSocket.sendto(currentPacket, self.receiverAddress)
+            self.packetTransmitTimes[sequenceNumber] = currentTime
+            self.retransmittedSequenceNumbers.add(sequenceNumber)
+            self.countSentPacket(currentPacket)
+            self.retransmittedPackets = self.retransmittedPackets + 1
+            self.traceEvent('timeout', sequenceNumber)
+
+            # all the packets sent in the same window time out together, react to the congestion only once
+            if currentTime - self.lastTimeoutTime >= retransmissionTimeout:
+                self.lastTimeoutTime = currentTime
+                self.rttEstimator.backoff()
+                self.congestionControl.onTimeout()
+                self.retransmissionTimeouts = self.retransmissionTimeouts + 1
+            return currentTime + self.rttEstimator.getRetransmissionTimeout()
 
 
     # --------------------------------------- #
     # receives bytes data from sender clients #
     # --------------------------------------- #
     def handleControlPackets(self):
-        # calculate the maximum number of expected packets, by calculating: maxBufferLength : (packetSize - headerSize)
-        numberOfExpectedPackets = 5000 / (MTU - HEADER_LENGTH)
-        # prepare a byte array to store all the received data packets
-        receivedDataArray = [b''] * round(numberOfExpectedPackets)
-        firstPacketSequenceNumber = 0
         while True:
             # if socket has been closed - stop handleControlPackets thread from working
             if self.isClosed:
                 break
             # read until there is nothing to read
             try:
-                # peak at the buffer and check if the next message is sent by client or ourselves
-                peekedData, peekedAddress = self.rudpSocket.recvfrom(MTU, socket.MSG_PEEK)
-                if peekedAddress != self.selfAddress:
-                    # read bytes from the socket
-                    receivedPacket, clientAddress = self.rudpSocket.recvfrom(MTU)
-                    log(f"receive(): {receivedPacket} from: {clientAddress}")
-                    if receivedPacket and clientAddress != self.selfAddress:
-                        # save the sender ip and port as the receiver address (so initiator port (8080) will be abandon)
-                        self.receiverAddress = clientAddress
-                        # parse the received packet
-                        receivedPacketType, receivedSequenceNumber, receivedDataLength, receivedData = parsePacket(receivedPacket)
-                        if receivedPacketType == PACKET_TYPE_SYN:
-                            log("receive(): Got SYN packet")
-                            # received SYN packet from sender, mark socket as connected & reply with ACK with SYN SequenceNumber
-                            # save the expected first packet sequence number, it will be used later
-                            # to calculate each arriving data packet place in the receivedDataArray
-                            firstPacketSequenceNumber = receivedSequenceNumber + 1
-                            self.sendAckPacket(receivedSequenceNumber)
-                            # sleep for 100 milliseconds to allow other side to consume the sent message
-                            time.sleep(0.1)
-                        elif receivedPacketType == PACKET_TYPE_DATA:
-                            log(f"handleSenderControlPackets(): Got DATA packet, receivedSequenceNumber: {receivedSequenceNumber} firstPacketSequenceNumber: {firstPacketSequenceNumber}")
-                            if not self.isDataReady:
-                                # received DATA packet from the sender add to total data buffer (in correct order) & return ACK
-                                receivedDataArray[receivedSequenceNumber - firstPacketSequenceNumber] = receivedData
-                                self.sendAckPacket(receivedSequenceNumber)
-                        elif receivedPacketType == PACKET_TYPE_ACK:
-                            log("handleSenderControlPackets(): Got ACK packet")
-                            # if ACK packet received from the receiver then remove the received SequenceNumber from the waitingForAcknowledge
-                            with self.waitingForAcknowledgeLock:
-                                if len(self.waitingForAcknowledge) > 0:
-                                    poppedPacket = self.waitingForAcknowledge.pop(receivedSequenceNumber)
-                                    if poppedPacket:
-                                        # increase the window size (since we succeeded)
-                                        self.increaseWindowSize()
-                                        # if we received an ACK for the SYN then mark socket as connected
-                                        poppedPacketType, poppedSequenceNumber, poppedDataLength, poppedData = parsePacket(poppedPacket)
-                                        if poppedPacketType == PACKET_TYPE_SYN:
-                                            self.isConnected = True
-                                            self.isConnectedEvent.set()
-                                            log("SYN ACK received")
-                        elif receivedPacketType == PACKET_TYPE_END:
-                            # received END packet that means the current data buffer transmission ended,
-                            # next packets belongs to the next data buffer, return data buffer to caller
-                            log("handleSenderControlPackets(): Got END packet")
-                            self.receivedDataBuffer = b''.join(receivedDataArray)
-                            receivedDataArray = [b''] * round(numberOfExpectedPackets)
-                            firstPacketSequenceNumber = receivedSequenceNumber + 1
-                            self.isDataReady = True
-                            self.isDataReadyEvent.set()
-                        elif receivedPacketType == PACKET_TYPE_RST:
-                            # received RST packet from sender, close the socket
-                            log("handleSenderControlPackets(): Got RST packet")
-                            self.isConnected = False
-                            self.close()
-                            break
-                        else:
-                            # if we received any other packet type then print error message
-                            log(f"handleSenderControlPackets(): unexpected packet type: {receivedPacketType}, ignoring it")
+                # if there are received packets that were not acknowledged yet, wait for more packets only up to
+                # ACK_DELAY so they can be coalesced into one SACK, if nothing arrives send the SACK now
+                if self.pendingAckCount > 0:
+                    readableSockets, writableSockets, erroredSockets = select.select([self.rudpSocket], [], [], ACK_DELAY)
+                    if not readableSockets:
+                        self.sendSackPacket()
+                        continue
+                # read bytes from the socket
+                receivedLength, clientAddress = self.rudpSocket.recvfrom_into(self.receiveBuffer)
+                receivedPacket = memoryview(self.receiveBuffer)[:receivedLength]
+                if isPacketLog:
+                    log(f"receive(): {receivedLength} bytes from: {clientAddress}")
+                if receivedPacket:
+                    # parse the received packet
+                    receivedPacketType, receivedConnectionId, receivedSequenceNumber, receivedDataLength, receivedData = parsePacket(receivedPacket)
+                    if receivedConnectionId != self.connectionId:
+                        if isPacketLog:
+                            log(f"handleControlPackets(): packet of another connection: {receivedConnectionId}, ignoring it")
+                        continue
+                    # save the sender ip and port as the receiver address
+                    self.receiverAddress = clientAddress
+                    self.handlePacket(receivedPacketType, receivedSequenceNumber, receivedData)
             except Exception as err:
                 # error occurred, maybe socket was cosed by caller, break from loop
                 if "timed out" not in str(err):
                     if 'forcibly closed' not in str(err):
                         log("Warning some problem occurred while trying to receive data from socket: " + str(err))
                     else:
-                        # other side closed the socket, close this side too
+                        # other side closed the socket, close this side too (there is no one to flush to)
+                        self.isConnected = False
+                        self.isClosed = True
                         self.close()
                         break
 
 
-    def getNextSequenceNumber(self):
-        # acquire the sequence number lock so only this thread can change the sequence number value
-        with self.sequenceNumberLock:
-            if self.sequenceNumber < 65535:
-                # increase the sequence number by 1
-                self.sequenceNumber = self.sequenceNumber + 1
+    # ------------------------------------------------------------------------ #
+    # handles a packet received on this connection, called by the connection  #
+    # thread, or by the listening socket thread for accepted connections      #
+    # ------------------------------------------------------------------------ #
+    def handlePacket(self, receivedPacketType, receivedSequenceNumber, receivedData):
+        self.packetsReceived = self.packetsReceived + 1
+        self.bytesReceived = self.bytesReceived + HEADER_LENGTH + len(receivedData)
+        if receivedPacketType == PACKET_TYPE_SYN:
+            log("receive(): Got SYN packet")
+            self.handleSynPacket(receivedSequenceNumber, receivedData)
+        elif receivedPacketType == PACKET_TYPE_DATA or receivedPacketType == PACKET_TYPE_END:
+            if isPacketLog:
+                log(f"handleSenderControlPackets(): Got DATA/END packet, receivedSequenceNumber: {receivedSequenceNumber} nextExpectedSequenceNumber: {self.nextExpectedSequenceNumber}")
+            self.handleDataPacket(receivedPacketType, receivedSequenceNumber, receivedData)
+        elif receivedPacketType == PACKET_TYPE_ACK:
+            log("handleSenderControlPackets(): Got ACK packet")
+            if self.listeningSocket is not None and len(receivedData) >= SYN_COOKIE_ECHO.size:
+                # the client returned our cookie again, the ACK of its SYN was lost, so acknowledge its SYN again
+                self.sendAckPacket(SYN_COOKIE_ECHO.unpack_from(receivedData)[0])
+            # if ACK packet received from the receiver then remove the received SequenceNumber from the waitingForAcknowledge
+            with self.waitingForAcknowledgeCondition:
+                self.acknowledgePackets([receivedSequenceNumber])
+        elif receivedPacketType == PACKET_TYPE_SACK:
+            if isPacketLog:
+                log(f"handleSenderControlPackets(): Got SACK packet, cumulativeAck: {receivedSequenceNumber}")
+            self.handleSackPacket(receivedSequenceNumber, receivedData)
+        elif receivedPacketType == PACKET_TYPE_RST:
+            # received RST packet from sender, close the socket (there is no one to flush to or to finish the
+            # handshake with)
+            log("handleSenderControlPackets(): Got RST packet")
+            self.isConnected = False
+            self.isClosed = True
+            self.close()
+        elif receivedPacketType == PACKET_TYPE_NACK:
+            if isPacketLog:
+                log(f"handleSenderControlPackets(): Got NACK packet, first missing: {receivedSequenceNumber}")
+            missingPackets = NACK_PAYLOAD.unpack_from(receivedData)[0]
+            with self.waitingForAcknowledgeCondition:
+                self.retransmitLostPackets([(receivedSequenceNumber + missingIndex) % SEQUENCE_NUMBER_SPACE
+                                            for missingIndex in range(min(missingPackets, RECEIVE_WINDOW_SIZE))])
+        elif receivedPacketType == PACKET_TYPE_FEC:
+            if isPacketLog:
+                log(f"handleSenderControlPackets(): Got FEC packet, group start: {receivedSequenceNumber}")
+            self.handleFecPacket(receivedSequenceNumber, receivedData)
+        elif receivedPacketType == PACKET_TYPE_PROBE:
+            # path MTU probe from the other side, tell it the probe size got through
+            self.sendRUDPPacket(PACKET_TYPE_PROBE_ACK, HEADER_LENGTH + len(receivedData), b'')
+        elif receivedPacketType == PACKET_TYPE_PROBE_ACK:
+            with self.waitingForAcknowledgeCondition:
+                self.lastProbeAckSize = receivedSequenceNumber
+                self.waitingForAcknowledgeCondition.notify_all()
+        else:
+            # if we received any other packet type then print error message
+            log(f"handleSenderControlPackets(): unexpected packet type: {receivedPacketType}, ignoring it")
+
+
+    # --------------------------------------------------------------------------------- #
+    # received SYN packet from sender, save the sequence number the first DATA packet   #
+    # will have (it is used to put each arriving packet in order), agree on the max     #
+    # packet size (and the options) with the other side, deliver the first message if  #
+    # the SYN carries one, and reply with ACK                                           #
+    # --------------------------------------------------------------------------------- #
+    def handleSynPacket(self, synSequenceNumber, synData):
+        # a retransmitted SYN must not reset a connection that is already receiving data (or deliver its data again),
+        # but while our own SYN waits for its ACK the other side is a listening socket that keeps no state for us yet,
+        # so its SYN (with a new cookie) replaces the one before it
+        isOurSynWaiting = not self.isConnected and self.synSequenceNumber in self.waitingForAcknowledge
+        if self.nextExpectedSequenceNumber is None or isOurSynWaiting:
+            with self.receivedDataCondition:
+                self.nextExpectedSequenceNumber = getFollowingSequenceNumber(synSequenceNumber)
+                self.highestReceivedSequenceNumber = synSequenceNumber
+                if len(synData) > SYN_PAYLOAD.size:
+                    # the SYN carries a whole message, it comes before all the DATA packets
+                    self.receivedChunks.append(bytes(synData[SYN_PAYLOAD.size:]))
+                    self.receivedChunks.append(None)
+                    self.receivedDataCondition.notify_all()
+        if self.negotiatedPacketSize is None:
+            peerMaxPacketSize, peerSynFlags = SYN_PAYLOAD.unpack_from(synData) if len(synData) >= SYN_PAYLOAD.size \
+                else (MTU, 0)
+            self.negotiatedPacketSize = max(min(self.maxPacketSize, peerMaxPacketSize), MTU)
+            if self.useCompression and peerSynFlags & SYN_FLAG_COMPRESSION:
+                self.compressor = zlib.compressobj(COMPRESSION_LEVEL)
+                self.decompressor = zlib.decompressobj()
+            self.startPathMtuProbe()
+        if isOurSynWaiting:
+            # the listening socket made its cookie from our SYN, so like a TCP SYN-ACK its SYN finishes our side of the
+            # handshake and send() may start now. the ACK that returns the cookie with our SYN (it creates our
+            # connection on the listening socket) takes the place of our SYN in waitingForAcknowledge, so it is
+            # retransmitted until the listening socket acknowledges our SYN
+            with self.waitingForAcknowledgeCondition:
+                synPacket = self.waitingForAcknowledge.get(self.synSequenceNumber)
+                if synPacket is not None:
+                    handshakeRtt = self.takeHandshakeRttSample()
+                    self.waitingForAcknowledge[self.synSequenceNumber] = self.sendRUDPPacket(
+                        PACKET_TYPE_ACK, synSequenceNumber, buildSynCookieEcho(self.synSequenceNumber, handshakeRtt,
+                                                                               synPacket))
+                    self.packetTransmitTimes[self.synSequenceNumber] = time.time()
+                    self.isConnected = True
+                    log("SYN cookie received")
+                    self.waitingForAcknowledgeCondition.notify_all()
+            self.startPathMtuProbe()
+            return
+        self.sendAckPacket(synSequenceNumber)
+
+
+    # ------------------------------------------------------------------------------ #
+    # the listening socket answered our SYN with its SYN, that is a round trip we     #
+    # can measure (unless our SYN was retransmitted), take it as an RTT sample and    #
+    # return it (0 if there is none) so the listening socket can use it too. the ACK #
+    # of our SYN comes a round trip later (the listener waits for our ACK to create   #
+    # the connection), so it must not be used as a sample                            #
+    # ------------------------------------------------------------------------------ #
+    def takeHandshakeRttSample(self):
+        with self.waitingForAcknowledgeCondition:
+            transmitTime = self.packetTransmitTimes.get(self.synSequenceNumber)
+            if transmitTime is None or self.synSequenceNumber in self.retransmittedSequenceNumbers:
+                return 0
+            handshakeRtt = time.time() - transmitTime
+            self.rttEstimator.addSample(handshakeRtt)
+            # like a retransmitted packet (Karn's algorithm), the ACK of our SYN is not an RTT sample
+            self.retransmittedSequenceNumbers.add(self.synSequenceNumber)
+            return handshakeRtt
+
+
+    # ---------------------------------------------------------------------------- #
+    # starts the path MTU search once the handshake is done, if the other side     #
+    # agreed on packets bigger than MTU                                            #
+    # ---------------------------------------------------------------------------- #
+    def startPathMtuProbe(self):
+        if self.isPathMtuProbeStarted or not self.isConnected or self.negotiatedPacketSize is None \
+                or self.negotiatedPacketSize <= self.packetSize:
+            return
+        self.isPathMtuProbeStarted = True
+        probeThread = threading.Thread(target=self.probePathMtu, name="RUDP-pmtu-probe", daemon=True)
+        probeThread.start()
+
+
+    # ------------------------------------------------------------------------------ #
+    # path MTU probe thread, searches the biggest packet size (up to the negotiated  #
+    # size) that gets to the other side: it tries the negotiated size first (so on   #
+    # loopback it is done after one probe) and then does a binary search, each probe #
+    # that gets through raises the size of the DATA packets this socket sends        #
+    # ------------------------------------------------------------------------------ #
+    def probePathMtu(self):
+        smallestFailedSize = self.negotiatedPacketSize + 1
+        probeSize = self.negotiatedPacketSize
+        while not self.isClosed:
+            if self.sendPathMtuProbe(probeSize):
+                self.packetSize = probeSize
             else:
-                # reset the sequence number back to 0 since it is about to exceed the 4 byte max number (FFFF)
-                self.sequenceNumber = 0
-            return self.sequenceNumber
+                smallestFailedSize = probeSize
+            if smallestFailedSize - self.packetSize <= PMTU_SEARCH_PRECISION:
+                break
+            probeSize = (self.packetSize + smallestFailedSize) // 2
+        log(f"probePathMtu(): packet size: {self.packetSize} to: {self.receiverAddress}")
 
 
-    def reduceWindowSize(self):
-        with self.windowSizeLock:
-            if self.windowSize > 1:
-                self.windowSize = self.windowSize - 1
+    # ------------------------------------------------------------------------- #
+    # sends a PROBE packet of probeSize bytes and waits one RTO for its ACK,    #
+    # returns True if it got through (it is sent up to PMTU_PROBE_RETRIES times #
+    # so a random loss doesn't shrink the packet size)                          #
+    # ------------------------------------------------------------------------- #
+    def sendPathMtuProbe(self, probeSize):
+        probePacket = buildPacket(PACKET_TYPE_PROBE, self.connectionId, probeSize, bytes(probeSize - HEADER_LENGTH))
+        for probeNumber in range(PMTU_PROBE_RETRIES):
+            try:
+                self.rudpSocket.sendto(probePacket, self.receiverAddress)
+                self.countSentPacket(probePacket)
+            except OSError as err:
+                # the packet is bigger than the MTU of our own network interface (EMSGSIZE)
+                log(f"sendPathMtuProbe(): can't send {probeSize} bytes probe: {err}")
+                return False
+            with self.waitingForAcknowledgeCondition:
+                if self.waitingForAcknowledgeCondition.wait_for(lambda: self.lastProbeAckSize == probeSize,
+                                                                self.rttEstimator.getRetransmissionTimeout()):
+                    return True
+            if self.isClosed:
+                break
+        return False
+
+
+    # ------------------------------------------------------------------------------- #
+    # received DATA/END packet from the sender, keep it in the receive window until   #
+    # all the packets before it arrive, then move the in-order packets to the caller  #
+    # queue. the received packets are not acknowledged one by one, they are coalesced #
+    # into a single SACK packet that also advertises the free receive window          #
+    # ------------------------------------------------------------------------------- #
+    def handleDataPacket(self, packetType, sequenceNumber, data):
+        # we can't place the packet in order before we know the first sequence number (SYN was not received yet)
+        if self.nextExpectedSequenceNumber is None:
+            return
+
+        with self.receivedDataCondition:
+            # the distance of the packet from the next expected packet, a packet we already moved to the caller
+            # queue is "behind" us, so its distance is more than half the sequence space
+            sequenceOffset = (sequenceNumber - self.nextExpectedSequenceNumber) % SEQUENCE_NUMBER_SPACE
+            isDuplicate = sequenceOffset >= SEQUENCE_NUMBER_SPACE // 2
+
+            # a packet beyond the free receive window is dropped, the sender will send it again later
+            isOutsideWindow = not isDuplicate and sequenceOffset >= self.getFreeReceiveWindow()
+            isEndReceived = False
+            isDataReady = False
+            if not isDuplicate and not isOutsideWindow:
+                receiveWindowSlot = sequenceNumber % RECEIVE_WINDOW_SIZE
+                if self.receiveWindow is None or self.receiveWindow[receiveWindowSlot] is None:
+                    # copy the data out of the receive buffer, it is reused for the next packet
+                    data = bytes(data)
+                    if sequenceOffset == 0:
+                        # the packet is in order, it goes straight to the caller queue
+                        isEndReceived = self.deliverPacket(packetType, data)
+                        isDataReady = True
+                    else:
+                        # keep the packet until all the packets before it arrive, the ring buffer is allocated only
+                        # once a packet arrives out of order (a connection without losses never needs it)
+                        if self.receiveWindow is None:
+                            self.receiveWindow = [None] * RECEIVE_WINDOW_SIZE
+                        self.receiveWindow[receiveWindowSlot] = (packetType, data)
+                        self.receiveWindowCount = self.receiveWindowCount + 1
+                    if self.recentPackets is not None:
+                        self.recentPackets[receiveWindowSlot] = (sequenceNumber, packetType, data)
+                    # a packet after a gap, ask the sender for the missing packets right away (once per gap)
+                    highestOffset = (sequenceNumber - self.highestReceivedSequenceNumber) % SEQUENCE_NUMBER_SPACE
+                    if 0 < highestOffset < SEQUENCE_NUMBER_SPACE // 2:
+                        if highestOffset > 1:
+                            self.sendNackPacket(getFollowingSequenceNumber(self.highestReceivedSequenceNumber),
+                                                highestOffset - 1)
+                        self.highestReceivedSequenceNumber = sequenceNumber
+                else:
+                    isDuplicate = True
+            if isDuplicate:
+                self.duplicatePackets = self.duplicatePackets + 1
+            self.traceEvent('duplicate' if isDuplicate else 'receive', sequenceNumber)
+
+            # the packet filled the gap before the packets kept in the ring buffer, move the ones that are now in
+            # order to the caller queue
+            if isDataReady and self.receiveWindowCount > 0:
+                nextSlot = self.nextExpectedSequenceNumber % RECEIVE_WINDOW_SIZE
+                while self.receiveWindow[nextSlot] is not None:
+                    nextPacketType, nextData = self.receiveWindow[nextSlot]
+                    self.receiveWindow[nextSlot] = None
+                    self.receiveWindowCount = self.receiveWindowCount - 1
+                    isEndReceived = self.deliverPacket(nextPacketType, nextData) or isEndReceived
+                    nextSlot = self.nextExpectedSequenceNumber % RECEIVE_WINDOW_SIZE
+            if isDataReady:
+                self.receivedDataCondition.notify_all()
+
+            # send the SACK now if the sender needs it to stop waiting (gap, duplicate, END or full window),
+            # otherwise delay it so a few packets can be acknowledged together
+            self.pendingAckCount = self.pendingAckCount + 1
+            self.quickAckCount = max(self.quickAckCount - 1, 0)
+            if isDuplicate or isOutsideWindow or isEndReceived or self.receiveWindowCount > 0 \
+                    or self.pendingAckCount >= ACK_EVERY_PACKETS or self.quickAckCount > 0:
+                self.sendSackPacket()
+
+
+    # ---------------------------------------------------------------------------- #
+    # moves the next in-order packet to the caller queue, returns True if it was   #
+    # an END packet, must be called while holding the receivedDataCondition        #
+    # ---------------------------------------------------------------------------- #
+    def deliverPacket(self, packetType, data):
+        self.nextExpectedSequenceNumber = getFollowingSequenceNumber(self.nextExpectedSequenceNumber)
+        if packetType == PACKET_TYPE_DATA:
+            if self.decompressor is not None:
+                data = self.decompressMessageData(data)
+            if data:
+                self.receivedChunks.append(data)
+            return False
+        # END packet means the current data buffer transmission ended,
+        # next packets belongs to the next data buffer
+        log("handleSenderControlPackets(): Got END packet")
+        self.receivedChunks.append(None)
+        self.isCompressedMessage = None
+        return True
 
 
-    def increaseWindowSize(self):
-        with self.windowSizeLock:
-            if self.windowSize < MAX_WINDOW_SIZE:
-                self.windowSize = self.windowSize + 1
+    # ------------------------------------------------------------------------- #
+    # returns the data of a DATA packet of a connection that negotiated         #
+    # compression without the message header byte (in the first packet of the #
+    # message) and decompressed if the message is compressed                   #
+    # ------------------------------------------------------------------------- #
+    def decompressMessageData(self, data):
+        if self.isCompressedMessage is None:
+            self.isCompressedMessage = data[:1] == MESSAGE_HEADER_COMPRESSED
+            data = data[1:]
+        if self.isCompressedMessage:
+            return self.decompressor.decompress(data)
+        return data
+
 
+    # ------------------------------------------------------------------------------ #
+    # received FEC packet from the sender, if exactly one packet of its group was    #
+    # lost, rebuild it from the parity and the other packets of the group and        #
+    # handle it as if it arrived (a group with more losses waits for retransmission) #
+    # ------------------------------------------------------------------------------ #
+    def handleFecPacket(self, groupStartSequenceNumber, fecData):
+        with self.receivedDataCondition:
+            if self.recentPackets is None:
+                # the sender uses FEC, start keeping the received packets so the next groups can be rebuilt
+                self.recentPackets = [None] * RECEIVE_WINDOW_SIZE
+                return
+            groupSize, xorType, xorLength = FEC_HEADER.unpack_from(fecData)
+            xorData = int.from_bytes(fecData[FEC_HEADER.size:], 'little')
+
+            # XOR the parity with every packet of the group we have, what is left is the lost packet
+            lostSequenceNumber = None
+            for groupIndex in range(groupSize):
+                sequenceNumber = (groupStartSequenceNumber + groupIndex) % SEQUENCE_NUMBER_SPACE
+                recentPacket = self.recentPackets[sequenceNumber % RECEIVE_WINDOW_SIZE]
+                if recentPacket is not None and recentPacket[0] == sequenceNumber:
+                    xorType = xorType ^ recentPacket[1]
+                    xorLength = xorLength ^ len(recentPacket[2])
+                    xorData = xorData ^ int.from_bytes(recentPacket[2], 'little')
+                elif lostSequenceNumber is None:
+                    lostSequenceNumber = sequenceNumber
+                else:
+                    # more than one packet of the group was lost, the XOR parity can't rebuild them
+                    return
+            if lostSequenceNumber is None or (xorType != PACKET_TYPE_DATA and xorType != PACKET_TYPE_END):
+                return
+            try:
+                lostData = xorData.to_bytes(xorLength, 'little')
+            except OverflowError:
+                # the parity doesn't match the packets we have (some of them are from an older group)
+                return
+
+        log(f"handleFecPacket(): rebuilt packet: {lostSequenceNumber}")
+        self.fecRecoveredPackets = self.fecRecoveredPackets + 1
+        self.traceEvent('fec', lostSequenceNumber)
+        self.handleDataPacket(xorType, lostSequenceNumber, lostData)
+
+
+    # --------------------------------------------------------------------------- #
+    # returns the number of packets the receiver can still take, the packets that  #
+    # the caller did not consume yet and the out of order packets take its space  #
+    # --------------------------------------------------------------------------- #
+    def getFreeReceiveWindow(self):
+        return max(RECEIVE_WINDOW_SIZE - len(self.receivedChunks) - self.receiveWindowCount, 0)
+
+
+    # ------------------------------------------------------------------------------- #
+    # after the caller consumed data, tell the sender about the freed receive window   #
+    # if the window we advertised last time was too small for the sender to keep going #
+    # must be called while holding the receivedDataCondition                           #
+    # ------------------------------------------------------------------------------- #
+    def sendWindowUpdate(self):
+        if self.nextExpectedSequenceNumber is None or self.isClosed:
+            return
+        if self.lastAdvertisedWindow < RECEIVE_WINDOW_SIZE // 2 <= self.getFreeReceiveWindow():
+            self.sendSackPacket()
+
+
+    # -------------------------------------------------------------------------- #
+    # received SACK packet from the receiver, remove all the packets up to the    #
+    # cumulative ACK and all the packets in the SACK bitmap from waiting list     #
+    # -------------------------------------------------------------------------- #
+    def handleSackPacket(self, cumulativeAck, sackPayload):
+        selectivelyAcknowledged, advertisedWindow = parseSackPayload(cumulativeAck, sackPayload)
+        with self.waitingForAcknowledgeCondition:
+            if advertisedWindow is not None:
+                if advertisedWindow > self.receiverWindowSize:
+                    # the receiver window opened (window update), wake up the sender even if nothing was acknowledged
+                    self.waitingForAcknowledgeCondition.notify_all()
+                self.receiverWindowSize = advertisedWindow
+            # the cumulative ACK acknowledges every packet that doesn't come after it (in serial number order, a
+            # plain <= would acknowledge the packets sent after a wrap too early and the ones before it never)
+            self.acknowledgePackets(getSackAcknowledged(self.waitingForAcknowledge, cumulativeAck,
+                                                        selectivelyAcknowledged))
+
+            # the receiver got packets after the cumulative ACK but not the one right after it, after a few such
+            # SACKs in a row consider it lost (fast retransmit), a window update SACK doesn't count
+            if cumulativeAck != self.lastCumulativeAck:
+                self.lastCumulativeAck = cumulativeAck
+                self.duplicateAckCount = 0
+            elif selectivelyAcknowledged:
+                self.duplicateAckCount = self.duplicateAckCount + 1
+                if self.duplicateAckCount >= DUPLICATE_ACK_THRESHOLD:
+                    self.retransmitLostPackets([getFollowingSequenceNumber(cumulativeAck)])
 
-    def sendSynPacket(self):
+
+    # ------------------------------------------------------------------------------ #
+    # retransmits the lost packets (reported by a NACK or by duplicate SACKs) right  #
+    # away, a packet that was sent less than one RTT ago is skipped since its ACK   #
+    # may still be on the way, the congestion window shrinks at most once per RTT   #
+    # must be called while holding the waitingForAcknowledgeCondition               #
+    # ------------------------------------------------------------------------------ #
+    def retransmitLostPackets(self, sequenceNumbers):
+        currentTime = time.time()
+        roundTripTime = self.rttEstimator.smoothedRtt or self.rttEstimator.getRetransmissionTimeout()
+        numberOfRetransmittedPackets = 0
+        for sequenceNumber in sequenceNumbers:
+            lostPacket = self.waitingForAcknowledge.get(sequenceNumber)
+            if lostPacket is None or currentTime - self.packetTransmitTimes[sequenceNumber] < roundTripTime:
+                continue
+            if isPacketLog:
+                log(f"retransmitLostPackets(): {sequenceNumber} to: {self.receiverAddress}")
+            self.rudpSocket.sendto(lostPacket, self.receiverAddress)
+            self.packetTransmitTimes[sequenceNumber] = currentTime
+            self.retransmittedSequenceNumbers.add(sequenceNumber)
+            self.countSentPacket(lostPacket)
+            self.traceEvent('retransmit', sequenceNumber)
+            numberOfRetransmittedPackets = numberOfRetransmittedPackets + 1
+        self.retransmittedPackets = self.retransmittedPackets + numberOfRetransmittedPackets
+
+        if numberOfRetransmittedPackets > 0 and currentTime - self.lastPacketLossTime >= roundTripTime:
+            self.lastPacketLossTime = currentTime
+            self.congestionControl.onPacketLoss()
+            self.packetLosses = self.packetLosses + 1
+            self.traceEvent('loss', numberOfRetransmittedPackets)
+
+
+    # ------------------------------------------------------------------------------ #
+    # removes the acknowledged packets from the waitingForAcknowledge dictionary,     #
+    # takes an RTT sample from the newest packet that was not retransmitted (Karn's   #
+    # algorithm), lets the congestion control grow the window and wakes the sender   #
+    # must be called while holding the waitingForAcknowledgeCondition                 #
+    # ------------------------------------------------------------------------------ #
+    def acknowledgePackets(self, sequenceNumbers):
+        currentTime = time.time()
+        newestTransmitTime = None
+        numberOfAcknowledgedPackets = 0
+        for sequenceNumber in sequenceNumbers:
+            poppedPacket = self.waitingForAcknowledge.pop(sequenceNumber, None)
+            transmitTime = self.packetTransmitTimes.pop(sequenceNumber, None)
+            if not poppedPacket:
+                continue
+            numberOfAcknowledgedPackets = numberOfAcknowledgedPackets + 1
+            if sequenceNumber in self.retransmittedSequenceNumbers:
+                self.retransmittedSequenceNumbers.discard(sequenceNumber)
+            elif transmitTime is not None and (newestTransmitTime is None or transmitTime > newestTransmitTime):
+                newestTransmitTime = transmitTime
+            # if we received an ACK for the SYN then mark socket as connected
+            poppedPacketType, poppedConnectionId, poppedSequenceNumber, poppedDataLength, poppedData = parsePacket(poppedPacket)
+            if poppedPacketType == PACKET_TYPE_SYN:
+                self.isConnected = True
+                log("SYN ACK received")
+                self.startPathMtuProbe()
+
+        if numberOfAcknowledgedPackets > 0:
+            if newestTransmitTime is not None:
+                self.rttEstimator.addSample(currentTime - newestTransmitTime)
+            # increase the window size (since we succeeded)
+            self.congestionControl.onAcknowledge(numberOfAcknowledgedPackets)
+            self.traceEvent('ack', numberOfAcknowledgedPackets)
+            # wake up the sender, the window has more space now
+            self.waitingForAcknowledgeCondition.notify_all()
+
+
+    def getNextSequenceNumber(self):
+        # acquire the sender condition lock so only this thread can change the sequence number value
+        with self.waitingForAcknowledgeCondition:
+            # increase the sequence number by 1, it wraps back to 0 after the 4 byte max number (FFFFFFFF)
+            self.sequenceNumber = getFollowingSequenceNumber(self.sequenceNumber)
+            return self.sequenceNumber
+
+
+    def sendSynPacket(self, firstMessage=b''):
         log("sendSynPacket()")
         # get the next valid sequence number, send the packet and add it to waiting for acknowledge dictionary
         sequenceNumber = self.getNextSequenceNumber()
-        rudpPacket = self.sendRUDPPacket(PACKET_TYPE_SYN, sequenceNumber, bytes("", "utf-8"))
-        with self.waitingForAcknowledgeLock:
+        self.synSequenceNumber = sequenceNumber
+        # hold the lock while sending, so the ACK can't be handled before the packet is waiting for it
+        with self.waitingForAcknowledgeCondition:
+            # the SYN tells the other side the max packet size we can receive and the options we support, followed by
+            # the first message (if any)
+            synPayload = SYN_PAYLOAD.pack(self.maxPacketSize, self.getSynFlags()) + bytes(firstMessage)
+            rudpPacket = self.sendRUDPPacket(PACKET_TYPE_SYN, sequenceNumber, synPayload)
             self.waitingForAcknowledge[sequenceNumber] = rudpPacket
+            self.packetTransmitTimes[sequenceNumber] = time.time()
+            self.traceEvent('send', sequenceNumber)
+        self.scheduleRetransmission(sequenceNumber)
 
 
     def sendDataPacket(self, dataToSend):
         log("sendDataPacket()")
         # get the next valid sequence number, send the packet and add it to waiting for acknowledge dictionary
         sequenceNumber = self.getNextSequenceNumber()
-        rudpPacket = self.sendRUDPPacket(PACKET_TYPE_DATA, sequenceNumber, dataToSend)
-        with self.waitingForAcknowledgeLock:
+        # hold the lock while sending, so the ACK can't be handled before the packet is waiting for it
+        with self.waitingForAcknowledgeCondition:
+            rudpPacket = self.sendRUDPPacket(PACKET_TYPE_DATA, sequenceNumber, dataToSend)
             self.waitingForAcknowledge[sequenceNumber] = rudpPacket
+            self.packetTransmitTimes[sequenceNumber] = time.time()
+            self.addToFecGroup(sequenceNumber, PACKET_TYPE_DATA, dataToSend)
+            self.traceEvent('send', sequenceNumber)
+        self.scheduleRetransmission(sequenceNumber)
+
+
+    # ---------------------------------------------------------------------------- #
+    # sends consecutive DATA packets with one sendmsg() call, the kernel splits    #
+    # the buffer into a datagram per packet (UDP_SEGMENT), all the chunks have the #
+    # same size except the last one that may be shorter                           #
+    # ---------------------------------------------------------------------------- #
+    def sendDataPacketsWithGso(self, dataChunksToSend):
+        if isPacketLog:
+            log(f"sendDataPacketsWithGso(): {len(dataChunksToSend)} packets")
+        sequenceNumbers = [self.getNextSequenceNumber() for dataChunk in dataChunksToSend]
+        rudpPackets = [buildPacket(PACKET_TYPE_DATA, self.connectionId, sequenceNumber, dataChunk)
+                       for sequenceNumber, dataChunk in zip(sequenceNumbers, dataChunksToSend)]
+        # hold the lock while sending, so the ACK can't be handled before the packets are waiting for it
+        with self.waitingForAcknowledgeCondition:
+            try:
+                segmentSize = UDP_SEGMENT_SIZE.pack(len(rudpPackets[0]))
+                self.rudpSocket.sendmsg(rudpPackets, [(socket.SOL_UDP, UDP_SEGMENT, segmentSize)], 0,
+                                        self.receiverAddress)
+            except OSError as err:
+                # the kernel (or the network device) doesn't support UDP GSO, send the packets one by one from now on
+                log(f"sendDataPacketsWithGso(): UDP GSO failed, disabling it: {err}")
+                self.useUdpGso = False
+                for rudpPacket in rudpPackets:
+                    self.rudpSocket.sendto(rudpPacket, self.receiverAddress)
+            sendTime = time.time()
+            for sequenceNumber, rudpPacket, dataChunk in zip(sequenceNumbers, rudpPackets, dataChunksToSend):
+                self.waitingForAcknowledge[sequenceNumber] = rudpPacket
+                self.packetTransmitTimes[sequenceNumber] = sendTime
+                self.addToFecGroup(sequenceNumber, PACKET_TYPE_DATA, dataChunk)
+                self.countSentPacket(rudpPacket)
+                self.traceEvent('send', sequenceNumber)
+        for sequenceNumber in sequenceNumbers:
+            self.scheduleRetransmission(sequenceNumber)
+
+
+    def getSynFlags(self):
+        return SYN_FLAG_COMPRESSION if self.useCompression else 0
 
 
     def sendENDPacket(self):
         log("sendENDPacket()")
-        # get the next valid sequence number
+        # get the next valid sequence number, send the packet and add it to waiting for acknowledge dictionary
         sequenceNumber = self.getNextSequenceNumber()
-        self.sendRUDPPacket(PACKET_TYPE_END, sequenceNumber, bytes("", "utf-8"))
+        # hold the lock while sending, so the ACK can't be handled before the packet is waiting for it
+        with self.waitingForAcknowledgeCondition:
+            rudpPacket = self.sendRUDPPacket(PACKET_TYPE_END, sequenceNumber, bytes("", "utf-8"))
+            self.waitingForAcknowledge[sequenceNumber] = rudpPacket
+            self.packetTransmitTimes[sequenceNumber] = time.time()
+            self.addToFecGroup(sequenceNumber, PACKET_TYPE_END, b'')
+            self.traceEvent('send', sequenceNumber)
+        self.scheduleRetransmission(sequenceNumber)
+
+
+    # ------------------------------------------------------------------------------ #
+    # adds a DATA/END packet that was just sent to the current FEC group, once the   #
+    # group is full (or the message ended) its XOR parity is sent in a FEC packet    #
+    # ------------------------------------------------------------------------------ #
+    def addToFecGroup(self, sequenceNumber, packetType, packetData):
+        if not self.fecGroupSize:
+            return
+        if self.fecGroupCount == 0:
+            self.fecGroupStart = sequenceNumber
+            self.fecXorType = 0
+            self.fecXorLength = 0
+            self.fecXorData = 0
+            self.fecMaxLength = 0
+        self.fecXorType = self.fecXorType ^ packetType
+        self.fecXorLength = self.fecXorLength ^ len(packetData)
+        self.fecXorData = self.fecXorData ^ int.from_bytes(packetData, 'little')
+        self.fecMaxLength = max(self.fecMaxLength, len(packetData))
+        self.fecGroupCount = self.fecGroupCount + 1
+
+        if self.fecGroupCount >= self.fecGroupSize or packetType == PACKET_TYPE_END:
+            fecPayload = FEC_HEADER.pack(self.fecGroupCount, self.fecXorType, self.fecXorLength) + \
+                self.fecXorData.to_bytes(self.fecMaxLength, 'little')
+            self.sendRUDPPacket(PACKET_TYPE_FEC, self.fecGroupStart, fecPayload)
+            self.fecGroupCount = 0
+
+
+    # ---------------------------------------------------------------------------- #
+    # sets the retransmission timer of a packet that was just sent to one RTO away #
+    # ---------------------------------------------------------------------------- #
+    def scheduleRetransmission(self, sequenceNumber):
+        retransmissionTimeout = self.rttEstimator.getRetransmissionTimeout()
+        retransmissionScheduler.schedule(self, sequenceNumber, time.time() + retransmissionTimeout)
 
 
     def sendRSTPacket(self):
@@ -407,28 +1788,40 @@ class RUDPSocket:
         self.sendRUDPPacket(PACKET_TYPE_RST, sequenceNumber, bytes("", "utf-8"))
 
 
-    def sendAckPacket(self, sequenceNumberToAck):
+    def sendAckPacket(self, sequenceNumberToAck, ackData=b''):
         log("sendAckPacket()")
-        self.sendRUDPPacket(PACKET_TYPE_ACK, sequenceNumberToAck, bytes("", "utf-8"))
+        self.sendRUDPPacket(PACKET_TYPE_ACK, sequenceNumberToAck, ackData)
 
 
-    def sendRUDPPacket(self, packetType, packetSequenceNumber, packetData):
-        # set the value of the packet header fields
-        packetDataLength = len(packetData)  # payload length, the length of the data bytes
+    def sendNackPacket(self, firstMissingSequenceNumber, missingPackets):
+        if isPacketLog:
+            log(f"sendNackPacket(): {missingPackets} packets from: {firstMissingSequenceNumber}")
+        self.sendRUDPPacket(PACKET_TYPE_NACK, firstMissingSequenceNumber, NACK_PAYLOAD.pack(missingPackets))
+
 
-        # convert the packet header fields into 4 bytes, in big-endian order
-        packetTypeBytes = packetType.to_bytes(4, byteorder='big')
-        packetSequenceNumberBytes = packetSequenceNumber.to_bytes(4, byteorder='big')
-        packetDataLengthBytes = packetDataLength.to_bytes(4, byteorder='big')
+    def sendSackPacket(self):
+        log("sendSackPacket()")
+        with self.receivedDataCondition:
+            # the cumulative ACK is the last sequence number we received in order
+            cumulativeAck = (self.nextExpectedSequenceNumber - 1) % SEQUENCE_NUMBER_SPACE
+            self.lastAdvertisedWindow = self.getFreeReceiveWindow()
+            self.pendingAckCount = 0
+            sackPayload = buildSackPayload(cumulativeAck, self.receiveWindow, self.lastAdvertisedWindow)
+        self.sendRUDPPacket(PACKET_TYPE_SACK, cumulativeAck, sackPayload)
 
-        # create the packet header by combining the packetType, packetSequenceNumber, packetDataLength bytes together
-        packetHeader = packetTypeBytes + packetSequenceNumberBytes + packetDataLengthBytes
 
-        # create the packet by combining the packetHeader, packetBody together
-        rudpPacket = packetHeader + packetData
+    def sendRUDPPacket(self, packetType, packetSequenceNumber, packetData):
+        rudpPacket = buildPacket(packetType, self.connectionId, packetSequenceNumber, packetData)
 
         # send the RUDP packet to the receiver using the open socket
-        log(f"sendRUDPPacket(): {rudpPacket} to: {self.receiverAddress}")
+        if isPacketLog:
+            log(f"sendRUDPPacket(): {rudpPacket} to: {self.receiverAddress}")
         self.rudpSocket.sendto(rudpPacket, self.receiverAddress)
+        self.countSentPacket(rudpPacket)
 
         return rudpPacket
+
+
+    def countSentPacket(self, rudpPacket):
+        self.packetsSent = self.packetsSent + 1
+        self.bytesSent = self.bytesSent + len(rudpPacket)
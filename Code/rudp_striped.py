@@ -0,0 +1,447 @@
+import multiprocessing
+import os
+import struct
+import sys
+import threading
+import time
+from rudp_socket import RUDPSocket, log, SOCKET_MAX_TIMEOUT, DEFAULT_MAX_PACKET_SIZE
+from rudp_congestion import DEFAULT_CONGESTION_CONTROL
+
+
+# the number of RUDP sub-flows (stripes) a striped socket asks for when the caller did not choose
+DEFAULT_NUMBER_OF_STRIPES = 4
+
+# the listening side never opens more sub-flows than this for a single striped connection
+MAX_NUMBER_OF_STRIPES = 16
+
+# the data of a striped connection is cut into blocks of this size, block number k is sent on stripe k % N, big
+# blocks keep every sub-flow busy with long messages while the receiver still gets the data in small steps
+STRIPE_BLOCK_SIZE = 256 * 1024 # 256 KB
+
+# every block is sent on its stripe with its length before it, so the receiving sub-flow can cut the RUDP byte
+# stream back into blocks (a single RUDP receive() may return only a part of a message)
+STRIPE_BLOCK_HEADER = struct.Struct('!I')
+
+# the first message of the control connection: the number of stripes the connecting side asks for
+STRIPE_REQUEST = struct.Struct('!B')
+
+# the reply of the listening side: the number of stripes it opened followed by the udp port of each stripe
+STRIPE_PORT = struct.Struct('!H')
+
+# the sub-flows run in their own processes (so a single transfer can use more than one CPU core), they are spawned
+# and not forked because a forked child would inherit the RUDP threads state without the threads themselves
+STRIPE_PROCESS_CONTEXT = multiprocessing.get_context('spawn')
+
+
+# ------------------------------------------------------------------------------ #
+# reads exactly numberOfBytes from the RUDP connection, returns None if the      #
+# connection was closed (or timed out) before all of them arrived                #
+# ------------------------------------------------------------------------------ #
+def receiveExactly(rudpConnection, numberOfBytes):
+    receivedData = b''
+    while len(receivedData) < numberOfBytes:
+        dataChunk = rudpConnection.receive(numberOfBytes - len(receivedData))
+        if not dataChunk:
+            return None
+        receivedData = receivedData + dataChunk
+    return receivedData
+
+
+# ---------------------------------------------------------------------------------- #
+# the main function of a sub-flow process, it opens one RUDP connection (connects to #
+# connectAddress, or listens on listenAddress and reports its port to the parent)    #
+# and moves the blocks between it and the parent pipe: blocks from the pipe are sent #
+# on the connection and blocks received on the connection are written to the pipe,  #
+# an empty block from the parent closes the connection and ends the process          #
+# ---------------------------------------------------------------------------------- #
+def runStripe(parentConnection, listenAddress, connectAddress, congestionControlAlgorithm, maxPacketSize,
+              useCompression):
+    listeningSocket = None
+    receiverThread = None
+    rudpConnection = RUDPSocket(congestionControlAlgorithm, maxPacketSize, useCompression=useCompression)
+    try:
+        if connectAddress is not None:
+            rudpConnection.connect(connectAddress)
+        else:
+            # listen on any free port of the host, the parent sends the ports of all the stripes to the other side
+            listeningSocket = rudpConnection
+            listeningSocket.listen((listenAddress[0], 0))
+            parentConnection.send_bytes(STRIPE_PORT.pack(listeningSocket.rudpSocket.getsockname()[1]))
+            rudpConnection = listeningSocket.accept()
+
+        # a thread moves the received blocks to the parent while this thread sends the blocks of the parent
+        receiverThread = threading.Thread(target=receiveStripeBlocks, args=(rudpConnection, parentConnection))
+        receiverThread.start()
+        while True:
+            block = parentConnection.recv_bytes()
+            if not block:
+                break
+            rudpConnection.send(block)
+    except (EOFError, OSError) as err:
+        log(f"runStripe(): the stripe stopped: {err}")
+    finally:
+        # close() delivers all the blocks still in flight before the RST is sent
+        rudpConnection.close()
+        if listeningSocket is not None and listeningSocket is not rudpConnection:
+            listeningSocket.close()
+        if receiverThread is not None:
+            receiverThread.join()
+    # the RUDP reader threads notice the closed udp socket only after SOCKET_MAX_TIMEOUT, the stripe is done so
+    # end the process now instead of waiting for them
+    os._exit(0)
+
+
+# ------------------------------------------------------------------------------- #
+# the receiving thread of a sub-flow process, cuts the data received on the RUDP  #
+# connection into blocks and writes each whole block to the parent pipe, an empty #
+# block tells the parent that the other side closed this stripe                   #
+# ------------------------------------------------------------------------------- #
+def receiveStripeBlocks(rudpConnection, parentConnection):
+    receivedData = bytearray()
+    try:
+        for dataChunk in rudpConnection:
+            receivedData += dataChunk
+            blockStart = 0
+            while len(receivedData) - blockStart >= STRIPE_BLOCK_HEADER.size:
+                blockLength, = STRIPE_BLOCK_HEADER.unpack_from(receivedData, blockStart)
+                blockEnd = blockStart + STRIPE_BLOCK_HEADER.size + blockLength
+                if len(receivedData) < blockEnd:
+                    break
+                parentConnection.send_bytes(receivedData, blockStart + STRIPE_BLOCK_HEADER.size, blockLength)
+                blockStart = blockEnd
+            del receivedData[:blockStart]
+        parentConnection.send_bytes(b'')
+    except OSError as err:
+        log(f"receiveStripeBlocks(): the parent pipe was closed: {err}")
+
+
+# ---------------------------------------------------------------------------------- #
+# a connection that stripes one logical transfer over N RUDP connections (sub-flows) #
+# each with its own udp port, process and congestion window, so a single big RETR    #
+# is not limited to one CPU core, one NIC queue or one congestion window. the        #
+# stripes are opened over a control RUDP connection to the address the caller gave, #
+# the data is cut into STRIPE_BLOCK_SIZE blocks sent round robin on the stripes and  #
+# the receiver reads the stripes in the same order, so the data comes out in order  #
+# ---------------------------------------------------------------------------------- #
+class StripedRUDPSocket:
+    # the ipv4 address and port of the other side (of its control connection)
+    receiverAddress = None
+
+    # the number of stripes the connecting side asks for (the listening side may open less)
+    numberOfStripes = DEFAULT_NUMBER_OF_STRIPES
+
+    # the options every stripe creates its RUDPSocket with
+    congestionControlAlgorithm = DEFAULT_CONGESTION_CONTROL
+    maxPacketSize = DEFAULT_MAX_PACKET_SIZE
+    useCompression = False
+
+    # the listening RUDP socket the control connections are accepted on (only for a listening striped socket)
+    listeningSocket = None
+
+    # the pipes to the stripe processes and the processes themselves, stripe k is stripeConnections[k]
+    stripeConnections = None
+    stripeProcesses = None
+
+    # the data of send() calls that doesn't fill a whole block yet, it is sent by flush() or close()
+    pendingData = None
+
+    # the number of the next block to send and the number of the next block to receive
+    sendBlockNumber = 0
+    receiveBlockNumber = 0
+
+    # the block receive() returns data from, and the offset of the data not returned yet
+    receivedBlock = None
+    receivedBlockOffset = 0
+
+    # seconds receive() waits for the next block before it returns empty data
+    receiveTimeout = SOCKET_MAX_TIMEOUT
+
+    # the number of bytes sent and received on all the stripes
+    bytesSent = 0
+    bytesReceived = 0
+
+    # flag indicating the connection is closed
+    isClosed = False
+
+
+    # ------------------------------------------------------------------------------ #
+    # init the socket with the number of stripes it asks for when it connects and the #
+    # options of the RUDP socket of every stripe (see RUDPSocket)                     #
+    # ------------------------------------------------------------------------------ #
+    def __init__(self, numberOfStripes=DEFAULT_NUMBER_OF_STRIPES, congestionControlAlgorithm=DEFAULT_CONGESTION_CONTROL,
+                 maxPacketSize=DEFAULT_MAX_PACKET_SIZE, useCompression=False):
+        if not 1 <= numberOfStripes <= MAX_NUMBER_OF_STRIPES:
+            raise ValueError(f"Number of stripes must be between 1 and {MAX_NUMBER_OF_STRIPES}, got: {numberOfStripes}")
+        self.numberOfStripes = numberOfStripes
+        self.congestionControlAlgorithm = congestionControlAlgorithm
+        self.maxPacketSize = maxPacketSize
+        self.useCompression = useCompression
+        self.stripeConnections = []
+        self.stripeProcesses = []
+        self.pendingData = bytearray()
+
+
+    # ---------------------------------------------------------------------------- #
+    # connects the control connection, asks the other side for numberOfStripes     #
+    # stripes and connects a stripe process to every udp port the other side sent #
+    # ---------------------------------------------------------------------------- #
+    def connect(self, address, firstMessage=None):
+        self.receiverAddress = address
+        controlSocket = RUDPSocket(self.congestionControlAlgorithm, self.maxPacketSize)
+        try:
+            controlSocket.connect(address, STRIPE_REQUEST.pack(self.numberOfStripes))
+            stripesHeader = receiveExactly(controlSocket, STRIPE_PORT.size)
+            if stripesHeader is None:
+                raise Exception('Failed to receive the stripe ports from the other side')
+            numberOfStripes, = STRIPE_PORT.unpack(stripesHeader)
+            stripePorts = receiveExactly(controlSocket, numberOfStripes * STRIPE_PORT.size)
+            if stripePorts is None:
+                raise Exception('Failed to receive the stripe ports from the other side')
+        finally:
+            controlSocket.close()
+
+        for stripePort, in STRIPE_PORT.iter_unpack(stripePorts):
+            self.startStripe(None, (address[0], stripePort))
+        self.numberOfStripes = len(self.stripeConnections)
+
+        if firstMessage is not None:
+            self.send(firstMessage)
+
+
+    # ------------------------------------------------------------------ #
+    # binds the listening RUDP socket the control connections arrive on #
+    # ------------------------------------------------------------------ #
+    def listen(self, address):
+        self.listeningSocket = RUDPSocket(self.congestionControlAlgorithm, self.maxPacketSize)
+        self.listeningSocket.listen(address)
+
+
+    # ------------------------------------------------------------------------------ #
+    # accepts a control connection, starts the stripe processes the other side asked #
+    # for (up to MAX_NUMBER_OF_STRIPES), each listens on its own free udp port, sends #
+    # the ports back and returns the striped connection                              #
+    # ------------------------------------------------------------------------------ #
+    def accept(self):
+        controlSocket = self.listeningSocket.accept()
+        stripedConnection = StripedRUDPSocket(self.numberOfStripes, self.congestionControlAlgorithm,
+                                              self.maxPacketSize, self.useCompression)
+        stripedConnection.receiverAddress = controlSocket.receiverAddress
+        try:
+            stripeRequest = receiveExactly(controlSocket, STRIPE_REQUEST.size)
+            if stripeRequest is None:
+                raise Exception('Failed to receive the stripe request from the other side')
+            numberOfStripes, = STRIPE_REQUEST.unpack(stripeRequest)
+            numberOfStripes = min(max(numberOfStripes, 1), MAX_NUMBER_OF_STRIPES)
+
+            # every stripe process reports the port it listens on before it waits for its connection
+            stripePorts = [STRIPE_PORT.pack(numberOfStripes)]
+            for stripeNumber in range(numberOfStripes):
+                stripeConnection = stripedConnection.startStripe(self.listeningSocket.rudpSocket.getsockname(), None)
+                stripePorts.append(stripeConnection.recv_bytes())
+            stripedConnection.numberOfStripes = numberOfStripes
+            controlSocket.send(b''.join(stripePorts))
+        except Exception:
+            stripedConnection.close()
+            raise
+        finally:
+            # close() waits until the ports were acknowledged
+            controlSocket.close()
+        return stripedConnection
+
+
+    # ---------------------------------------------------------------------------- #
+    # starts the process of the next stripe, it listens on the host of             #
+    # listenAddress or connects to connectAddress, returns the pipe to the process #
+    # ---------------------------------------------------------------------------- #
+    def startStripe(self, listenAddress, connectAddress):
+        stripeConnection, processConnection = STRIPE_PROCESS_CONTEXT.Pipe()
+        stripeProcess = STRIPE_PROCESS_CONTEXT.Process(
+            target=runStripe, args=(processConnection, listenAddress, connectAddress, self.congestionControlAlgorithm,
+                                    self.maxPacketSize, self.useCompression), daemon=True)
+        stripeProcess.start()
+        processConnection.close()
+        self.stripeConnections.append(stripeConnection)
+        self.stripeProcesses.append(stripeProcess)
+        return stripeConnection
+
+
+    # ------------------------------------------------------------------------------ #
+    # sends bytes data to the other side, the whole blocks are handed to the stripe  #
+    # processes right away and the rest waits for more data (or for flush/close)    #
+    # ------------------------------------------------------------------------------ #
+    def send(self, dataToSend):
+        dataToSend = memoryview(dataToSend).cast('B')
+        dataOffset = 0
+        if self.pendingData:
+            # complete the pending block first
+            dataOffset = min(STRIPE_BLOCK_SIZE - len(self.pendingData), len(dataToSend))
+            self.pendingData += dataToSend[:dataOffset]
+            if len(self.pendingData) < STRIPE_BLOCK_SIZE:
+                return
+            self.sendBlock(self.pendingData)
+            self.pendingData = bytearray()
+
+        # send the whole blocks straight from the caller data
+        while len(dataToSend) - dataOffset >= STRIPE_BLOCK_SIZE:
+            self.sendBlock(dataToSend[dataOffset:dataOffset + STRIPE_BLOCK_SIZE])
+            dataOffset = dataOffset + STRIPE_BLOCK_SIZE
+        self.pendingData += dataToSend[dataOffset:]
+
+
+    # ----------------------------------------------------------------- #
+    # hands the block to the process of its stripe (round robin order) #
+    # ----------------------------------------------------------------- #
+    def sendBlock(self, block):
+        stripeConnection = self.stripeConnections[self.sendBlockNumber % self.numberOfStripes]
+        stripeConnection.send_bytes(STRIPE_BLOCK_HEADER.pack(len(block)) + block)
+        self.sendBlockNumber = self.sendBlockNumber + 1
+        self.bytesSent = self.bytesSent + len(block)
+
+
+    # ------------------------------------------------------------------------- #
+    # sends the data that waits for a whole block, call it when the other side #
+    # should get the data without waiting for more of it                        #
+    # ------------------------------------------------------------------------- #
+    def flush(self):
+        if self.pendingData:
+            self.sendBlock(self.pendingData)
+            self.pendingData = bytearray()
+
+
+    # ---------------------------------------------------------------------------- #
+    # receives up to maxBufferSize bytes of in-order data, it takes the blocks     #
+    # from the stripes in the same round robin order they were sent, returns empty #
+    # data after a timeout and None once the other side closed the connection      #
+    # ---------------------------------------------------------------------------- #
+    def receive(self, maxBufferSize):
+        if self.receivedBlock is None:
+            if self.isClosed:
+                return None
+            stripeConnection = self.stripeConnections[self.receiveBlockNumber % self.numberOfStripes]
+            if not stripeConnection.poll(self.receiveTimeout):
+                return b''
+            try:
+                block = stripeConnection.recv_bytes()
+            except (EOFError, OSError):
+                block = b''
+            if not block:
+                # the stripe was closed, so there are no more blocks after this one
+                return None
+            self.receivedBlock = memoryview(block)
+            self.receivedBlockOffset = 0
+            self.receiveBlockNumber = self.receiveBlockNumber + 1
+            self.bytesReceived = self.bytesReceived + len(block)
+
+        receivedData = self.receivedBlock[self.receivedBlockOffset:self.receivedBlockOffset + maxBufferSize]
+        self.receivedBlockOffset = self.receivedBlockOffset + len(receivedData)
+        if self.receivedBlockOffset == len(self.receivedBlock):
+            self.receivedBlock = None
+        return bytes(receivedData)
+
+
+    # --------------------------------------------------------------------------- #
+    # receives in-order data directly into the received writable buffer, returns #
+    # the number of bytes written into it, 0 once the other side closed          #
+    # --------------------------------------------------------------------------- #
+    def receiveInto(self, buffer):
+        buffer = memoryview(buffer).cast('B')
+        receivedData = self.receive(len(buffer))
+        if not receivedData:
+            return 0
+        buffer[:len(receivedData)] = receivedData
+        return len(receivedData)
+
+
+    # ------------------------------------------------------------ #
+    # sets the socket max timeout for connect/send/receive actions #
+    # ------------------------------------------------------------ #
+    def setTimeout(self, socketMaxTimeout):
+        self.receiveTimeout = socketMaxTimeout
+        if self.listeningSocket is not None:
+            self.listeningSocket.setTimeout(socketMaxTimeout)
+
+
+    # -------------------------------------------------------------------- #
+    # returns a dictionary of the striped connection statistics, the RUDP #
+    # statistics of every stripe are kept inside its own process           #
+    # -------------------------------------------------------------------- #
+    def getStats(self):
+        return {
+            'numberOfStripes': self.numberOfStripes,
+            'bytesSent': self.bytesSent,
+            'bytesReceived': self.bytesReceived,
+            'blocksSent': self.sendBlockNumber,
+            'blocksReceived': self.receiveBlockNumber,
+        }
+
+
+    # --------------------------------------------------------------------------- #
+    # sends the pending data, tells every stripe process to close its connection  #
+    # (it delivers the blocks still in flight first) and waits for the processes #
+    # --------------------------------------------------------------------------- #
+    def close(self):
+        if self.isClosed:
+            return
+        self.isClosed = True
+        try:
+            self.flush()
+        except OSError as err:
+            log(f"close(): failed to send the pending data: {err}")
+        for stripeConnection in self.stripeConnections:
+            try:
+                stripeConnection.send_bytes(b'')
+            except OSError as err:
+                log(f"close(): the stripe process already stopped: {err}")
+        for stripeProcess in self.stripeProcesses:
+            stripeProcess.join(SOCKET_MAX_TIMEOUT)
+        for stripeConnection in self.stripeConnections:
+            stripeConnection.close()
+        if self.listeningSocket is not None:
+            self.listeningSocket.close()
+
+
+# ------------------------------------------------------------------------------ #
+# sends sizeInMegabytes over a striped connection on the local host for every    #
+# number of stripes and prints the throughput, so the scaling with the number of #
+# stripes can be measured: python rudp_striped.py [sizeInMegabytes] [stripes...] #
+# ------------------------------------------------------------------------------ #
+def runBenchmark(sizeInMegabytes, stripeCounts):
+    benchmarkData = bytes(range(256)) * (sizeInMegabytes * 1024 * 4)
+    for numberOfStripes in stripeCounts:
+        listeningSocket = StripedRUDPSocket(numberOfStripes)
+        listeningSocket.listen(('127.0.0.1', 0))
+        listeningAddress = listeningSocket.listeningSocket.rudpSocket.getsockname()
+
+        # the receiving side runs in a thread, its stripes run in their own processes anyway
+        receivedResult = []
+        def receiveAll():
+            receivingSocket = listeningSocket.accept()
+            receivedLength = 0
+            isInOrder = True
+            while True:
+                receivedData = receivingSocket.receive(STRIPE_BLOCK_SIZE)
+                if receivedData is None:
+                    break
+                isInOrder = isInOrder and receivedData == benchmarkData[receivedLength:receivedLength + len(receivedData)]
+                receivedLength = receivedLength + len(receivedData)
+            receivingSocket.close()
+            receivedResult.append((receivedLength, isInOrder))
+        receiverThread = threading.Thread(target=receiveAll)
+        receiverThread.start()
+
+        sendingSocket = StripedRUDPSocket(numberOfStripes)
+        sendingSocket.connect(listeningAddress)
+        startTime = time.time()
+        sendingSocket.send(benchmarkData)
+        sendingSocket.close()
+        receiverThread.join()
+        elapsedTime = time.time() - startTime
+        listeningSocket.close()
+
+        receivedLength, isInOrder = receivedResult[0]
+        print(f"{numberOfStripes} stripes: {receivedLength / 1024 / 1024:.1f} MB in {elapsedTime:.2f}s, "
+              f"{receivedLength / 1024 / 1024 / elapsedTime:.2f} MB/s, data {'OK' if isInOrder else 'CORRUPTED'}")
+
+
+if __name__ == "__main__":
+    runBenchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 20, [int(arg) for arg in sys.argv[2:]] or [1, 2, 4])
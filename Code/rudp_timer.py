@@ -0,0 +1,82 @@
+import heapq
+import itertools
+import threading
+import time
+
+
+# maximum seconds the scheduler thread sleeps when there are no timers at all
+IDLE_SLEEP = 60
+
+
+# ---------------------------------------------------------------------------------- #
+# a single timer thread that serves the retransmission timers of all the RUDP sockets #
+# in the process. each packet waiting for acknowledge has its own timeout time kept  #
+# in a heap, when it expires the scheduler asks the socket to retransmit that packet #
+# (only that packet), so the number of threads doesn't grow with the connections     #
+# ---------------------------------------------------------------------------------- #
+class RetransmissionScheduler:
+    # heap of the timers (timeoutTime, entryNumber, rudpSocket, sequenceNumber) ordered by timeoutTime
+    timers = None
+
+    # condition used to protect the timers heap and to wake the scheduler thread when an earlier timer is added
+    timersCondition = None
+
+    # increasing number used to order timers with the same timeoutTime (sockets can't be compared)
+    entryCounter = None
+
+    # the thread that fires the timers (started with the first timer)
+    schedulerThread = None
+
+
+    def __init__(self):
+        self.timers = []
+        self.timersCondition = threading.Condition()
+        self.entryCounter = itertools.count()
+
+
+    # ------------------------------------------------------------------------------ #
+    # adds a timer that expires at timeoutTime for the packet with the received      #
+    # sequence number, a timer is never removed, when the packet was acknowledged   #
+    # before the timer expires the socket simply ignores it                          #
+    # ------------------------------------------------------------------------------ #
+    def schedule(self, rudpSocket, sequenceNumber, timeoutTime):
+        with self.timersCondition:
+            timer = (timeoutTime, next(self.entryCounter), rudpSocket, sequenceNumber)
+            heapq.heappush(self.timers, timer)
+            # wake the scheduler thread only if this timer expires before the one it is sleeping on
+            if self.timers[0] is timer:
+                self.timersCondition.notify()
+            if self.schedulerThread is None:
+                self.schedulerThread = threading.Thread(target=self.runTimers, name="RUDP-retransmission", daemon=True)
+                self.schedulerThread.start()
+
+
+    # ----------------------------------------------------------------------------- #
+    # scheduler thread main loop, sleep until the earliest timer expires, then let  #
+    # the sockets retransmit the expired packets and schedule their next timeout    #
+    # ----------------------------------------------------------------------------- #
+    def runTimers(self):
+        while True:
+            with self.timersCondition:
+                currentTime = time.time()
+                while not self.timers or self.timers[0][0] > currentTime:
+                    sleepTime = self.timers[0][0] - currentTime if self.timers else IDLE_SLEEP
+                    self.timersCondition.wait(sleepTime)
+                    currentTime = time.time()
+                expiredTimers = []
+                while self.timers and self.timers[0][0] <= currentTime:
+                    expiredTimers.append(heapq.heappop(self.timers))
+
+            # retransmit outside the lock, so sockets can add timers while we send
+            for timeoutTime, entryNumber, rudpSocket, sequenceNumber in expiredTimers:
+                try:
+                    nextTimeoutTime = rudpSocket.handleRetransmissionTimeout(sequenceNumber)
+                except Exception:
+                    # the socket was closed while the packet was waiting, drop the timer
+                    nextTimeoutTime = None
+                if nextTimeoutTime is not None:
+                    self.schedule(rudpSocket, sequenceNumber, nextTimeoutTime)
+
+
+# the retransmission scheduler shared by all the RUDP sockets in this process
+retransmissionScheduler = RetransmissionScheduler()
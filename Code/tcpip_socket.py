@@ -17,8 +17,9 @@ class TCPIPSocket:
 
     # ----------------------------------------------------- #
     # connects to a receiver using the receiver host & port #
+    # and sends the optional firstMessage right away        #
     # ----------------------------------------------------- #
-    def connect(self, address):
+    def connect(self, address, firstMessage=None):
         # save the receiver address
         self.receiverAddress = address
         # open a TCPIP socket and connect to the receiver host and port
@@ -26,6 +27,8 @@ class TCPIPSocket:
         self.setTimeout(SOCKET_MAX_TIMEOUT)
         # connect to the client IP and port using the created socket
         self.tcpipSocket.connect(address)
+        if firstMessage is not None:
+            self.send(firstMessage)
 
 
     # ----------------- #
@@ -40,7 +43,17 @@ class TCPIPSocket:
     # sends bytes data to the receiver #
     # -------------------------------- #
     def send(self, dataToSend):
-        self.tcpipSocket.send(dataToSend)
+        # sendall, a single send() may send only a part of a big buffer
+        self.tcpipSocket.sendall(dataToSend)
+
+
+    # ------------------------------------------------------------------------ #
+    # sends the file (opened in binary mode) from offset to its end, the kernel #
+    # copies the file to the socket (sendfile) so the data never passes through #
+    # python, returns the number of bytes sent                                  #
+    # ------------------------------------------------------------------------ #
+    def sendFile(self, file, offset=0):
+        return self.tcpipSocket.sendfile(file, offset)
 
 
     # ------------------------------------------------------------ #
@@ -58,6 +71,14 @@ class TCPIPSocket:
         return dataReceived
 
 
+    # ------------------------------------------------------------------------ #
+    # receives bytes data directly into the received writable buffer, returns  #
+    # the number of bytes written into it, 0 once the other side closed        #
+    # ------------------------------------------------------------------------ #
+    def receiveInto(self, buffer):
+        return self.tcpipSocket.recv_into(buffer)
+
+
     # --------------------------------------------------------------------------- #
     # binds this socket to ip & port and stars to listen for incoming connections #
     # --------------------------------------------------------------------------- #
@@ -84,3 +105,59 @@ class TCPIPSocket:
         clientTCPIPSocket.receiverAddress = clientAddress
         # return the new TCPIPSocket and clientAddress
         return clientTCPIPSocket
+
+
+# ----------------------------------------------------------------------------- #
+# a TCPIP connection that lives in an asyncio event loop (a StreamReader and     #
+# StreamWriter pair), it has the send()/receive()/close() of AsyncRUDPConnection #
+# so the asyncio FTP server can serve TCPIP and RUDP command connections alike   #
+# ----------------------------------------------------------------------------- #
+class AsyncTCPIPSocket:
+    # the ipv4 address and port of the other side
+    receiverAddress = None
+
+    # the stream the received data is read from
+    streamReader = None
+
+    # the stream the sent data is written to
+    streamWriter = None
+
+
+    def __init__(self, streamReader, streamWriter):
+        self.streamReader = streamReader
+        self.streamWriter = streamWriter
+        self.receiverAddress = streamWriter.get_extra_info('peername')
+
+
+    # ------------------------------------------------------------ #
+    # sends bytes data to the other side, waits while the kernel   #
+    # send buffer is full so a slow client can't fill our memory   #
+    # ------------------------------------------------------------ #
+    async def send(self, dataToSend):
+        self.streamWriter.write(dataToSend)
+        await self.streamWriter.drain()
+
+
+    # ------------------------------------------------------------------ #
+    # has the flush() of AsyncRUDPConnection, a TCPIP connection only    #
+    # waits for the stream buffer to drain (close() sends what is left   #
+    # in it before the connection is closed anyway)                      #
+    # ------------------------------------------------------------------ #
+    async def flush(self):
+        await self.streamWriter.drain()
+
+
+    # ------------------------------------------------------------------------ #
+    # receives up to maxBufferLength bytes, returns None once the other side  #
+    # closed the connection                                                    #
+    # ------------------------------------------------------------------------ #
+    async def receive(self, maxBufferLength):
+        dataReceived = await self.streamReader.read(maxBufferLength)
+        return dataReceived or None
+
+
+    # ----------------- #
+    # closes the socket #
+    # ----------------- #
+    def close(self):
+        self.streamWriter.close()
@@ -8,6 +8,12 @@ import random
 import threading
 
 
+# the newline of the text files on this host, ascii mode transfers convert it to the network newline (CRLF) and back
+LOCAL_NEWLINE = os.linesep.encode()
+
+# the newline text lines are sent with in ascii mode transfers (RFC 959)
+NETWORK_NEWLINE = b'\r\n'
+
 portNumberLock = threading.Lock()
 portsDictionary = {30080: 'free', 30081: 'free', 30082: 'free', 30083: 'free', 30084: 'free'}
 
@@ -62,9 +68,7 @@ def returnPortToPool(portNumber):
 
 
 # this function returns the file mode as a string example: drwxr--r--
-def getFileMode(filepath):
-    fileStat = os.stat(filepath)
-
+def getFileMode(fileStat):
     # init the fileModeString with empty string
     fileModeString: str = ''
 
@@ -136,40 +140,124 @@ def getFileMode(filepath):
 
 # this function returns the number of hard links to the file/folder,
 # a hard link is a directory has a link to that file
-def getFilesNumber(filepath):
-    fileStat = os.stat(filepath)
+def getFilesNumber(fileStat):
     return str(fileStat.st_nlink)
 
 
 # this function returns the file/folder owner user id
-def getUser(filepath):
-    fileStat = os.stat(filepath)
+def getUser(fileStat):
     return str(fileStat.st_uid)  # pathToFile.owner()
 
 
 # this function returns the file/folder owner group id
-def getGroup(filepath):
-    fileStat = os.stat(filepath)
+def getGroup(fileStat):
     return str(fileStat.st_gid)  # pathToFile.group()
 
 
 # this function returns the file size
-def getSize(filepath):
-    fileStat = os.stat(filepath)
+def getSize(fileStat):
     return str(fileStat.st_size)
 
 
 # this function returns the last time this file/folder changed
-def getLastTime(filepath):
-    fileStat = os.stat(filepath)
+def getLastTime(fileStat):
     return time.strftime('%b %d %H:%M', time.gmtime(fileStat.st_mtime))
 
 
-def fileProperty(filepath):
-    return getFileMode(filepath) + '  ' + \
-           getFilesNumber(filepath).rjust(4) + '  ' + \
-           getUser(filepath).rjust(4) + '  ' + \
-           getGroup(filepath).rjust(4) + '  ' + \
-           getSize(filepath).rjust(12) + '  ' + \
-           getLastTime(filepath).rjust(12) + '  ' + \
+# ---------------------------------------------------------------------------- #
+# this function returns the LIST line of a file/folder, all the properties come #
+# from a single stat, the caller can pass the stat it already has (for example  #
+# the cached stat of an os.scandir entry) so the file isn't stat'ed again       #
+# ---------------------------------------------------------------------------- #
+def fileProperty(filepath, fileStat=None):
+    if fileStat is None:
+        fileStat = os.stat(filepath)
+    return getFileMode(fileStat) + '  ' + \
+           getFilesNumber(fileStat).rjust(4) + '  ' + \
+           getUser(fileStat).rjust(4) + '  ' + \
+           getGroup(fileStat).rjust(4) + '  ' + \
+           getSize(fileStat).rjust(12) + '  ' + \
+           getLastTime(fileStat).rjust(12) + '  ' + \
            os.path.basename(filepath)
+
+
+# ------------------------------------------------------------------------------ #
+# this function returns the LIST lines of all the files/folders in a directory, #
+# it walks the directory with os.scandir and stats every entry once, the lines  #
+# are yielded in blocks of about blockSize bytes (CRLF ended, utf-8 encoded) so #
+# a directory of any size is sent in a few big sends and never built in memory  #
+# ------------------------------------------------------------------------------ #
+def directoryProperties(dirpath, blockSize):
+    propertyLines = []
+    propertyLinesLength = 0
+    with os.scandir(dirpath) as directoryEntries:
+        for directoryEntry in directoryEntries:
+            try:
+                entryStat = directoryEntry.stat()
+            except OSError:
+                # a broken symbolic link, list the link itself
+                entryStat = directoryEntry.stat(follow_symlinks=False)
+            propertyLine = fileProperty(directoryEntry.name, entryStat)
+            propertyLines.append(propertyLine)
+            propertyLinesLength = propertyLinesLength + len(propertyLine) + 2
+            if propertyLinesLength >= blockSize:
+                yield ('\r\n'.join(propertyLines) + '\r\n').encode('utf-8')
+                propertyLines = []
+                propertyLinesLength = 0
+    if propertyLines:
+        yield ('\r\n'.join(propertyLines) + '\r\n').encode('utf-8')
+
+
+# ------------------------------------------------------------------------------- #
+# converts the data of an ascii mode transfer between the local newlines (LF) and #
+# the network newlines (CRLF) a whole block at a time (bytes.replace runs in C),  #
+# the CR at the end of a block is remembered, so a CR LF pair that is split      #
+# between two blocks is converted exactly like a pair inside a block             #
+# ------------------------------------------------------------------------------- #
+class NewlineTranslator:
+    # True converts local newlines to network newlines (download), False converts network newlines to local (upload)
+    isToNetwork = True
+
+    # a flag that indicates if the last block ended with a CR
+    isLastByteCR = False
+
+
+    def __init__(self, isToNetwork):
+        self.isToNetwork = isToNetwork
+
+
+    # ------------------------------------------------------------------------- #
+    # converts the newlines of the next block of the transfer, returns bytes   #
+    # ------------------------------------------------------------------------- #
+    def translate(self, block):
+        block = bytes(block)
+        if LOCAL_NEWLINE == NETWORK_NEWLINE or not block:
+            return block
+
+        if self.isToNetwork:
+            # a LF that completes a CR LF pair of the previous block is already a network newline
+            isPairCompletion = self.isLastByteCR and block[:1] == b'\n'
+            self.isLastByteCR = block[-1:] == b'\r'
+            # every LF that doesn't follow a CR becomes CR LF (the CR LF pairs are kept as they are)
+            translatedBlock = block.replace(b'\r\n', b'\n').replace(b'\n', b'\r\n')
+            return translatedBlock[1:] if isPairCompletion else translatedBlock
+
+        # the CR the previous block ended with belongs before this block, a CR at the end of this block waits for
+        # the next block to see if it starts a CR LF pair
+        if self.isLastByteCR:
+            block = b'\r' + block
+        self.isLastByteCR = block[-1:] == b'\r'
+        if self.isLastByteCR:
+            block = block[:-1]
+        return block.replace(b'\r\n', b'\n')
+
+
+    # ---------------------------------------------------------------------- #
+    # returns the data that is still held back at the end of the transfer  #
+    # (a CR that was the last byte of an upload)                           #
+    # ---------------------------------------------------------------------- #
+    def finish(self):
+        if not self.isToNetwork and self.isLastByteCR:
+            self.isLastByteCR = False
+            return b'\r'
+        return b''